@@ -5,6 +5,8 @@ class Block:
     """
     Defines the most atomic unit in a cache, the block
     """
+    # Caches hold one Block per line, without a __dict__ each takes less than half the memory
+    __slots__ = ('_base_address', '_dirty', '_policy', '_policy_data', '_presence', '_lower')
 
     def __init__(self, base_address, dirty: bool, policy: ReplacementPolicy):
         """
@@ -17,6 +19,10 @@ class Block:
         self._dirty = dirty
         self._policy = policy
         self._policy_data = policy.default()
+        # Inclusive hierarchies: the levels above holding a copy of this block, as bits of cache.inclusion, and the
+        # copy of this block in the level below
+        self._presence = 0
+        self._lower = None
 
     def __str__(self):
         return "[{}]{},{}:{}".format(hex(self._base_address), self._dirty, self._policy.name(), self._policy_data)
@@ -49,6 +55,18 @@ class Block:
         self.touch()
         self._dirty = True
 
+    def replay(self, clock, count, dirty=False):
+        """
+        Perform simulated accesses that were held back, see policies.replacement_policies.BaseReplacementPolicy.replay
+        :param clock: The step counter at the last of the accesses
+        :param count: The number of accesses
+        :param dirty: Whether any of them was a write
+        :return: nothing
+        """
+        self._policy.replay(self, clock, count)
+        if dirty:
+            self._dirty = True
+
     def is_dirty(self):
         """
         Returns if this block is written to, or dirty
@@ -69,3 +87,41 @@ class Block:
         :return: metadata, for policy
         """
         return self._policy_data
+
+    def presence(self):
+        """
+        Returns the presence bits of the levels above holding a copy of this block, see cache.inclusion
+        :return: int, the presence bits
+        """
+        return self._presence
+
+    def mark_present(self, bits):
+        """
+        Record that the levels of the given presence bits hold a copy of this block
+        :param bits: int, presence bits
+        :return: nothing
+        """
+        self._presence |= bits
+
+    def clear_present(self, bits):
+        """
+        Record that the levels of the given presence bits no longer hold a copy of this block
+        :param bits: int, presence bits
+        :return: nothing
+        """
+        self._presence &= ~bits
+
+    def lower(self):
+        """
+        Returns the copy of this block in the level below, kept by inclusive hierarchies
+        :return: Block, None when not linked
+        """
+        return self._lower
+
+    def link_lower(self, block):
+        """
+        Link this block to its copy in the level below
+        :param block: The copy in the level below, None to unlink
+        :return: nothing
+        """
+        self._lower = block
@@ -1,4 +1,5 @@
 import math
+from array import array
 from policies.replacement_policies import BaseReplacementPolicy as ReplacementPolicy
 from cache.block import Block
 from system.system import AddressSpace
@@ -43,6 +44,11 @@ class Cache:
         for cache_set in range(0, self._sets):
             self._cache[cache_set] = [None for _ in range(associativity)]
 
+        # Per set demand accesses, misses and evictions, off until track_sets() is called
+        self._set_accesses = None
+        self._set_misses = None
+        self._set_evictions = None
+
     def get(self, address):
         """
         Access the cache and attempt to get a block from an address
@@ -57,6 +63,107 @@ class Cache:
         else:
             return None
 
+    def lookup(self, address):
+        """
+        Access the cache on behalf of a demand access, as opposed to a probe, and attempt to get a block from an
+        address. Counted in the per set stats when they are tracked
+        :param address: The address to be fetched
+        :return hit: None if miss, Block if hit
+        """
+        block = self.get(address)
+        if self._set_accesses is not None:
+            cache_set = (self._sets - 1) & (address >> self._offset_bits)
+            self._set_accesses[cache_set] += 1
+            if block is None:
+                self._set_misses[cache_set] += 1
+        return block
+
+    def find(self, base_address, cache_set):
+        """
+        Attempt to get a block from an address already decoded, see cache.decoder.AddressDecoder, without redoing the
+        bit math of get()
+        :param base_address: The base address of the block
+        :param cache_set: The index of the set holding the block in this cache
+        :return hit: None if miss, Block if hit
+        """
+        blocks = self._cache[cache_set]
+        if base_address in blocks:
+            return blocks[blocks.index(base_address)]
+        return None
+
+    def lookup_at(self, base_address, cache_set):
+        """
+        Demand access counterpart of find(), counted in the per set stats when they are tracked
+        :param base_address: The base address of the block
+        :param cache_set: The index of the set holding the block in this cache
+        :return hit: None if miss, Block if hit
+        """
+        blocks = self._cache[cache_set]
+        block = blocks[blocks.index(base_address)] if base_address in blocks else None
+        if self._set_accesses is not None:
+            self._set_accesses[cache_set] += 1
+            if block is None:
+                self._set_misses[cache_set] += 1
+        return block
+
+    def record_hits(self, address, count):
+        """
+        Count demand hits that were served without a lookup in the per set stats, when they are tracked
+        :param address: The address that hit
+        :param count: The number of hits
+        :return: None
+        """
+        if self._set_accesses is not None:
+            self._set_accesses[(self._sets - 1) & (address >> self._offset_bits)] += count
+
+    def track_sets(self):
+        """
+        Start counting demand accesses, misses and evictions per set, in flat integer arrays indexed by set
+        :return: None
+        """
+        self._set_accesses = array('Q', bytes(8 * self._sets))
+        self._set_misses = array('Q', bytes(8 * self._sets))
+        self._set_evictions = array('Q', bytes(8 * self._sets))
+
+    def set_stats(self):
+        """
+        Return the per set counters
+        :return: tuple (accesses, misses, evictions) of arrays indexed by set, or None if sets are not tracked
+        """
+        if self._set_accesses is None:
+            return None
+        return self._set_accesses, self._set_misses, self._set_evictions
+
+    def suspend_sets(self):
+        """
+        Stop counting per set, e.g. while warming the cache, keeping the counters so far aside
+        :return: The counters as returned by set_stats(), to hand back to resume_sets()
+        """
+        counters = self.set_stats()
+        self._set_accesses = self._set_misses = self._set_evictions = None
+        return counters
+
+    def resume_sets(self, counters):
+        """
+        Count per set again into the counters suspend_sets() put aside
+        :param counters: The counters returned by suspend_sets(), None if sets were not tracked
+        :return: None
+        """
+        if counters is not None:
+            self._set_accesses, self._set_misses, self._set_evictions = counters
+
+    def save_set_stats(self, filename):
+        """
+        Save the per set counters as a heatmap, one 'set,accesses,misses,evictions' CSV row per set
+        :param filename: The file to save to
+        :return: None
+        """
+        lines = ["set,accesses,misses,evictions\n"]
+        for cache_set in range(self._sets):
+            lines.append("{},{},{},{}\n".format(cache_set, self._set_accesses[cache_set], self._set_misses[cache_set], self._set_evictions[cache_set]))
+        with open(filename, 'w') as out:
+            out.writelines(lines)
+
     def remove(self, block: Block):
         """
         Remove the block from the cache, if it is present
@@ -67,47 +174,113 @@ class Cache:
         if block in self._cache[cache_set]:
             # Block is present in set, remove it
             placement = self._cache[cache_set].index(block)
+            self._policy.removed(self._cache[cache_set][placement])
             self._cache[cache_set][placement] = None
 
-    def remove_base(self, base_address):
+    def remove_base(self, base_address, cache_set=None):
         """
         Remove the block that corresponds to base_address from the cache, if it is present
         :param base_address: The base_address of the block to be removed
+        :param cache_set: The index of the block's set when already decoded
         :return: None
         """
-        cache_set = (self._sets - 1) & (base_address >> self._offset_bits)
+        if cache_set is None:
+            cache_set = (self._sets - 1) & (base_address >> self._offset_bits)
         if base_address in self._cache[cache_set]:
             # Block is present in set, remove it
             placement = self._cache[cache_set].index(base_address)
+            self._policy.removed(self._cache[cache_set][placement])
             self._cache[cache_set][placement] = None
         else:
             print('shouldnt happen')
 
-    def put(self, block: Block):
+    def put(self, block: Block, cache_set=None):
         """
         Put the following block into the cache. If not space is present, use the policy to evict and return the
         eviction. If space is available or the block is present, place and return
         :param block: The block to be placed
+        :param cache_set: The index of the block's set when already decoded
         :return replacement:
         """
-        cache_set = (self._sets - 1) & (block.base_address() >> self._offset_bits)
+        if cache_set is None:
+            cache_set = (self._sets - 1) & (block.base_address() >> self._offset_bits)
         if block in self._cache[cache_set]:
             # Block is existing in cache, assuming rewrite
             replacement = self._cache[cache_set].index(block)
+            self._policy.removed(self._cache[cache_set][replacement])
             self._cache[cache_set][replacement] = block
+            self._policy.placed(self._cache[cache_set], replacement, block)
             return None
         elif None in self._cache[cache_set]:
             # Space available in cache for new block, place it
             placement = self._cache[cache_set].index(None)
             self._cache[cache_set][placement] = block
+            self._policy.placed(self._cache[cache_set], placement, block)
             return None
         else:
             # Block is not existing in cache and space is not available, evict
             evicted_block = self._policy.evict(self._cache[cache_set])
             evicted_block_index = self._cache[cache_set].index(evicted_block)
+            self._policy.removed(evicted_block)
             self._cache[cache_set][evicted_block_index] = block
+            self._policy.placed(self._cache[cache_set], evicted_block_index, block)
+            if self._set_evictions is not None:
+                self._set_evictions[cache_set] += 1
             return evicted_block
 
+    def fill(self, entries):
+        """
+        Place many blocks at once straight into free ways, without lookups or evictions, e.g. to start from a known
+        resident set. Blocks already resident are placed anew in their way, other resident blocks are never displaced;
+        where a set has fewer free ways than new blocks, the newest blocks are placed and the oldest left out. Blocks
+        are placed oldest first into the lowest free ways, which recency ties favor for eviction
+        :param entries: iterable of (base address, dirty), oldest first
+        :return: set of the base addresses resident afterwards among the entries
+        """
+        by_set = dict()
+        for base_address, dirty in entries:
+            blocks = by_set.setdefault((self._sets - 1) & (base_address >> self._offset_bits), dict())
+            # A repeated block counts as its newest occurrence
+            blocks.pop(base_address, None)
+            blocks[base_address] = dirty
+        placed = set()
+        for cache_set, blocks in by_set.items():
+            resident = self._cache[cache_set]
+            fresh = []
+            for base_address, dirty in blocks.items():
+                if base_address in resident:
+                    way = resident.index(base_address)
+                    self._policy.removed(resident[way])
+                    block = Block(base_address, dirty, self._policy)
+                    resident[way] = block
+                    self._policy.placed(resident, way, block)
+                    placed.add(base_address)
+                else:
+                    fresh.append((base_address, dirty))
+            free = [way for way, block in enumerate(resident) if block is None]
+            if len(fresh) > len(free):
+                fresh = fresh[len(fresh) - len(free):]
+            for way, (base_address, dirty) in zip(free, fresh):
+                block = Block(base_address, dirty, self._policy)
+                resident[way] = block
+                self._policy.placed(resident, way, block)
+                placed.add(base_address)
+        return placed
+
+    def resident(self):
+        """
+        List the resident blocks, set by set. Within a set the blocks are ordered by their policy data when it is a
+        plain number, as LRU's time of last touch, so fill() restores the eviction order; else by way
+        :return: list of Block
+        """
+        blocks = []
+        for resident in self._cache.values():
+            in_set = [block for block in resident if block is not None]
+            if all(isinstance(block.get_policy_data(), int) for block in in_set):
+                in_set.sort(key=lambda block: block.get_policy_data())
+            blocks += in_set
+        return blocks
+
     def get_base_address_mask(self):
         """
         Return the base address mask
@@ -115,6 +288,20 @@ class Cache:
         """
         return self._base_address_mask
 
+    def get_offset_bits(self):
+        """
+        Return the number of block offset bits, the shift from an address to its block index
+        :return: offset bits
+        """
+        return self._offset_bits
+
+    def get_set_mask(self):
+        """
+        Return the mask from a block index to its set index
+        :return: set mask
+        """
+        return self._sets - 1
+
     def get_policy(self):
         """
         Return the replacement policy for this cache
@@ -128,3 +315,24 @@ class Cache:
         :return: block size
         """
         return self._blocksize
+
+    def get_address_space(self):
+        """
+        Return the largest address of the address space this cache runs on
+        :return: address space
+        """
+        return self._addressspace
+
+    def get_size(self):
+        """
+        Return the total size of this cache
+        :return: size in bytes
+        """
+        return self._size
+
+    def get_associativity(self):
+        """
+        Return the number of ways in a set
+        :return: associativity
+        """
+        return self._associativity
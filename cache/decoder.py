@@ -0,0 +1,68 @@
+class AddressDecoder:
+    """
+    Decodes an address once per access into its base address and the index of its set in every level of a hierarchy,
+    from shift and mask tables computed up front, so the levels can be accessed without repeating any bit math. All
+    levels must share the block size and address space
+    """
+
+    def __init__(self, levels: list):
+        """
+        Initializer for the address decoder
+        :param levels: The caches, in the order their set indices are returned
+        """
+        if len({(level.get_block_size(), level.get_address_space()) for level in levels}) != 1:
+            raise AttributeError("Field 'levels' must hold caches of one block size and address space")
+        self._base_mask = levels[0].get_base_address_mask()
+        self._offset_bits = levels[0].get_offset_bits()
+        self._set_masks = tuple(level.get_set_mask() for level in levels)
+        if len(self._set_masks) == 3:
+            # The three level hierarchies decode on every access, unrolled it takes a third of the time
+            self.decode = self._decode_three
+
+        # Batches are decoded with numpy when it is installed and the addresses fit in its 64 bit integers
+        self._numpy = None
+        if levels[0].get_address_space() <= 0xffffffffffffffff:
+            try:
+                import numpy
+                self._numpy = numpy
+            except ImportError:
+                pass
+
+    def decode(self, address):
+        """
+        Decode an address
+        :param address: The address accessed
+        :return: tuple (base address, set index in each level)
+        """
+        base = address & self._base_mask
+        index = base >> self._offset_bits
+        return (base,) + tuple([index & mask for mask in self._set_masks])
+
+    def _decode_three(self, address):
+        base = address & self._base_mask
+        index = base >> self._offset_bits
+        first, second, third = self._set_masks
+        return base, index & first, index & second, index & third
+
+    def vectorized(self):
+        """
+        Whether decode_batch runs vectorized. When it does not, decoding a batch up front costs the same as decoding
+        every access on its own
+        :return: bool
+        """
+        return self._numpy is not None
+
+    def decode_batch(self, addresses):
+        """
+        Decode a batch of addresses at once, vectorized with numpy when possible, else one by one
+        :param addresses: list of addresses
+        :return: list of tuple (base address, set index in each level), one per address
+        """
+        numpy = self._numpy
+        if numpy is None:
+            decode = self.decode
+            return [decode(address) for address in addresses]
+        bases = numpy.array(addresses, dtype=numpy.uint64) & numpy.uint64(self._base_mask)
+        indices = bases >> numpy.uint64(self._offset_bits)
+        columns = [bases.tolist()] + [(indices & numpy.uint64(mask)).tolist() for mask in self._set_masks]
+        return list(zip(*columns))
@@ -0,0 +1,133 @@
+# Presence bits a UL2 or UL3 line keeps, snoop filter style, for the levels above it holding a copy of its block
+IN_DL1 = 1
+IN_IL1 = 2
+IN_UL2 = 4
+
+
+def link_copies(outer, middle, inner: dict, bases):
+    """
+    Rebuild the presence bits and lower copy links of blocks placed without going through a hierarchy's accesses,
+    e.g. by a preload or populate. Each copy is linked to the copy of the level below it, UL2 to UL3 and L1 to UL2, and
+    each UL2 and UL3 copy gets the presence bits of the levels above holding the block
+    :param outer: The last level cache, UL3
+    :param middle: The middle level cache, UL2
+    :param inner: dict, presence bit to first level cache, as {IN_DL1: DL1, IN_IL1: IL1}
+    :param bases: iterable of the base addresses to link
+    :return: None
+    """
+    for base in bases:
+        outer_copy = outer.get(base)
+        middle_copy = middle.get(base)
+        present = 0
+        if middle_copy is not None:
+            middle_copy.link_lower(outer_copy)
+            middle_copy.clear_present(middle_copy.presence())
+            present |= IN_UL2
+        for bit, cache in inner.items():
+            inner_copy = cache.get(base)
+            if inner_copy is not None:
+                inner_copy.link_lower(middle_copy)
+                present |= bit
+                if middle_copy is not None:
+                    middle_copy.mark_present(bit)
+        if outer_copy is not None:
+            outer_copy.clear_present(outer_copy.presence())
+            outer_copy.mark_present(present)
+
+
+def resident_bases(caches):
+    """
+    List the base addresses resident in any of the caches
+    :param caches: iterable of Cache
+    :return: set of base addresses
+    """
+    return {block.base_address() for cache in caches for block in cache.resident()}
+
+
+# How L1 hits reach the copies of their block in UL2 and UL3, see DeferredTouches
+RECENCY_MODES = ('exact', 'approximate')
+
+
+class DeferredTouches:
+    """
+    Holds back the touches, and dirty marks, L1 hits make to the copies of their block in UL2 and UL3, keeping per
+    block only the number of touches, the step counter of the last one and whether any was a write. They are replayed
+    before the copies are read or replaced, when the block misses in an L1 or leaves an L1. In exact mode every held
+    back touch is also replayed before UL2 or UL3 picks a victim, so the results are the same as touching on every hit
+    for policies whose victims do not depend on the order of the touches. In approximate mode they are not: the
+    levels below only learn of the hits when the block leaves L1, which is faster and models hierarchies whose L1 hits
+    never reach the last level cache
+    """
+
+    def __init__(self, exact=True):
+        """
+        Initializer for the deferred touches
+        :param exact: Whether touches are replayed before every victim pick below L1
+        """
+        self.exact = exact
+        # Base address to [UL2 copy, step counter of the last touch, touches, dirty]
+        self._pending = dict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def defer(self, base, middle, clock, count, dirty):
+        """
+        Hold back the touches of the copies below L1 of a block hit in L1
+        :param base: The base address of the block
+        :param middle: The block's copy in UL2, linked to its copy in UL3
+        :param clock: The step counter at the last of the touches
+        :param count: The number of touches
+        :param dirty: Whether any of the hits was a write that marks the copies below dirty
+        :return: None
+        """
+        entry = self._pending.get(base)
+        if entry is None:
+            self._pending[base] = [middle, clock, count, dirty]
+        else:
+            entry[1] = clock
+            entry[2] += count
+            entry[3] = entry[3] or dirty
+
+    @staticmethod
+    def _replay(entry):
+        middle, clock, count, dirty = entry
+        middle.replay(clock, count, dirty)
+        outer = middle.lower()
+        if outer is not None:
+            outer.replay(clock, count, dirty)
+
+    def settle(self, base):
+        """
+        Replay the held back touches of one block
+        :param base: The base address of the block
+        :return: None
+        """
+        entry = self._pending.pop(base, None)
+        if entry is not None:
+            self._replay(entry)
+
+    def discard(self, base):
+        """
+        Drop the held back touches of a block whose copies below L1 are gone
+        :param base: The base address of the block
+        :return: None
+        """
+        self._pending.pop(base, None)
+
+    def settle_all(self):
+        """
+        Replay every held back touch
+        :return: None
+        """
+        for entry in self._pending.values():
+            self._replay(entry)
+        self._pending.clear()
+
+    def before_victim(self):
+        """
+        Called before UL2 or UL3 may pick a victim, replays every held back touch in exact mode
+        :return: None
+        """
+        if self.exact and self._pending:
+            self.settle_all()
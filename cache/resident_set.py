@@ -0,0 +1,102 @@
+def _fill_level(cache, rows, implied, allowed):
+    # Place the rows targeting the cache or, by inclusion, a level inside it, ordered by their newest row. The dirty
+    # flag of the cache's own row wins, else the block is dirty if any inner copy is
+    order = dict()
+    dirty = dict()
+    for position, (base, is_dirty, level) in enumerate(rows):
+        if level not in implied or (allowed is not None and base not in allowed):
+            continue
+        order[base] = position
+        if level == cache.name:
+            dirty[base] = (True, is_dirty)
+        elif not dirty.get(base, (False, False))[0]:
+            dirty[base] = (False, is_dirty or dirty.get(base, (False, False))[1])
+    return cache.fill([(base, dirty[base][1]) for base in sorted(order, key=order.get)])
+
+
+def preload_inclusive(outer, middle, inner: dict, addresses, dirty=None, levels=None):
+    """
+    Fill an inclusive three level hierarchy straight from a resident set, one row per resident copy of a block, keeping
+    every block of a level in the levels below it. The outer level is filled first with every block, the middle level
+    with the blocks surviving there that it or an inner level holds, and each inner level with the blocks surviving in
+    the middle level that it holds. Where a set overflows the newest blocks are kept, see cache.cache.Cache.fill
+    :param outer: The last level cache, UL3
+    :param middle: The middle level cache, UL2
+    :param inner: dict, level name to first level cache, as {'DL1': DL1, 'IL1': IL1}
+    :param addresses: sequence of addresses, oldest first
+    :param dirty: sequence of dirty flags, one per address, all clean when None
+    :param levels: sequence of the level name each address is loaded into, and by inclusion the levels below it, one
+    per address. The first level data cache when None
+    :return: int, the number of rows resident in their level afterwards
+    """
+    if dirty is None:
+        dirty = [False] * len(addresses)
+    if levels is None:
+        levels = [next(iter(inner))] * len(addresses)
+    names = set(inner) | {outer.name, middle.name}
+    mask = outer.get_base_address_mask()
+    rows = []
+    for address, is_dirty, level in zip(addresses, dirty, levels):
+        if level not in names:
+            raise AttributeError("Field 'levels' must name one of {}".format(", ".join(sorted(names))))
+        rows.append((address & mask, bool(is_dirty), level))
+
+    kept = {outer.name: _fill_level(outer, rows, names, None)}
+    kept[middle.name] = _fill_level(middle, rows, set(inner) | {middle.name}, kept[outer.name])
+    for name, cache in inner.items():
+        kept[name] = _fill_level(cache, rows, {name}, kept[middle.name])
+    return sum(1 for base, _, level in rows if base in kept[level])
+
+
+def resident_inclusive(outer, middle, inner: dict):
+    """
+    Capture the resident set of an inclusive three level hierarchy, in the form preload_inclusive() takes: one row per
+    resident copy of a block, with its level and dirty flag. Rows are ordered by their policy data where it is a plain
+    number, as LRU's time of last touch, so a reload keeps the eviction order
+    :param outer: The last level cache, UL3
+    :param middle: The middle level cache, UL2
+    :param inner: dict, level name to first level cache, as {'DL1': DL1, 'IL1': IL1}
+    :return: tuple (addresses, dirty, levels) of lists, oldest first
+    """
+    rows = []
+    for cache in [outer, middle] + list(inner.values()):
+        for block in cache.resident():
+            rows.append((block.base_address(), block.is_dirty(), cache.name, block.get_policy_data()))
+    if all(isinstance(row[3], int) for row in rows):
+        rows.sort(key=lambda row: row[3])
+    return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+
+def save_resident_set(filename, addresses, dirty, levels):
+    """
+    Save a resident set as CSV, one 'address,dirty,level' row per resident copy of a block, oldest first
+    :param filename: The file to write
+    :param addresses: sequence of addresses
+    :param dirty: sequence of dirty flags
+    :param levels: sequence of level names
+    :return: None
+    """
+    lines = ["address,dirty,level\n"]
+    for address, is_dirty, level in zip(addresses, dirty, levels):
+        lines.append("{},{},{}\n".format(hex(address), int(is_dirty), level))
+    with open(filename, 'w') as out:
+        out.writelines(lines)
+
+
+def load_resident_set(filename):
+    """
+    Load a resident set saved by save_resident_set(), or any CSV of the same columns, e.g. from a memory image
+    :param filename: The file to read
+    :return: tuple (addresses, dirty, levels) of lists
+    """
+    addresses, dirty, levels = [], [], []
+    with open(filename, 'r') as fp:
+        fp.readline()
+        for line in fp:
+            if not line.strip():
+                continue
+            address, is_dirty, level = line.rstrip("\n").split(",")
+            addresses.append(int(address, 16))
+            dirty.append(is_dirty == "1")
+            levels.append(level)
+    return addresses, dirty, levels
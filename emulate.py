@@ -1,63 +1,391 @@
 from hierarchies.three_level_suu_inclusive_cache_system import ThreeLevelSUUInclusiveCacheSystem as Cache
 from system.system import AddressSpace
+from traces.trace_reader import read_trace, count_lines, coalesce, is_compressed_trace
+from traces.binary_trace import is_binary_trace
+from traces.formats import detect_format
+from traces.trace_index import TraceIndex
+from traces.pipeline import SharedMemoryTracePipeline
+from runners.result_cache import ResultCache
+from runners.replay import run_window
+from runners.ensemble import simulate_ensemble
+from runners.phases import pick_phases, simulate_phases, validate_phases
+from runners.time_sliced import simulate_time_sliced, validate_time_sliced
+from runners.config import load_configs, build_hierarchy as build_configured
+from runners.lockstep import LockstepEngine
+from traces.next_use import build_next_use
+from metrics.interning import AddressInterner
+from metrics.memory import MemoryBudget, MemoryEstimator
+from metrics.telemetry import TelemetryExporter
+from metrics.regions import RegionMap
+from cache.resident_set import load_resident_set, save_resident_set
 import policies.replacement_policies
-import sys, os
+import argparse, functools, os, sys
 
-if len(sys.argv) < 2:
-    raise ValueError("No trace file given. Aborting...")
-elif len(sys.argv) > 2:
-    raise ValueError("Unknown arguments given")
-if not os.path.exists(sys.argv[1]):
-    raise ValueError("Trace file: '{}' does not exist!".format(sys.argv[1]))
 
-with open(sys.argv[1], 'r') as fp:
+def build_hierarchy(config=None, reuse=False, footprint=0, address_stats=True, next_use=None, regions=None, recency=None, seed=None):
+    """
+    Create the simulated cache system. Kept at module level so time sliced workers can build their own
+    :param config: A configuration as returned by runners.config.load_configs, None for the one below
+    :param reuse: Whether to keep reuse distance histograms
+    :param footprint: The relative error of the footprint estimates, 0 to not estimate footprints
+    :param address_stats: Whether to keep the exact per address transition stats
+    :param next_use: The next use positions of the trace, for configurations using the 'OPT' policy
+    :param regions: The metrics.regions.RegionMap to aggregate stats per region by, None to not
+    :param recency: 'exact' or 'approximate' to hold back the touches L1 hits make to the levels below, None to not.
+    A configuration's own 'recency' wins
+    :param seed: The seed of the replacement policy's random number generator, overriding a configuration's own, None
+    to leave it as is
+    :return: The cache system
+    """
+    if config is not None:
+        if seed is not None:
+            config = dict(config, policy_options=dict(config.get("policy_options", {}), seed=seed))
+        simulate = build_configured(config, next_use=next_use)
+    else:
+        ### Typically you change the following, or pass --configs ###
+        simulate = Cache(
+            AddressSpace.in64Bit,
+            policies.replacement_policies.LRUReplacementPolicy(seed=seed),
+            [32768, 262144, 2097152],
+            [8, 8, 16],
+            32,
+            level_latencies=[(4, 4),(12, 12),(30, 30), (100, 100)]
+        )
+        ###   Typically you change the above   ###
+
+    if recency is not None and (config is None or config.get("recency") is None):
+        simulate.defer_recency(recency)
+    if reuse:
+        simulate.stats.track_reuse(simulate.DL1.get_block_size())
+    if footprint > 0:
+        simulate.stats.track_footprint(simulate.DL1.get_block_size(), error=footprint)
+    if not address_stats:
+        simulate.stats.track_addresses(False)
+    if regions is not None:
+        simulate.stats.track_regions(regions)
+    return simulate
+
+
+def check_budget(budget):
+    """
+    Switch to leaner metrics modes if the run went over its memory budget, telling which
+    :param budget: The metrics.memory.MemoryBudget, or None without a budget
+    :return: None
+    """
+    if budget is None:
+        return
+    exceeded = budget.exceeded
+    for mode in budget.check():
+        print("\nOver the memory budget, {}".format(mode))
+    if budget.exceeded and not exceeded:
+        print("\nOver the memory budget of {:.1f} MB even with the leanest metrics".format(budget.budget / (1 << 20)))
+
+
+def progress(at, lines):
+    """
+    Draw the progress bar for the current position in the trace
+    :param at: The number of trace lines consumed
+    :param lines: The total number of trace lines
+    :return: None
+    """
+    done = (at * 100 // lines) // 2 if lines > 0 else 50
+    print('[' + '=' * done + '-' * (50 - done) + ']' + str(at), end='\r')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a memory access trace through a cache hierarchy")
+    parser.add_argument('trace', help="The trace file, one 'D|I R|W 0xADDR' access per line, optionally gzip, xz or bzip2 compressed, or a binary trace")
+    parser.add_argument('--serial', action='store_true', help="Parse and simulate in this process instead of overlapping them")
+    parser.add_argument('--coalesce', action='store_true', help="Simulate runs of identical back to back accesses in bulk")
+    parser.add_argument('--interval', type=int, default=0, help="Stream per level statistics every this many accesses")
+    parser.add_argument('--interval-file', default='intervals.out', help="The file interval statistics are streamed to")
+    parser.add_argument('--interval-binary', action='store_true', help="Stream interval statistics as packed binary records instead of CSV")
+    parser.add_argument('--reuse', action='store_true', help="Keep per level reuse distance histograms and report them in the output")
+    parser.add_argument('--footprint', type=float, default=0, metavar='ERROR', help="Estimate per level, per stream and per interval footprints with this relative error")
+    parser.add_argument('--no-address-stats', action='store_true', help="Skip the exact per address transition stats to save memory")
+    parser.add_argument('--set-stats', metavar='PREFIX', help="Count accesses, misses and evictions per set and save one PREFIX.<level>.csv heatmap per level")
+    parser.add_argument('--export', help="Also export the metrics in columnar form to this file, '.npz' or CSV")
+    parser.add_argument('--intern', metavar='FILE', help="Key the per address stats by dense IDs, built up front for binary traces, save the ID to address mapping to this file and export IDs instead of addresses")
+    parser.add_argument('--result-cache', metavar='PATH', help="Reuse the summary of an earlier run of the same trace and configuration stored in this database, printing only the summary on a hit")
+    parser.add_argument('--start', type=int, default=0, help="Only simulate from this record on")
+    parser.add_argument('--end', type=int, default=None, help="Only simulate up to, not including, this record")
+    parser.add_argument('--warmup', type=int, default=0, help="Warm the caches on this many records before --start, or before every time slice, without counting them")
+    parser.add_argument('--slices', type=int, default=1, help="Split the trace into this many time slices simulated in parallel on fresh hierarchies, approximating a serial run")
+    parser.add_argument('--processes', type=int, default=None, help="The number of worker processes for --slices, the number of CPUs by default")
+    parser.add_argument('--validate', action='store_true', help="Run the trace both serially and time sliced, or phase sampled with --phases, and report the error and speedup")
+    parser.add_argument('--phases', type=int, default=0, metavar='K', help="Only simulate the K intervals best representing the trace's phases, clustered by their block accesses, and weight their stats into an estimate of the whole run")
+    parser.add_argument('--phase-interval', type=int, default=100000, help="Records per interval the trace is cut into for --phases")
+    parser.add_argument('--phase-signature', choices=['blocks', 'regions'], default='blocks', help="Describe the intervals of --phases by their hashed block accesses or by their accesses per --regions region")
+    parser.add_argument('--ensemble', type=int, default=0, metavar='S', help="Run up to S replicas seeded --seed, --seed + 1, ... in parallel and report the mean and confidence interval of every summary field, for randomized policies")
+    parser.add_argument('--seed', type=int, default=0, help="The seed of the first --ensemble replica")
+    parser.add_argument('--confidence', type=float, default=0.95, help="The confidence level of the --ensemble intervals")
+    parser.add_argument('--tolerance', type=float, default=None, metavar='REL', help="Stop the --ensemble once every interval's half width is within this fraction of its mean")
+    parser.add_argument('--index-every', type=int, default=1 << 20, help="Records between two offsets in a text trace's seek index")
+    parser.add_argument('--configs', metavar='FILE', help="Simulate every configuration in this JSON file in one pass over the trace, see runners.config.load_configs")
+    parser.add_argument('--next-use-file', metavar='PATH', help="Keep the next use positions 'OPT' configurations need memory mapped in this file instead of in memory")
+    parser.add_argument('--compare-file', default='compare.csv', help="The file the side by side summaries of --configs are saved to")
+    parser.add_argument('--memory-budget', type=float, default=0, metavar='MB', help="Switch to leaner metrics modes, fewer reuse blocks and then no per address stats, instead of exceeding this many MB")
+    parser.add_argument('--estimate-memory', action='store_true', help="Only print the predicted peak memory of the run per component")
+    parser.add_argument('--regions', metavar='FILE', help="Aggregate hits, misses, evictions and latency per region of this /proc/<pid>/maps listing or 'name start end' range list")
+    parser.add_argument('--region-stats', default='regions.csv', metavar='FILE', help="The file per region stats are saved to, one FILE.<name> per configuration with --configs")
+    parser.add_argument('--preload', metavar='FILE', help="Start from the resident set in this CSV, as saved by --dump-resident, instead of cold caches")
+    parser.add_argument('--dump-resident', metavar='FILE', help="Save the blocks resident at the end of the run to this CSV, one FILE.<name> per configuration with --configs")
+    parser.add_argument('--telemetry-file', metavar='PATH', help="Periodically write a snapshot of throughput, ETA, hit rates and RSS to this file")
+    parser.add_argument('--telemetry-port', type=int, default=None, help="Serve the telemetry snapshot over HTTP on this local port")
+    parser.add_argument('--telemetry-format', choices=['json', 'prometheus'], default='json', help="The format of the telemetry snapshot")
+    parser.add_argument('--telemetry-period', type=float, default=10.0, help="The least number of seconds between two telemetry snapshots")
+    parser.add_argument('--defer-recency', choices=['exact', 'approximate'], default=None, help="Hold back the touches L1 hits make to UL2 and UL3 until they matter, 'exact' keeps the results, 'approximate' only applies them when a block leaves L1")
+    parser.add_argument('--batch-size', type=int, default=4096, help="Records handed from the parser to the simulator at once")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.trace):
+        raise ValueError("Trace file: '{}' does not exist!".format(args.trace))
+
+    trace_format = 'binary' if is_binary_trace(args.trace) else detect_format(args.trace)
+    sliced = args.slices > 1 or args.validate or args.phases > 0
+    if args.phases > 0 and args.slices > 1:
+        raise ValueError("--phases cannot be combined with --slices")
+    if args.phase_signature == 'regions' and not args.regions:
+        raise ValueError("--phase-signature regions needs --regions")
+    if trace_format not in ('binary', 'native') and (sliced or args.start > 0 or args.end is not None or args.warmup > 0):
+        raise ValueError("Traces in the {} format cannot be time sliced or windowed, convert them to a binary trace first".format(trace_format))
+    if sliced and (args.start > 0 or args.end is not None or args.interval > 0 or args.set_stats or args.memory_budget or args.preload or args.dump_resident):
+        raise ValueError("Time slicing cannot be combined with --start, --end, --interval, --set-stats, --memory-budget, --preload or --dump-resident")
+
+    if args.ensemble and (sliced or args.start > 0 or args.end is not None or args.warmup > 0 or args.interval > 0 or args.set_stats or args.memory_budget or args.preload or args.dump_resident or args.export or args.intern or args.result_cache):
+        raise ValueError("--ensemble cannot be combined with time slicing, --phases, windows, --interval, --set-stats, --memory-budget, --preload, --dump-resident, --export, --intern or --result-cache")
+
+    if args.result_cache and (args.interval > 0 or args.set_stats or args.regions or args.dump_resident or args.export or args.intern):
+        raise ValueError("--result-cache only stores the run summary and cannot be combined with --interval, --set-stats, --regions, --dump-resident, --export or --intern, whose outputs a stored result could not write")
+
+    if args.configs and not args.ensemble and (sliced or args.start > 0 or args.end is not None or args.warmup > 0 or args.interval > 0 or args.set_stats or args.export or args.result_cache or args.intern):
+        raise ValueError("--configs cannot be combined with time slicing, windows, --interval, --set-stats, --export, --result-cache or --intern")
+
     print("Creating cache...")
+    regions = RegionMap.load(args.regions) if args.regions else None
+    factory = functools.partial(build_hierarchy, reuse=args.reuse, footprint=args.footprint, address_stats=not args.no_address_stats, regions=regions, recency=args.defer_recency)
+    if args.ensemble:
+        configs = load_configs(args.configs) if args.configs else [None]
+        for config in configs:
+            # OPT cannot even be built without the trace's next uses
+            if (config is not None and config["policy"] == 'OPT') or not factory(config=config).DL1.get_policy().randomized:
+                raise ValueError("--ensemble needs a randomized policy, RAND, NMRU or NMFU, as every replica of {} would give the same results".format("the default hierarchy" if config is None else config["name"]))
+        for config in configs:
+            name = "" if config is None else " of " + config["name"]
+            print("Running up to {} replicas{} seeded from {}...".format(args.ensemble, name, args.seed))
+            report = simulate_ensemble(functools.partial(factory, config=config), args.trace, args.ensemble, seed=args.seed, processes=args.processes, confidence=args.confidence, tolerance=args.tolerance)
+            for field in report["mean"]:
+                print("{}: {} +/- {}".format(field, report["mean"][field], report["half-width"][field]))
+            print("{} replicas, {:.0%} confidence{}".format(report["replicas"], report["confidence"], "" if args.tolerance is None else ", converged" if report["converged"] else ", not converged"))
+        print("Done.")
+        sys.exit(0)
+
+    if args.configs:
+        runs = dict()
+        next_uses = dict()
+        configs = load_configs(args.configs)
+        # Accesses crossing a block boundary are split at the smallest block size, the same for every configuration
+        split_size = min(config["blocksize"] for config in configs)
+        for config in configs:
+            next_use = None
+            if config["policy"] == 'OPT':
+                if config["blocksize"] not in next_uses:
+                    print("Computing next uses for {} byte blocks...".format(config["blocksize"]))
+                    path = None if not args.next_use_file else "{}.{}".format(args.next_use_file, config["blocksize"])
+                    next_uses[config["blocksize"]] = build_next_use(args.trace, config["blocksize"], path=path, split_size=split_size)
+                next_use = next_uses[config["blocksize"]]
+            runs[config["name"]] = factory(config=config, next_use=next_use)
+        simulate = LockstepEngine(runs)
+    else:
+        simulate = factory()
+        runs = {None: simulate}
+        split_size = simulate.DL1.get_block_size()
+
+    if args.preload:
+        resident = load_resident_set(args.preload)
+        for name, hierarchy in runs.items():
+            placed = hierarchy.preload(*resident)
+            print("Preloaded {} of {} resident blocks{}".format(placed, len(resident[0]), "" if name is None else " into " + name))
+
+    signature_regions = regions if args.phase_signature == 'regions' else None
+    if args.validate and args.phases > 0:
+        print("Validating {} phases of {} record intervals with {} warmup records...".format(args.phases, args.phase_interval, args.warmup))
+        report = validate_phases(factory, args.trace, args.phase_interval, args.phases, split_size, warmup=args.warmup, processes=args.processes, regions=signature_regions)
+        for start, end, records in report["phases"]:
+            print("Phase [{}, {}) standing for {} records".format(start, end, records))
+        for name in report["full"]:
+            print("{}: full {} sampled {} error {:.4%}".format(name, report["full"][name], report["sampled"][name], report["errors"][name]))
+        print("Max error: {:.4%}".format(report["max-error"]))
+        print("Full {:.2f}s, sampled {:.2f}s, speedup {:.2f}x".format(report["full-time"], report["sampled-time"], report["speedup"]))
+        print("Done.")
+        sys.exit(0)
+    if args.validate:
+        print("Validating {} time slices with {} warmup records...".format(args.slices, args.warmup))
+        report = validate_time_sliced(factory, args.trace, args.slices, warmup=args.warmup, processes=args.processes)
+        for name in report["serial"]:
+            print("{}: serial {} sliced {} error {:.4%}".format(name, report["serial"][name], report["sliced"][name], report["errors"][name]))
+        print("Max error: {:.4%}".format(report["max-error"]))
+        print("Serial {:.2f}s, sliced {:.2f}s, speedup {:.2f}x".format(report["serial-time"], report["sliced-time"], report["speedup"]))
+        print("Done.")
+        sys.exit(0)
+
+    windowed = not sliced and (args.start > 0 or args.end is not None or args.warmup > 0)
+
+    if args.result_cache:
+        result_cache = ResultCache(args.result_cache)
+        extra = None
+        if windowed:
+            extra = [args.start, args.end, args.warmup]
+        elif args.phases > 0:
+            extra = ["phases", args.phases, args.phase_interval, args.phase_signature, args.warmup]
+        elif sliced:
+            extra = ["sliced", args.slices, args.warmup]
+        if args.preload:
+            extra = (extra or []) + ["preload", result_cache.digest(args.preload)]
+        result_key = result_cache.key(args.trace, simulate, extra=extra)
+        summary = result_cache.get(result_key)
+        if summary is not None:
+            print("Found a stored result for this trace and configuration:")
+            for name in summary:
+                print("{}: {}".format(name, summary[name]))
+            print("Only the summary is stored, testing.out was not written")
+            print("Done.")
+            sys.exit(0)
 
-    ### Typically you change the following ###
-    simulate = Cache(
-        AddressSpace.in64Bit,
-        policies.replacement_policies.LRUReplacementPolicy(),
-        [32768, 262144, 2097152],
-        [8, 8, 16],
-        32,
-        level_latencies=[(4, 4),(12, 12),(30, 30), (100, 100)]
-    )
-    ###   Typically you change the above   ###
+    if args.set_stats:
+        for level in (simulate.IL1, simulate.DL1, simulate.UL2, simulate.UL3):
+            level.track_sets()
+    if args.intern and is_binary_trace(args.trace) and not args.no_address_stats:
+        print("Interning addresses...")
+        simulate.stats.use_interner(AddressInterner.build(args.trace))
+    if args.interval > 0:
+        simulate.stats.stream_intervals(args.interval_file, args.interval, binary=args.interval_binary)
 
     print("Collecting metadata...")
-    lines = 0
-    fp2 = open(sys.argv[1], 'r')
-    for line in fp2.readlines():
-        lines += 1
-    fp2.close()
+    lines = count_lines(args.trace)
+
+    budget = None
+    if args.memory_budget > 0 or args.estimate_memory:
+        # The distinct addresses are known when interned up front, else the record count bounds them
+        interned = args.intern and is_binary_trace(args.trace) and not args.no_address_stats
+        distinct = len(simulate.stats.interner()) if interned else lines
+        estimate = MemoryEstimator(runs.values()).estimate(distinct)
+        print("Predicted peak memory{}: {}".format("" if interned else " at most", ", ".join(
+            "{} {:.1f} MB".format(name, value / (1 << 20)) for name, value in estimate.items())))
+        if args.estimate_memory:
+            print("Done.")
+            sys.exit(0)
+        budget = MemoryBudget(runs.values(), int(args.memory_budget * (1 << 20)))
+        if interned:
+            for mode in budget.select(distinct):
+                print("Predicted over the memory budget, {}".format(mode))
+        if estimate["caches"] + estimate["policies"] > budget.budget:
+            # No metrics mode shrinks the caches, so there is no point waiting for the run to find out
+            budget.exceeded = True
+        if budget.exceeded:
+            print("Predicted over the memory budget of {:.1f} MB even with the leanest metrics".format(args.memory_budget))
+
+    telemetry = None
+    if args.telemetry_file or args.telemetry_port is not None:
+        telemetry = TelemetryExporter(runs, lines, filename=args.telemetry_file, port=args.telemetry_port,
+                                      prometheus=args.telemetry_format == 'prometheus', period=args.telemetry_period)
+
+    def checkpoint(at):
+        progress(at, lines)
+        check_budget(budget)
+        if telemetry is not None:
+            telemetry.update(at)
 
     print("Running trace...")
-    at = 0
+    next_progress = 10000
     print('[' + '-' * 50 + '] 0', end='\r')
-    for line in fp.readlines():
-        try:
-            # print(line.strip())
-            at += 1
-            r = line.strip().replace('\x00', '').split(' ')
-            if len(r) != 3 or (r[0] != "D" and r[0] != "I") or (r[1] != "R" and r[1] != "W") or len(r[2]) < 5 or 'x' in r[2][2:] or r[2][0] == 'x' or 'I' in r[2] or 'D' in r[2] or 'R' in r[2] or 'W' in r[2]:  # Prevent strange malformed output from c++
-                continue
-            address_type, operation, hex_address = line.strip().replace('\x00', '').split(' ')
-
-            is_data_op = True if address_type == "D" else False
-            method = simulate.perform_fetch if operation == "R" else simulate.perform_set
-            int_address = int(hex_address, 16)
-            method(int_address, for_data=is_data_op)
-
-            if at % 10000 == 0:
-                print('[' + '='*((at *100 // lines)//2) + '-'*(50 - ((at *100 // lines)//2)) + ']' + str(at), end='\r')
-        except Exception as ex:
-            print("Exception thrown while trying to parse line:")
-            print("{}: {}".format(at, line.strip()))
-            print("The exception was: {}".format(str(ex)))
-            print("Aborting...")
-            break
+    completed = False
+    at = 0
+    source = None
+    try:
+        if args.phases > 0:
+            phases = pick_phases(args.trace, args.phase_interval, args.phases, split_size, regions=signature_regions)
+            for start, end, records in phases:
+                print("Phase [{}, {}) standing for {} records".format(start, end, records))
+            simulate.stats = simulate_phases(factory, args.trace, phases, warmup=args.warmup, processes=args.processes)
+            at = lines
+        elif sliced:
+            simulate.stats = simulate_time_sliced(factory, args.trace, args.slices, warmup=args.warmup, processes=args.processes)
+            at = lines
+        elif windowed:
+            index = None
+            if not is_binary_trace(args.trace) and not is_compressed_trace(args.trace):
+                index = TraceIndex.for_trace(args.trace, every=args.index_every)
+            warmed, performed = run_window(simulate, args.trace, args.start, args.end, warmup=args.warmup, index=index)
+            at = args.start + performed
+        elif trace_format not in ('binary', 'native') and not args.coalesce:
+            # Traces in the other tools' formats are decoded a chunk at a time
+            source = read_trace(args.trace, block_size=split_size)
+            for batch in source.batches(args.batch_size):
+                simulate.perform_batch(batch)
+                if source.lines >= next_progress:
+                    checkpoint(source.lines)
+                    next_progress = source.lines - source.lines % 10000 + 10000
+        elif args.serial or trace_format != 'native':
+            source = read_trace(args.trace, block_size=split_size)
+            for int_address, is_data_op, is_fetch, repeat in (coalesce(source) if args.coalesce else ((*r, 1) for r in source)):
+                method = simulate.perform_fetch if is_fetch else simulate.perform_set
+                method(int_address, for_data=is_data_op, count=repeat)
+                if source.lines >= next_progress:
+                    checkpoint(source.lines)
+                    next_progress = source.lines - source.lines % 10000 + 10000
+        else:
+            source = SharedMemoryTracePipeline(args.trace, batch_size=args.batch_size)
+            with source as pipeline:
+                perform_fetch = simulate.perform_fetch
+                perform_set = simulate.perform_set
+                for batch in pipeline.batches():
+                    if args.coalesce:
+                        for int_address, is_data_op, is_fetch, repeat in coalesce(batch):
+                            if is_fetch:
+                                perform_fetch(int_address, for_data=is_data_op, count=repeat)
+                            else:
+                                perform_set(int_address, for_data=is_data_op, count=repeat)
+                    else:
+                        simulate.perform_batch(batch)
+                    if pipeline.lines >= next_progress:
+                        checkpoint(pipeline.lines)
+                        next_progress = pipeline.lines - pipeline.lines % 10000 + 10000
+        completed = True
+    except Exception as ex:
+        print("Exception thrown while trying to parse line:")
+        print(str(ex))
+        print("Aborting...")
 
+    if source is not None:
+        at = source.lines
     print('[' + '=' * 50 + ']' + str(at))
+    if telemetry is not None:
+        telemetry.update(at, force=True)
+        telemetry.close()
     print("Finished trace... Gathering metrics")
-    simulate.stats.save('testing.out')
-print("Done.")
+    for name, hierarchy in runs.items():
+        hierarchy.stats.close_intervals()
+        hierarchy.stats.save('testing.out' if name is None else 'testing.{}.out'.format(name))
+    if args.configs:
+        simulate.save_summaries(args.compare_file)
+        summaries = simulate.summaries()
+        print("field " + " ".join(summaries))
+        for field in summaries[next(iter(summaries))]:
+            print(field + " " + " ".join(str(summaries[name][field]) for name in summaries))
+    if args.result_cache and completed:
+        result_cache.put(result_key, simulate.stats.summary())
+    if args.set_stats:
+        for level in (simulate.IL1, simulate.DL1, simulate.UL2, simulate.UL3):
+            level.save_set_stats("{}.{}.csv".format(args.set_stats, level.name))
+    if regions is not None:
+        for name, hierarchy in runs.items():
+            hierarchy.stats.save_regions(args.region_stats if name is None else "{}.{}".format(args.region_stats, name))
+    if args.dump_resident:
+        for name, hierarchy in runs.items():
+            save_resident_set(args.dump_resident if name is None else "{}.{}".format(args.dump_resident, name), *hierarchy.resident_set())
+    if args.intern:
+        simulate.stats.interner().save(args.intern)
+    if args.export:
+        simulate.stats.export(args.export, ids=bool(args.intern))
+    print("Done.")
@@ -1,5 +1,8 @@
 from system.system import AddressSpace
 from cache.cache import Cache, Block
+from cache.decoder import AddressDecoder
+from cache.inclusion import IN_DL1, IN_IL1, IN_UL2, RECENCY_MODES, DeferredTouches, link_copies, resident_bases
+from cache.resident_set import preload_inclusive, resident_inclusive
 from metrics.cache_metrics import CacheMetrics
 from policies.replacement_policies import BaseReplacementPolicy as ReplacementPolicy
 
@@ -51,119 +54,223 @@ class ThreeLevelSUUInclusiveBypassingReadDownCacheSystem:
             ]
         )
 
-    def perform_fetch(self, address, for_data=True):
+        # The line most recently hit in each L1 as (base_address, L1 block, UL2 block, UL3 block). A repeated access to
+        # it is an L1 hit by construction and skips the lookups in all three levels. Forgotten on any L1 miss, since
+        # only misses change which blocks are resident
+        self._line_mask = self.DL1.get_base_address_mask()
+        self._last_line = {self.DL1.name: None, self.IL1.name: None}
+
+        # Decodes an address into (base address, L1 set, UL2 set, UL3 set) once per access, IL1 shares DL1's geometry
+        self._decoder = AddressDecoder([self.DL1, self.UL2, self.UL3])
+        self._decode = self._decoder.decode
+
+        # Holds back the touches L1 hits make to the copies below, None to touch them on every hit, see defer_recency()
+        self._deferred = None
+
+    def _forget_last_lines(self):
+        self._last_line[self.DL1.name] = None
+        self._last_line[self.IL1.name] = None
+
+    def _back_invalidate_outer(self, evicted):
+        # A block leaving UL3 leaves every level above it too, its presence bits say which without probing them. The
+        # transition is booked from the innermost level holding it
+        present = evicted.presence()
+        evicted_base, evicted_l1_set, evicted_l2_set, _ = self._decode(evicted.base_address())
+        if present & IN_DL1:
+            self.stats.add_transition(self.DL1.name, self.MEM.name, evicted_base, total_size=self.DL1.get_block_size())
+        elif present & IN_IL1:
+            self.stats.add_transition(self.IL1.name, self.MEM.name, evicted_base, total_size=self.IL1.get_block_size())
+        elif present & IN_UL2:
+            self.stats.add_transition(self.UL2.name, self.MEM.name, evicted_base, total_size=self.UL2.get_block_size())
+        else:
+            self.stats.add_transition(self.UL3.name, self.MEM.name, evicted_base, total_size=self.UL3.get_block_size())
+        if present & IN_DL1:
+            self.DL1.remove_base(evicted_base, evicted_l1_set)
+        if present & IN_IL1:
+            self.IL1.remove_base(evicted_base, evicted_l1_set)
+        if present & IN_UL2:
+            self.UL2.remove_base(evicted_base, evicted_l2_set)
+        if self._deferred is not None:
+            self._deferred.discard(evicted_base)
+
+    def _back_invalidate_middle(self, evicted):
+        # A block leaving UL2 leaves both L1s too, its presence bits say which hold it without probing them
+        present = evicted.presence()
+        evicted_base, evicted_l1_set, _, _ = self._decode(evicted.base_address())
+        if present & IN_DL1:
+            self.stats.add_transition(self.DL1.name, self.UL3.name, evicted_base, total_size=self.DL1.get_block_size())
+        elif present & IN_IL1:
+            self.stats.add_transition(self.IL1.name, self.UL3.name, evicted_base, total_size=self.IL1.get_block_size())
+        else:
+            self.stats.add_transition(self.UL2.name, self.UL3.name, evicted_base, total_size=self.UL2.get_block_size())
+        if present & IN_DL1:
+            self.DL1.remove_base(evicted_base, evicted_l1_set)
+        if present & IN_IL1:
+            self.IL1.remove_base(evicted_base, evicted_l1_set)
+        outer = evicted.lower()
+        if outer is not None:
+            outer.clear_present(present | IN_UL2)
+        if self._deferred is not None:
+            # The copy in UL3 stays
+            self._deferred.settle(evicted_base)
+
+    def _link_copies(self, bases):
+        link_copies(self.UL3, self.UL2, {IN_DL1: self.DL1, IN_IL1: self.IL1}, bases)
+
+    def _settle_deferred(self):
+        if self._deferred is not None:
+            self._deferred.settle_all()
+
+    def defer_recency(self, mode='exact'):
+        """
+        Hold back the touches L1 hits make to the copies of their block in UL2 and UL3, see
+        cache.inclusion.DeferredTouches. Exact mode gives the same results as touching on every hit, and falls back to
+        touching on every hit for policies whose victims depend on the order of the touches, as OPT or LFU with aging
+        :param mode: 'exact', 'approximate' to only replay the touches when a block leaves L1, or None to touch on every
+        hit
+        :return: bool, whether touches are held back
+        """
+        self._settle_deferred()
+        self._deferred = None
+        if mode is None:
+            return False
+        if mode not in RECENCY_MODES:
+            raise AttributeError("Field 'mode' must be one of {}".format(", ".join(RECENCY_MODES)))
+        if mode == 'exact' and not self._replacement_policy.order_free:
+            return False
+        self._deferred = DeferredTouches(exact=mode == 'exact')
+        return True
+
+    def recency_mode(self):
+        """
+        How L1 hits reach the copies of their block below, see defer_recency()
+        :return: str, 'exact' or 'approximate', None when they are touched on every hit
+        """
+        if self._deferred is None:
+            return None
+        return 'exact' if self._deferred.exact else 'approximate'
+
+    def _perform_fetch(self, address, for_data=True, decoded=None):
+        base, l1_set, l2_set, l3_set = decoded if decoded is not None else self._decode(address)
         cache = self.DL1 if for_data else self.IL1
-        block = cache.get(address)
-        self.stats.add_latency(cache.read_latency, True)
+        block = cache.lookup_at(base, l1_set)
+        self.stats.add_latency(cache.read_latency, True, level=cache.name)
         hit_in = cache
         if block is None:
-            self.stats.add_miss(cache.name)
+            self._forget_last_lines()
+            if self._deferred is not None:
+                # The copies below are read or replaced next
+                self._deferred.settle(base)
+            self.stats.add_miss(cache.name, address)
             cache = self.UL2
-            block = cache.get(address)
-            self.stats.add_latency(cache.read_latency, True)
+            block = cache.lookup_at(base, l2_set)
+            self.stats.add_latency(cache.read_latency, True, level=cache.name)
             hit_in = self.UL2
 
             if block is None:
-                self.stats.add_miss(cache.name)
+                if self._deferred is not None:
+                    self._deferred.before_victim()
+                self.stats.add_miss(cache.name, address)
                 cache = self.UL3
-                block = cache.get(address)
-                self.stats.add_latency(cache.read_latency, True)
+                block = cache.lookup_at(base, l3_set)
+                self.stats.add_latency(cache.read_latency, True, level=cache.name)
                 hit_in = self.UL3
                 if block is None:
-                    self.stats.add_miss(cache.name)
+                    self.stats.add_miss(cache.name, address)
                     # Not in the cache, fetch from memory
-                    self.stats.add_latency(self.MEM.read_latency, True)
+                    self.stats.add_latency(self.MEM.read_latency, True, level=self.MEM.name)
                     # Allocate new block from MEM to L3
-                    block = Block(address & self.UL3.get_base_address_mask(), False, self.UL3.get_policy())
+                    block = Block(base, False, self.UL3.get_policy())
                     block.read()
 
                     hit_in = self.MEM
                     cache = self.UL3
-                    evicted = cache.put(block)
+                    evicted = cache.put(block, l3_set)
                     if evicted:
-                        # If the evicted block is in L1, transition from L1 to MEM
-                        if self.DL1.get(evicted.base_address()):
-                            self.stats.add_transition(self.DL1.name, self.MEM.name, evicted.base_address(), total_size=self.DL1.get_block_size())
-                            # If the evicted block is in L1, evict it too, and from L2
-                            self.DL1.remove_base(evicted.base_address())
-                            self.UL2.remove_base(evicted.base_address())
-                        elif self.IL1.get(evicted.base_address()):
-                            self.stats.add_transition(self.IL1.name, self.MEM.name, evicted.base_address(), total_size=self.IL1.get_block_size())
-                            # If the evicted block is in L1, evict it too, and from L2
-                            self.IL1.remove_base(evicted.base_address())
-                            self.UL2.remove_base(evicted.base_address())
-                        elif self.UL2.get(evicted.base_address()):
-                            self.stats.add_transition(self.UL2.name, self.MEM.name, evicted.base_address(), total_size=self.UL2.get_block_size())
-                            # If the evicted block is in L2, evict it
-                            self.UL2.remove_base(evicted.base_address())
-                        else:
-                            self.stats.add_transition(self.UL3.name, self.MEM.name, evicted.base_address(), total_size=self.UL3.get_block_size())
+                        self.stats.add_eviction(cache.name, evicted.base_address())
+                        self._back_invalidate_outer(evicted)
                 else:
                     block.read()
 
                     # Allocate new block from L3 to L2
-                    block = Block(address & self.UL2.get_base_address_mask(), block.is_dirty(), self.UL2.get_policy())
+                    outer = block
+                    block = Block(base, block.is_dirty(), self.UL2.get_policy())
                     block.read()
+                    block.link_lower(outer)
+                    outer.mark_present(IN_UL2)
 
                     cache = self.UL2
-                    evicted = cache.put(block)
+                    evicted = cache.put(block, l2_set)
                     if evicted:
-                        # If the evicted block is in L1, transition from L1 to L3, else L2 to L3
-                        if self.DL1.get(evicted.base_address()):
-                            self.stats.add_transition(self.DL1.name, self.UL3.name, evicted.base_address(), total_size=self.DL1.get_block_size())
-                            # If the evicted block is in L1, evict it too
-                            self.DL1.remove_base(evicted.base_address())
-                        elif self.IL1.get(evicted.base_address()):
-                            self.stats.add_transition(self.IL1.name, self.UL3.name, evicted.base_address(), total_size=self.IL1.get_block_size())
-                            # If the evicted block is in L1, evict it too
-                            self.IL1.remove_base(evicted.base_address())
-                        else:
-                            self.stats.add_transition(self.UL2.name, self.UL3.name, evicted.base_address(), total_size=self.UL2.get_block_size())
+                        self.stats.add_eviction(cache.name, evicted.base_address())
+                        self._back_invalidate_middle(evicted)
             else:
                 block.read()
                 # Guaranteed by inclusivity
-                self.UL3.get(address).touch()
+                block.lower().touch()
 
                 # Allocate new block from L2 to L1
-                block = Block(address & (self.DL1 if for_data else self.IL1).get_base_address_mask(), block.is_dirty(), (self.DL1 if for_data else self.IL1).get_policy())
+                middle = block
+                block = Block(base, block.is_dirty(), (self.DL1 if for_data else self.IL1).get_policy())
                 block.read()
+                present = IN_DL1 if for_data else IN_IL1
+                block.link_lower(middle)
+                middle.mark_present(present)
+                middle.lower().mark_present(present)
 
                 cache = self.DL1 if for_data else self.IL1
-                evicted = cache.put(block)
+                evicted = cache.put(block, l1_set)
                 if evicted:
+                    self.stats.add_eviction(cache.name, evicted.base_address())
                     self.stats.add_transition((self.DL1 if for_data else self.IL1).name, self.UL2.name, evicted.base_address(), total_size=(self.DL1 if for_data else self.IL1).get_block_size())
+                    middle = evicted.lower()
+                    middle.clear_present(present)
+                    middle.lower().clear_present(present)
+                    if self._deferred is not None:
+                        self._deferred.settle(evicted.base_address())
         else:
             block.read()
             # Guaranteed by inclusivity
-            self.UL2.get(address).touch()
-            self.UL3.get(address).touch()
+            middle = block.lower()
+            line = (base, block, middle, middle.lower())
+            if self._deferred is None:
+                line[2].touch()
+                line[3].touch()
+            else:
+                self._deferred.defer(base, middle, self._replacement_policy.clock(), 1, False)
+            self._last_line[cache.name] = line
 
         self._replacement_policy.step()
         self.stats.add_hit(address, hit_in.name, True, not for_data)
         self.stats.add_transition(hit_in.name, cache.name, address)
         return cache.name, hit_in.name, block
 
-    def perform_set(self, address, for_data=True):
+    def _perform_set(self, address, for_data=True, decoded=None):
+        base, l1_set, l2_set, l3_set = decoded if decoded is not None else self._decode(address)
         cache = self.DL1 if for_data else self.IL1
-        block = cache.get(address)
-        self.stats.add_latency(cache.write_latency, False)
+        block = cache.lookup_at(base, l1_set)
+        self.stats.add_latency(cache.write_latency, False, level=cache.name)
         hit_in = cache
         if block is None:
-            self.stats.add_miss(cache.name)
+            self._forget_last_lines()
+            if self._deferred is not None:
+                # The copies below are read or replaced next
+                self._deferred.settle(base)
+            self.stats.add_miss(cache.name, address)
             cache = self.UL2
-            block = cache.get(address)
-            self.stats.add_latency(cache.write_latency, False)
+            block = cache.lookup_at(base, l2_set)
+            self.stats.add_latency(cache.write_latency, False, level=cache.name)
             hit_in = self.UL2
             if block is None:
-                self.stats.add_miss(cache.name)
+                self.stats.add_miss(cache.name, address)
                 cache = self.UL3
-                block = cache.get(address)
-                self.stats.add_latency(cache.write_latency, False)
+                block = cache.lookup_at(base, l3_set)
+                self.stats.add_latency(cache.write_latency, False, level=cache.name)
                 hit_in = self.UL3
                 if block is None:
-                    self.stats.add_miss(cache.name)
+                    self.stats.add_miss(cache.name, address)
                     # Not in the cache, fetch from memory
-                    self.stats.add_latency(self.MEM.write_latency, False)
+                    self.stats.add_latency(self.MEM.write_latency, False, level=self.MEM.name)
                     # Don't allocate new block from MEM to L3 on write, write directly to memory
                     hit_in = self.MEM
                     cache = self.MEM
@@ -173,23 +280,141 @@ class ThreeLevelSUUInclusiveBypassingReadDownCacheSystem:
             else:
                 block.write()
                 # Guaranteed by inclusivity
-                self.UL3.get(address).write()
+                block.lower().write()
                 # Don't allocate new block from L2 to L1 on writes
         else:
             block.write()
             # Guaranteed by inclusivity
-            self.UL2.get(address).write()
-            self.UL3.get(address).write()
+            middle = block.lower()
+            line = (base, block, middle, middle.lower())
+            if self._deferred is None:
+                line[2].write()
+                line[3].write()
+            else:
+                self._deferred.defer(base, middle, self._replacement_policy.clock(), 1, True)
+            self._last_line[cache.name] = line
 
         self._replacement_policy.step()
         self.stats.add_hit(address, hit_in.name, False, not for_data)
         self.stats.add_transition(hit_in.name, cache.name, address)
         return cache.name, hit_in.name, block
 
+    def _perform_repeat(self, line, cache, address, for_data, is_fetch, count):
+        block = line[1]
+        cache.record_hits(address, count)
+        if self._deferred is not None:
+            # The copies below hear of the repeats once
+            for _ in range(count):
+                if is_fetch:
+                    block.read()
+                else:
+                    block.write()
+                self._replacement_policy.step()
+            self._deferred.defer(line[0], line[2], self._replacement_policy.clock() - 1, count, not is_fetch)
+        elif is_fetch:
+            for _ in range(count):
+                block.read()
+                line[2].touch()
+                line[3].touch()
+                self._replacement_policy.step()
+        else:
+            for _ in range(count):
+                block.write()
+                line[2].write()
+                line[3].write()
+                self._replacement_policy.step()
+        self.stats.add_repeat_hits(address, cache.name, is_fetch, not for_data, cache.read_latency if is_fetch else cache.write_latency, count)
+        return cache.name, cache.name, block
+
+    def _perform_coalesced(self, perform, address, for_data, is_fetch, count, decoded=None):
+        """
+        Perform count back to back identical accesses. Repeats of the line most recently hit in L1 only update the
+        replacement state of its copies and add their statistics in bulk, which gives the same results as performing
+        every access on its own
+        :param perform: The full access path, self._perform_fetch or self._perform_set
+        :param address: The address accessed
+        :param for_data: Whether the access goes to DL1 or IL1
+        :param is_fetch: Whether the access is a read or a write
+        :param count: The number of times the access is repeated
+        :param decoded: The address already decoded by this hierarchy's AddressDecoder, decoded here when None
+        :return: tuple (cache name, cache name hit in, block) for the last access
+        """
+        cache = self.DL1 if for_data else self.IL1
+        line = self._last_line[cache.name]
+        if line is None or line[0] != address & self._line_mask:
+            if decoded is None:
+                decoded = self._decode(address)
+            result = perform(address, for_data, decoded)
+            count -= 1
+            if count == 0:
+                return result
+            line = self._last_line[cache.name]
+            if line is None:
+                base, l1_set, l2_set, l3_set = decoded
+                block = cache.find(base, l1_set)
+                if block is None:
+                    # The access bypassed L1, so every repeat takes the full path again
+                    for _ in range(count):
+                        result = perform(address, for_data, decoded)
+                    return result
+                middle = block.lower()
+                line = (base, block, middle, middle.lower())
+                self._last_line[cache.name] = line
+        return self._perform_repeat(line, cache, address, for_data, is_fetch, count)
+
+    def perform_fetch(self, address, for_data=True, count=1):
+        return self._perform_coalesced(self._perform_fetch, address, for_data, True, count)
+
+    def perform_set(self, address, for_data=True, count=1):
+        return self._perform_coalesced(self._perform_set, address, for_data, False, count)
+
+    def perform_batch(self, records):
+        """
+        Perform a batch of accesses, decoding all of their addresses up front in one vectorized pass when the decoder
+        supports it
+        :param records: list of (address, is_data, is_fetch)
+        :return: None
+        """
+        coalesced = self._perform_coalesced
+        perform_fetch = self._perform_fetch
+        perform_set = self._perform_set
+        if not self._decoder.vectorized():
+            for address, for_data, is_fetch in records:
+                coalesced(perform_fetch if is_fetch else perform_set, address, for_data, is_fetch, 1)
+            return
+        for (address, for_data, is_fetch), decoded in zip(records, self._decoder.decode_batch([record[0] for record in records])):
+            coalesced(perform_fetch if is_fetch else perform_set, address, for_data, is_fetch, 1, decoded)
+
+    def preload(self, addresses, dirty=None, levels=None):
+        """
+        Fill the caches at once from a resident set, as captured by resident_set() or from a memory image, instead of
+        one populate() per address. See cache.resident_set.preload_inclusive
+        :param addresses: sequence of addresses, oldest first
+        :param dirty: sequence of dirty flags, all clean when None
+        :param levels: sequence of the innermost level name each address is loaded into, DL1 when None
+        :return: int, the number of addresses that made it into the level they target
+        """
+        self._forget_last_lines()
+        self._settle_deferred()
+        resident = preload_inclusive(self.UL3, self.UL2, {self.DL1.name: self.DL1, self.IL1.name: self.IL1}, addresses, dirty=dirty, levels=levels)
+        self._link_copies(resident_bases([self.UL3, self.UL2, self.DL1, self.IL1]))
+        return resident
+
+    def resident_set(self):
+        """
+        Capture the blocks resident in the caches, to be preloaded as the starting state of another run
+        :return: tuple (addresses, dirty, levels) of lists, oldest first
+        """
+        self._settle_deferred()
+        return resident_inclusive(self.UL3, self.UL2, {self.DL1.name: self.DL1, self.IL1.name: self.IL1})
+
     def populate(self, address, cache: Cache, dirty=False):
+        self._forget_last_lines()
+        self._settle_deferred()
         base_address = address & cache.get_base_address_mask()
         block = Block(base_address, dirty, self._replacement_policy)
         error = cache.put(block)
+        self._link_copies([base_address])
         if error is not None:
             raise EnvironmentError(
                 """Cold placement of the following address caused an eviction in the cache. You probably didn't want this.
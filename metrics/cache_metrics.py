@@ -1,4 +1,12 @@
 import bisect
+import heapq
+import math
+from array import array
+from metrics.interval_metrics import IntervalWriter
+from metrics.reuse_histogram import ReuseDistanceHistogram
+from metrics.footprint import HyperLogLog
+from metrics.interning import AddressInterner
+from metrics.regions import RegionMap
 
 
 class CacheMetrics:
@@ -6,12 +14,14 @@ class CacheMetrics:
     CacheMetrics tracks transitions, latencies and hits / misses for an entire cache system
     """
 
-    def __init__(self, caches: list, transition_pairs: list):
+    def __init__(self, caches: list, transition_pairs: list, interner: AddressInterner = None):
         """
         Initializer for the CacheMetrics class. Sets up metrics, initializes storage metadata, and handles logging
         :param caches: A list of cache.names
         :param transition_pairs: A list of tuples (cache.name, cache.name) representing all possible transition states
         from the cache list and any possible transition between them (from, to).
+        :param interner: The address to ID mapping indexing the per address state, see use_interner(). A private one is
+        filled online when None
         """
         self._accesses = 0
         self._instruction_accesses = 0
@@ -28,109 +38,692 @@ class CacheMetrics:
             self._caches[cache] = dict()
             self._caches[cache]['H'] = 0
             self._caches[cache]['M'] = 0
+            self._caches[cache]['E'] = 0
+        # The summed latency of the accesses served by every level
+        self._level_latency = dict.fromkeys(caches, 0)
 
-        self._transitions = dict()
         self._transition_pairs = transition_pairs
         self._address_tracker = dict()
+
+        self._interner = AddressInterner() if interner is None else interner
+        self._init_addresses()
+
+        # Interval streaming is off until stream_intervals() is called, the threshold then costs one compare per access
+        self._intervals = None
+        self._interval = 0
+        self._interval_index = 0
+        self._next_interval = float('inf')
+        self._interval_start = None
+
+        # Reuse distance histograms per cache, off until track_reuse() is called
+        self._reuse = None
+        self._reuse_offset_bits = 0
+
+        # Distinct block sketches per cache, per instruction / data stream and per interval, off until track_footprint()
+        self._footprint = None
+        self._footprint_streams = None
+        self._footprint_interval = None
+        self._footprint_offset_bits = 0
+
+        # Exact per address transitions, the main memory cost on long traces, can be turned off with track_addresses()
+        self._per_address = True
+
+        # Per region and per cache hits, misses, evictions and latency, off until track_regions() is called. The
+        # latency of an access is what was added since the previous hit, booked when the access hits
+        self._regions = None
+        self._region_counts = None
+        self._latency_mark = 0
+
+    def _init_addresses(self):
+        # Per address state lives in flat arrays indexed by the address's dense ID: one count array per transition
+        # pair, the accesses, the access time of the last access and the summed distances between accesses. IDs are
+        # per byte address, not per block, as the saved output is. A block's transitions reach every address seen
+        # within it, found by bisecting the sorted addresses in self._addresses
+        self._known = bytearray()
+        self._order = array('Q')
+        self._pair_counts = dict()
+        for transition in self._transition_pairs:
+            self._pair_counts.setdefault((transition[0], transition[1]), array('Q'))
+        self._address_accesses = array('Q')
+        self._last_access = array('q')
+        self._distances = array('Q')
         self._addresses = []
 
+    def blank(self):
+        """
+        Create empty metrics over the same caches and transitions, with none of the optional tracking turned on
+        :return: CacheMetrics
+        """
+        return CacheMetrics(list(self._caches), self._transition_pairs)
+
+    def merge(self, other):
+        """
+        Fold in the metrics of a run over the stretch of the trace that follows the one these metrics cover, as when a
+        trace is simulated in time slices. Counters and latencies add up, per address transitions add up with the later
+        run's access times shifted past these, and footprint sketches and reuse histograms are merged when both sides
+        track them. Interval streams are not merged
+        :param other: The CacheMetrics of the later run, over the same caches
+        :return: None
+        """
+        offset = self._accesses
+        self._accesses += other._accesses
+        self._instruction_accesses += other._instruction_accesses
+        self._data_accesses += other._data_accesses
+        self._read_accesses += other._read_accesses
+        self._write_accesses += other._write_accesses
+        self._average_latency += other._average_latency
+        self._average_read_latency += other._average_read_latency
+        self._average_write_latency += other._average_write_latency
+        for cache in other._caches:
+            for kind in ('H', 'M', 'E'):
+                self._caches[cache][kind] += other._caches[cache][kind]
+            self._level_latency[cache] += other._level_latency[cache]
+
+        added = []
+        for other_id in other._order:
+            address = other._interner.address(other_id)
+            address_id = self._known_id(address)
+            if address_id is None:
+                address_id = self._new_id(address)
+                added.append(address)
+            for pair, counts in self._pair_counts.items():
+                counts[address_id] += other._pair_counts[pair][other_id]
+            self._address_accesses[address_id] += other._address_accesses[other_id]
+            self._distances[address_id] += other._distances[other_id]
+            self._last_access[address_id] = other._last_access[other_id] + offset
+        if added:
+            self._addresses = list(heapq.merge(self._addresses, sorted(added)))
+
+        if self._footprint is not None and other._footprint is not None:
+            for cache in self._footprint:
+                self._footprint[cache].merge(other._footprint[cache])
+            for stream in self._footprint_streams:
+                self._footprint_streams[stream].merge(other._footprint_streams[stream])
+        if self._reuse is not None and other._reuse is not None:
+            for cache in self._reuse:
+                self._reuse[cache].merge(other._reuse[cache])
+        if self._region_counts is not None and other._region_counts is not None:
+            for cache in self._region_counts:
+                for kind, counts in self._region_counts[cache].items():
+                    for region, value in enumerate(other._region_counts[cache][kind]):
+                        counts[region] += value
+
+    def scale(self, factor):
+        """
+        Weigh the metrics, as when the run over one interval of a trace stands for several intervals like it. Counters,
+        per address transitions, accesses and distances, and region counts are multiplied and rounded to whole counts;
+        latencies are multiplied. Footprint sketches and reuse histograms measure distinct blocks and distances, which
+        do not grow with the weight, and are left as they are
+        :param factor: The weight, 0 or positive
+        :return: None
+        """
+        if factor < 0:
+            raise AttributeError("Field 'factor' must be 0 or positive")
+        self._accesses = round(self._accesses * factor)
+        self._instruction_accesses = round(self._instruction_accesses * factor)
+        self._data_accesses = round(self._data_accesses * factor)
+        self._read_accesses = round(self._read_accesses * factor)
+        self._write_accesses = round(self._write_accesses * factor)
+        self._average_latency *= factor
+        self._average_read_latency *= factor
+        self._average_write_latency *= factor
+        self._latency_mark = self._average_latency
+        for cache in self._caches:
+            for kind in ('H', 'M', 'E'):
+                self._caches[cache][kind] = round(self._caches[cache][kind] * factor)
+            self._level_latency[cache] *= factor
+
+        for pair, counts in self._pair_counts.items():
+            self._pair_counts[pair] = array('Q', (round(count * factor) for count in counts))
+        self._address_accesses = array('Q', (round(count * factor) for count in self._address_accesses))
+        self._distances = array('Q', (round(distance * factor) for distance in self._distances))
+
+        if self._region_counts is not None:
+            for counts in self._region_counts.values():
+                for kind in ('H', 'M', 'E'):
+                    counts[kind] = [round(count * factor) for count in counts[kind]]
+                counts['L'] = [latency * factor for latency in counts['L']]
+
+    def use_interner(self, interner: AddressInterner):
+        """
+        Index the per address state by the IDs of a shared interner, e.g. one built up front over a binary trace with
+        AddressInterner.build, instead of a private one filled online. Only possible before any address is seen
+        :param interner: The address to ID mapping
+        :return: None
+        """
+        if self._order:
+            raise AttributeError("The interner can only be replaced before any address is seen")
+        self._interner = interner
+
+    def interner(self):
+        """
+        Returns the address to ID mapping indexing the per address state
+        :return: metrics.interning.AddressInterner
+        """
+        return self._interner
+
+    def _known_id(self, address):
+        address_id = self._interner.get(address)
+        if address_id is None or address_id >= len(self._known) or not self._known[address_id]:
+            return None
+        return address_id
+
+    def _new_id(self, address):
+        address_id = self._interner.intern(address)
+        missing = address_id + 1 - len(self._known)
+        if missing > 0:
+            # Shared IDs may skip ahead of the arrays, fill them up to the new ID
+            zeros = bytes(8 * missing)
+            self._known.extend(bytes(missing))
+            for counts in self._pair_counts.values():
+                counts.frombytes(zeros)
+            self._address_accesses.frombytes(zeros)
+            self._last_access.frombytes(zeros)
+            self._distances.frombytes(zeros)
+        self._known[address_id] = 1
+        self._order.append(address_id)
+        self._last_access[address_id] = self._accesses
+        return address_id
+
     def _init_transition(self, address):
-        self._transitions[address] = dict()
+        address_id = self._new_id(address)
         bisect.insort(self._addresses, address)
-        for transition in self._transition_pairs:
-            self._transitions[address]["{}->{}".format(transition[0], transition[1])] = 0
-            self._transitions[address]["accesses"] = 0
-            self._transitions[address]["last-access"] = self._accesses
-            self._transitions[address]["avg-distance"] = 0
+        return address_id
 
-    def add_transition(self, t_from, t_to, address, total_size=0):
+    def add_transition(self, t_from, t_to, address, total_size=0, count=1):
         """
         Add a transition from one cache to another for a block / address
         :param t_from: The cache name where the block originated
         :param t_to: The cache name where the block is destined
         :param address: The address/block that is being moved
         :param total_size: The size of the block inputted, if its a block
+        :param count: The number of identical transitions to add at once
         :return:
         """
+        if not self._per_address:
+            return
         if total_size == 0:
-            if address not in self._transitions:
-                self._init_transition(address)
-            self._transitions[address]["{}->{}".format(t_from, t_to)] += 1
+            address_id = self._known_id(address)
+            if address_id is None:
+                address_id = self._init_transition(address)
+            self._pair_counts[(t_from, t_to)][address_id] += count
         else:
             start_addresses_index = bisect.bisect_left(self._addresses, address)
             while start_addresses_index < len(self._addresses) and self._addresses[start_addresses_index] - address < total_size:
-                self._transitions[self._addresses[start_addresses_index]]["{}->{}".format(t_from, t_to)] += 1
+                self._pair_counts[(t_from, t_to)][self._interner.get(self._addresses[start_addresses_index])] += 1
                 start_addresses_index += 1
 
-    def add_hit(self, address, hit_in, is_read, is_instruction):
+    def add_hit(self, address, hit_in, is_read, is_instruction, count=1):
         """
         Log a hit from the given cache
         :param address: The address of the block or item that was found
         :param hit_in: The Cache name where the hit occurred
         :param is_read: Whether the hit was for a read or write
         :param is_instruction: Whether the hit was for an instruction or for data
+        :param count: The number of back to back identical hits to log at once
         :return: None
         """
-        self._caches[hit_in]['H'] += 1
-        self._accesses += 1
+        self._caches[hit_in]['H'] += count
+        self._accesses += count
         if is_read:
-            self._read_accesses += 1
+            self._read_accesses += count
         else:
-            self._write_accesses += 1
+            self._write_accesses += count
         if is_instruction:
-            self._instruction_accesses += 1
+            self._instruction_accesses += count
         else:
-            self._data_accesses += 1
-        if address not in self._transitions:
-            self._init_transition(address)
-        self._transitions[address]["accesses"] += 1
-        self._transitions[address]["avg-distance"] += self._accesses - self._transitions[address]["last-access"]
-        self._transitions[address]["last-access"] = self._accesses
+            self._data_accesses += count
+        if self._per_address:
+            address_id = self._known_id(address)
+            if address_id is None:
+                address_id = self._init_transition(address)
+                # Only the first of the back to back hits is a first sighting, the others are one access apart
+                self._last_access[address_id] -= count - 1
+            self._address_accesses[address_id] += count
+            self._distances[address_id] += self._accesses - self._last_access[address_id]
+            self._last_access[address_id] = self._accesses
+        if self._reuse is not None:
+            self._reuse[hit_in].access(address >> self._reuse_offset_bits, count)
+        if self._regions is not None:
+            region = self._regions.lookup(address)
+            counts = self._region_counts[hit_in]
+            counts['H'][region] += count
+            counts['L'][region] += self._average_latency - self._latency_mark
+            self._latency_mark = self._average_latency
+        if self._footprint is not None:
+            block = address >> self._footprint_offset_bits
+            self._footprint[hit_in].add(block)
+            self._footprint_streams["I" if is_instruction else "D"].add(block)
+            self._footprint_interval.add(block)
+        if self._accesses >= self._next_interval:
+            self._write_interval()
 
-    def add_miss(self, miss_from):
+    def add_repeat_hits(self, address, hit_in, is_read, is_instruction, latency, count):
+        """
+        Log back to back identical hits in one cache along with their latency and their transitions, as add_latency,
+        add_hit and add_transition with a count would. A run crossing interval boundaries is split at them, so every
+        streamed interval holds exactly its own accesses
+        :param address: The address of the block or item that was found
+        :param hit_in: The Cache name where the hits occurred
+        :param is_read: Whether the hits were for reads or writes
+        :param is_instruction: Whether the hits were for instructions or for data
+        :param latency: The access time of one hit
+        :param count: The number of hits
+        :return: None
+        """
+        while count > self._next_interval - self._accesses:
+            part = self._next_interval - self._accesses
+            self.add_latency(latency, is_read, count=part, level=hit_in)
+            self.add_hit(address, hit_in, is_read, is_instruction, count=part)
+            self.add_transition(hit_in, hit_in, address, count=part)
+            count -= part
+        self.add_latency(latency, is_read, count=count, level=hit_in)
+        self.add_hit(address, hit_in, is_read, is_instruction, count=count)
+        self.add_transition(hit_in, hit_in, address, count=count)
+
+    def add_miss(self, miss_from, address=None):
         """
         Log a miss from the given cache
         :param miss_from: The Cache name where the miss occurred
+        :param address: The address that missed, used by the reuse distance histograms and the region stats
         :return: None
         """
         self._caches[miss_from]['M'] += 1
+        if self._regions is not None and address is not None:
+            self._region_counts[miss_from]['M'][self._regions.lookup(address)] += 1
+        if self._reuse is not None and address is not None:
+            self._reuse[miss_from].access(address >> self._reuse_offset_bits)
+        if self._footprint is not None and address is not None:
+            self._footprint[miss_from].add(address >> self._footprint_offset_bits)
 
-    def add_latency(self, access, is_read):
+    def add_eviction(self, evicted_from, address=None):
+        """
+        Log an eviction from the given cache
+        :param evicted_from: The Cache name a block was evicted from to make room
+        :param address: The base address of the evicted block, used by the region stats
+        :return: None
+        """
+        self._caches[evicted_from]['E'] += 1
+        if self._regions is not None and address is not None:
+            self._region_counts[evicted_from]['E'][self._regions.lookup(address)] += 1
+
+    def add_latency(self, access, is_read, count=1, level=None):
         """
         Add latency time with the given access time. Also specify if the latency was for a read or write
         :param access: The time in pre-described units in the cache definition
         :param is_read: Whether the access time was used for a read or write
+        :param count: The number of accesses that each took this time
+        :param level: The name of the cache that served the accesses, to also sum the latency per level
         :return: None
         """
+        if count != 1:
+            access *= count
+        if level is not None:
+            self._level_latency[level] += access
         self._average_latency += access
         if is_read:
             self._average_read_latency += access
         else:
             self._average_write_latency += access
 
+    def track_reuse(self, block_size, sample_rate=1.0, max_blocks=65536):
+        """
+        Start keeping reuse distance histograms for every cache, over the stream of blocks that reach it (its hits and
+        misses). See metrics.reuse_histogram for how memory is bounded
+        :param block_size: The size in bytes of a block, distances are measured between blocks
+        :param sample_rate: The initial fraction of blocks followed per cache
+        :param max_blocks: The maximum number of blocks followed per cache
+        :return: None
+        """
+        self._reuse_offset_bits = int(math.log(block_size, 2))
+        self._reuse = dict()
+        for cache in self._caches:
+            self._reuse[cache] = ReuseDistanceHistogram(sample_rate=sample_rate, max_blocks=max_blocks)
+
+    def reuse_histograms(self):
+        """
+        Returns the reuse distance histograms of every cache
+        :return: dict, cache name to metrics.reuse_histogram.ReuseDistanceHistogram, or None if reuse is not tracked
+        """
+        return self._reuse
+
+    def track_footprint(self, block_size, error=0.01):
+        """
+        Start estimating footprints, the number of distinct blocks, with HyperLogLog sketches of fixed size. Kept per
+        cache (blocks reaching it), per instruction and data stream, and per interval when streaming intervals. Call
+        before stream_intervals() for the interval footprint to be written
+        :param block_size: The size in bytes of a block, distinct blocks are counted
+        :param error: The relative standard error of the estimates, see metrics.footprint.HyperLogLog
+        :return: None
+        """
+        self._footprint_offset_bits = int(math.log(block_size, 2))
+        self._footprint = dict()
+        for cache in self._caches:
+            self._footprint[cache] = HyperLogLog(error=error)
+        self._footprint_streams = {"I": HyperLogLog(error=error), "D": HyperLogLog(error=error)}
+        self._footprint_interval = HyperLogLog(error=error)
+
+    def footprints(self):
+        """
+        Estimate the footprints tracked since track_footprint()
+        :return: dict, cache name or 'I' / 'D' / 'total' to the estimated number of distinct blocks, or None if
+        footprints are not tracked
+        """
+        if self._footprint is None:
+            return None
+        footprints = {cache: self._footprint[cache].count() for cache in self._footprint}
+        footprints["I"] = self._footprint_streams["I"].count()
+        footprints["D"] = self._footprint_streams["D"].count()
+        total = self._footprint_streams["I"].copy()
+        total.merge(self._footprint_streams["D"])
+        footprints["total"] = total.count()
+        return footprints
+
+    def track_regions(self, regions: RegionMap):
+        """
+        Start aggregating hits, misses, evictions and latency per region of a region map and per cache. Misses count
+        against the missing address's region, evictions against the evicted block's, and hits and the latency of the
+        access against the accessed address's region in the cache that served it. The cost per access is one region
+        lookup, whatever the number of distinct addresses
+        :param regions: The metrics.regions.RegionMap naming the regions
+        :return: None
+        """
+        self._regions = regions
+        self._region_counts = dict()
+        for cache in self._caches:
+            self._region_counts[cache] = {kind: [0] * len(regions) for kind in ('H', 'M', 'E', 'L')}
+        self._latency_mark = self._average_latency
+
+    def region_stats(self):
+        """
+        Collect the per region stats tracked since track_regions()
+        :return: dict, region name to cache name to dict of 'hits', 'misses', 'evictions' and 'latency', or None if
+        regions are not tracked
+        """
+        if self._regions is None:
+            return None
+        stats = dict()
+        for region, name in enumerate(self._regions.names):
+            stats[name] = dict()
+            for cache, counts in self._region_counts.items():
+                stats[name][cache] = {"hits": counts['H'][region], "misses": counts['M'][region],
+                                      "evictions": counts['E'][region], "latency": counts['L'][region]}
+        return stats
+
+    def save_regions(self, filename):
+        """
+        Save the per region stats as CSV, one row per region and cache that saw any activity
+        :param filename: The file to write
+        :return: None
+        """
+        lines = ["region,cache,hits,misses,evictions,latency,average-latency\n"]
+        for name, caches in self.region_stats().items():
+            for cache, row in caches.items():
+                if row["hits"] or row["misses"] or row["evictions"]:
+                    lines.append("{},{},{},{},{},{},{}\n".format(name, cache, row["hits"], row["misses"], row["evictions"], row["latency"],
+                                                               row["latency"] / row["hits"] if row["hits"] else 0))
+        with open(filename, 'w') as out:
+            out.writelines(lines)
+
+    def track_addresses(self, enabled):
+        """
+        Turn the exact per address transition tracking on or off. With it off, memory no longer grows with the number
+        of distinct addresses, and the transition stats in the output stay empty
+        :param enabled: Whether per address transitions are tracked
+        :return: None
+        """
+        self._per_address = enabled
+
+    def tracks_addresses(self):
+        """
+        Returns whether the exact per address transitions are tracked
+        :return: bool
+        """
+        return self._per_address
+
+    def drop_addresses(self):
+        """
+        Turn the per address transition tracking off, as track_addresses(False), and release the per address state
+        gathered so far. The leanest metrics mode, for runs about to exceed their memory budget. The interner is kept,
+        as it may be shared and its mapping saved, see use_interner()
+        :return: None
+        """
+        self._per_address = False
+        self._init_addresses()
+
+    def tracked_addresses(self):
+        """
+        Returns the number of distinct addresses per address state is kept for
+        :return: int, the number of addresses
+        """
+        return len(self._order)
+
+    def transition_count(self):
+        """
+        Returns the number of distinct transition pairs counted per address
+        :return: int, the number of pairs
+        """
+        return len(self._pair_counts)
+
+    def _interval_counters(self):
+        counters = [self._accesses]
+        for cache in self._caches:
+            counters += [self._caches[cache]['H'], self._caches[cache]['M'], self._caches[cache]['E']]
+        counters += [self._average_latency, self._average_read_latency, self._average_write_latency]
+        return counters + [self._level_latency[cache] for cache in self._caches]
+
+    def _write_interval(self):
+        counters = self._interval_counters()
+        record = [self._interval_index] + [now - then for now, then in zip(counters, self._interval_start)]
+        if self._footprint_interval is not None and "footprint" in self._intervals.columns:
+            record.append(round(self._footprint_interval.count()))
+            self._footprint_interval.clear()
+        self._intervals.write(record)
+        self._interval_start = counters
+        self._interval_index += 1
+        self._next_interval = self._accesses - self._accesses % self._interval + self._interval
+
+    def stream_intervals(self, filename, interval, binary=False):
+        """
+        Start streaming interval statistics. Every interval accesses the hits, misses and evictions of every cache and
+        the summed latencies of those accesses, overall, of the reads, of the writes and of every level, are appended to
+        the file as one record
+        :param filename: The file the intervals are streamed to
+        :param interval: The number of accesses per interval
+        :param binary: Whether the records are packed binary instead of CSV, see metrics.interval_metrics
+        :return: None
+        """
+        if interval < 1:
+            raise AttributeError("Field 'interval' must be a positive number of accesses")
+        extra_columns = ["footprint"] if self._footprint_interval is not None else None
+        self._intervals = IntervalWriter(filename, list(self._caches), binary=binary, extra_columns=extra_columns)
+        if self._footprint_interval is not None:
+            self._footprint_interval.clear()
+        self._interval = interval
+        self._interval_start = self._interval_counters()
+        self._next_interval = self._accesses - self._accesses % interval + interval
+
+    def close_intervals(self):
+        """
+        Stop streaming interval statistics, writing the trailing partial interval if it has any accesses
+        :return: None
+        """
+        if self._intervals is None:
+            return
+        if self._accesses > self._interval_start[0]:
+            self._write_interval()
+        self._intervals.close()
+        self._intervals = None
+        self._next_interval = float('inf')
+
+    def summary(self):
+        """
+        Collect the overall stats of the run, without the per address transitions
+        :return: dict, the hits, misses and evictions of every cache and the access counts and average latencies
+        """
+        summary = dict()
+        for cache in self._caches:
+            summary["{}-hits".format(cache)] = self._caches[cache]["H"]
+            summary["{}-misses".format(cache)] = self._caches[cache]["M"]
+            summary["{}-evictions".format(cache)] = self._caches[cache]["E"]
+        summary["accesses"] = self._accesses
+        summary["read-accesses"] = self._read_accesses
+        summary["write-accesses"] = self._write_accesses
+        summary["data-accesses"] = self._data_accesses
+        summary["instr-accesses"] = self._instruction_accesses
+        summary["average-latency"] = self._average_latency / (self._accesses if self._accesses > 0 else 1)
+        summary["average-read-latency"] = self._average_read_latency / (self._read_accesses if self._read_accesses > 0 else 1)
+        summary["average-write-latency"] = self._average_write_latency / (self._write_accesses if self._write_accesses > 0 else 1)
+        return summary
+
     def save(self, filename):
         """
-        Save the metrics for the run. Saves the overall stats, latencies, and transitions
+        Save the metrics for the run. Saves the overall stats, latencies, and transitions. The metrics are left
+        untouched, so this may be called mid run or more than once
         :param filename: The file or directory to where the output will be saved
         :return: None
         """
-        with open(filename, 'w') as out:
-            out.write("Overall Stats:\n")
-            for cache in self._caches:
-                out.write("{} - {} misses {} hits\n".format(cache, self._caches[cache]["M"], self._caches[cache]["H"]))
-            out.write("Total Accesses: {}\n".format(self._accesses))
-            out.write("Total Read Accesses: {}\n".format(self._read_accesses))
-            out.write("Total Write Accesses: {}\n".format(self._write_accesses))
-            out.write("Total Data Accesses: {}\n".format(self._data_accesses))
-            out.write("Total Instr Accesses: {}\n".format(self._instruction_accesses))
-            out.write("Average Latency: {}\n".format(self._average_latency / (self._accesses if self._accesses > 0 else 1)))
-            out.write("Average Read Latency: {}\n".format(self._average_read_latency / (self._read_accesses if self._read_accesses > 0 else 1)))
-            out.write("Average Write Latency: {}\n".format(self._average_write_latency / (self._write_accesses if self._write_accesses > 0 else 1)))
-
-            out.write("Transition Stats:\n")
-            header = " ".join(["{}->{}".format(t[0], t[1]) for t in self._transition_pairs])
-            out.write(header + "\n")
-            for address in self._transitions:
-                self._transitions[address]["avg-distance"] /= self._transitions[address]["accesses"] if self._transitions[address]["accesses"] > 0 else 1
-                del self._transitions[address]["last-access"]
-                out.write("{}:{}\n".format(hex(address), str(self._transitions[address])))
+        summary = self.summary()
+        lines = ["Overall Stats:\n"]
+        for cache in self._caches:
+            lines.append("{} - {} misses {} hits\n".format(cache, self._caches[cache]["M"], self._caches[cache]["H"]))
+        lines.append("Total Accesses: {}\n".format(self._accesses))
+        lines.append("Total Read Accesses: {}\n".format(self._read_accesses))
+        lines.append("Total Write Accesses: {}\n".format(self._write_accesses))
+        lines.append("Total Data Accesses: {}\n".format(self._data_accesses))
+        lines.append("Total Instr Accesses: {}\n".format(self._instruction_accesses))
+        lines.append("Average Latency: {}\n".format(summary["average-latency"]))
+        lines.append("Average Read Latency: {}\n".format(summary["average-read-latency"]))
+        lines.append("Average Write Latency: {}\n".format(summary["average-write-latency"]))
+
+        lines.append("Transition Stats:\n")
+        header = " ".join(["{}->{}".format(t[0], t[1]) for t in self._transition_pairs])
+        lines.append(header + "\n")
+        pairs = [("{}->{}".format(pair[0], pair[1]), counts) for pair, counts in self._pair_counts.items()]
+        for address_id in self._order:
+            accesses = self._address_accesses[address_id]
+            # The first pair, then the accesses and distance, then the other pairs
+            row = {pairs[0][0]: pairs[0][1][address_id], "accesses": accesses, "avg-distance": self._distances[address_id] / (accesses if accesses > 0 else 1)}
+            for name, counts in pairs[1:]:
+                row[name] = counts[address_id]
+            lines.append("{}:{}\n".format(hex(self._interner.address(address_id)), str(row)))
+
+        if self._footprint is not None:
+            lines.append("Footprint Stats:\n")
+            for name, blocks in self.footprints().items():
+                lines.append("{} - {} blocks\n".format(name, round(blocks)))
+
+        if self._reuse is not None:
+            lines.append("Reuse Distance Stats:\n")
+            for cache in self._reuse:
+                histogram = self._reuse[cache]
+                lines.append("{} - {} cold, sampling {}\n".format(cache, round(histogram.cold), histogram.sample_rate()))
+                for kind, buckets in (("time", histogram.time_buckets), ("stack", histogram.stack_buckets)):
+                    lines.append("{} {}: {}\n".format(cache, kind, " ".join(
+                        "{}={}".format(histogram.bucket_label(bucket), round(buckets[bucket])) for bucket in range(len(buckets)) if buckets[bucket] > 0
+                    )))
+
+        with open(filename, 'w', buffering=1 << 20) as out:
+            out.writelines(lines)
+
+    def columns(self):
+        """
+        Gather the per address counters as columns, ordered by address
+        :return: dict, column name to list of values. Holds 'address', 'accesses', 'avg-distance' and one column per
+        transition pair
+        """
+        ids = [self._interner.get(address) for address in self._addresses]
+        columns = {"address": list(self._addresses), "accesses": [], "avg-distance": []}
+        for address_id in ids:
+            accesses = self._address_accesses[address_id]
+            columns["accesses"].append(accesses)
+            columns["avg-distance"].append(self._distances[address_id] / (accesses if accesses > 0 else 1))
+        for pair, counts in self._pair_counts.items():
+            columns["{}->{}".format(pair[0], pair[1])] = [counts[address_id] for address_id in ids]
+        return columns
+
+    def export(self, filename, ids=False):
+        """
+        Export the overall stats and the per address counters in columnar form, without touching the metrics. A
+        filename ending in '.npz' is written as numpy arrays (requires numpy), anything else as CSV with a header row
+        and the overall stats as leading '# name: value' comment lines. Read back with metrics.cache_metrics.load_export
+        :param filename: The file to export to
+        :param ids: Whether to write the dense address IDs in an 'id' column instead of the addresses, decoded again by
+        load_export given the interner saved with AddressInterner.save
+        :return: None
+        """
+        columns = self.columns()
+        summary = self.summary()
+        if ids:
+            addresses = columns.pop("address")
+            columns = dict(id=[self._interner.get(address) for address in addresses], **columns)
+        if filename.endswith('.npz'):
+            import numpy
+            arrays = dict()
+            if ids:
+                arrays["id"] = numpy.array(columns["id"], dtype=numpy.uint64)
+            elif all(address <= 0xffffffffffffffff for address in columns["address"]):
+                arrays["address"] = numpy.array(columns["address"], dtype=numpy.uint64)
+            else:
+                arrays["address"] = numpy.array([hex(address) for address in columns["address"]])
+            for name in columns:
+                if name not in ("address", "id"):
+                    arrays[name] = numpy.array(columns[name], dtype=numpy.float64 if name == "avg-distance" else numpy.int64)
+            for name in summary:
+                arrays["summary/" + name] = numpy.array(summary[name])
+            numpy.savez(filename, **arrays)
+            return
+
+        names = list(columns)
+        lines = ["# {}: {}\n".format(name, summary[name]) for name in summary]
+        lines.append(",".join(names) + "\n")
+        if not ids:
+            columns["address"] = [hex(address) for address in columns["address"]]
+        for row in zip(*[columns[name] for name in names]):
+            lines.append(",".join(map(str, row)) + "\n")
+        with open(filename, 'w', buffering=1 << 20) as out:
+            out.writelines(lines)
+
+
+def load_export(filename, interner: AddressInterner = None):
+    """
+    Load the result of CacheMetrics.export
+    :param filename: The exported file, '.npz' or CSV
+    :param interner: The address mapping of an export written with IDs, to decode the 'id' column into an 'address'
+    column. The IDs are kept as they are when None
+    :return: tuple (summary, columns), a dict of the overall stats and a dict of column name to values
+    """
+    if filename.endswith('.npz'):
+        import numpy
+        with numpy.load(filename) as data:
+            summary = {name[len("summary/"):]: data[name].item() for name in data.files if name.startswith("summary/")}
+            columns = {name: data[name] for name in data.files if not name.startswith("summary/")}
+        if interner is not None and "id" in columns:
+            columns = dict(address=[interner.address(int(address_id)) for address_id in columns.pop("id")], **columns)
+        return summary, columns
+
+    summary = dict()
+    with open(filename, 'r') as fp:
+        line = fp.readline()
+        while line.startswith("# "):
+            name, value = line[2:].rstrip("\n").split(": ", 1)
+            try:
+                summary[name] = int(value)
+            except ValueError:
+                summary[name] = float(value)
+            line = fp.readline()
+        names = line.rstrip("\n").split(",")
+        columns = {name: [] for name in names}
+        for line in fp:
+            values = line.rstrip("\n").split(",")
+            if names[0] == "id":
+                columns["id"].append(int(values[0]))
+            else:
+                columns["address"].append(int(values[0], 16))
+            columns["accesses"].append(int(values[1]))
+            columns["avg-distance"].append(float(values[2]))
+            for name, value in zip(names[3:], values[3:]):
+                columns[name].append(int(value))
+    if interner is not None and "id" in columns:
+        columns = dict(address=[interner.address(address_id) for address_id in columns.pop("id")], **columns)
+    return summary, columns
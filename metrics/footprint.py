@@ -0,0 +1,95 @@
+import math
+
+
+def _mix(value):
+    """
+    Scramble an address into a uniformly distributed 64 bit hash (the splitmix64 finalizer)
+    :param value: The integer to hash
+    :return: int, the 64 bit hash
+    """
+    value = (value ^ (value >> 64)) & 0xffffffffffffffff
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct values added to it in a fixed amount of memory, one byte per register. The
+    relative standard error is about 1.04 / sqrt(registers)
+    """
+
+    def __init__(self, error=0.01):
+        """
+        Initializer for the sketch
+        :param error: The targeted relative standard error, which picks the number of registers
+        """
+        if not 0 < error < 1:
+            raise AttributeError("Field 'error' must be in (0, 1)")
+        self._precision = min(max(int(math.ceil(math.log((1.04 / error) ** 2, 2))), 4), 18)
+        self._registers = bytearray(1 << self._precision)
+        self._shift = 64 - self._precision
+        self._rest = (1 << self._shift) - 1
+
+    def add(self, value):
+        """
+        Add a value to the sketch
+        :param value: The integer, typically a block address, to add
+        :return: None
+        """
+        hashed = _mix(value)
+        register = hashed >> self._shift
+        rank = self._shift - (hashed & self._rest).bit_length() + 1
+        if rank > self._registers[register]:
+            self._registers[register] = rank
+
+    def count(self):
+        """
+        Estimate the number of distinct values added
+        :return: float, the estimate
+        """
+        registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        estimate = alpha * registers * registers / sum(2.0 ** -rank for rank in self._registers)
+        if estimate <= 2.5 * registers:
+            empty = self._registers.count(0)
+            if empty:
+                # Linear counting is more accurate while many registers are still empty
+                return registers * math.log(registers / empty)
+        return estimate
+
+    def merge(self, other):
+        """
+        Fold another sketch of the same precision into this one, giving the sketch of the union
+        :param other: The HyperLogLog to merge
+        :return: None
+        """
+        if len(other._registers) != len(self._registers):
+            raise AttributeError("Only sketches of the same precision can be merged")
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def copy(self):
+        """
+        Returns an independent copy of this sketch
+        :return: HyperLogLog
+        """
+        other = HyperLogLog.__new__(HyperLogLog)
+        other._precision = self._precision
+        other._registers = bytearray(self._registers)
+        other._shift = self._shift
+        other._rest = self._rest
+        return other
+
+    def clear(self):
+        """
+        Reset the sketch to empty
+        :return: None
+        """
+        self._registers = bytearray(len(self._registers))
+
+    def size(self):
+        """
+        Returns the memory held by the registers
+        :return: int, bytes
+        """
+        return len(self._registers)
@@ -0,0 +1,108 @@
+import struct
+from array import array
+from traces.trace_reader import read_trace
+
+INTERNER_MAGIC = b'PCSINT01'
+# (number of addresses, bytes per address) of a stored mapping, 8 for 64 bit address spaces and 16 beyond
+INTERNER_HEADER = struct.Struct('<QQ')
+
+_LOW_MASK = 0xffffffffffffffff
+
+
+class AddressInterner:
+    """
+    Maps every distinct address to a dense integer ID, handed out in order of first sight, so per address state can be
+    kept in flat arrays indexed by ID instead of dicts keyed by wide integers. The addresses are kept in an array of
+    64 bit integers, switching to a list only once an address does not fit. Addresses are interned as accessed, not
+    as block addresses: the per address output of CacheMetrics is keyed by the byte addresses of the trace, so
+    interning blocks would merge its rows. The one dict left, from address to ID, is only hashed once per access
+    """
+
+    def __init__(self):
+        """
+        Initializer for an empty interner
+        """
+        self._ids = dict()
+        self._addresses = array('Q')
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def intern(self, address):
+        """
+        Returns the ID of an address, handing out the next one on first sight
+        :param address: The address
+        :return: int, the ID
+        """
+        address_id = self._ids.get(address)
+        if address_id is None:
+            address_id = len(self._addresses)
+            self._ids[address] = address_id
+            if address > _LOW_MASK and isinstance(self._addresses, array):
+                self._addresses = list(self._addresses)
+            self._addresses.append(address)
+        return address_id
+
+    def get(self, address):
+        """
+        Returns the ID of an address without handing out a new one
+        :param address: The address
+        :return: int, the ID, or None if the address was never interned
+        """
+        return self._ids.get(address)
+
+    def address(self, address_id):
+        """
+        Decode an ID back to its address
+        :param address_id: The ID
+        :return: int, the address
+        """
+        return self._addresses[address_id]
+
+    def save(self, filename):
+        """
+        Store the mapping, the addresses in ID order
+        :param filename: The file to write
+        :return: None
+        """
+        wide = not isinstance(self._addresses, array)
+        with open(filename, 'wb') as out:
+            out.write(INTERNER_MAGIC)
+            out.write(INTERNER_HEADER.pack(len(self._addresses), 16 if wide else 8))
+            if wide:
+                out.write(b''.join(struct.pack('<QQ', address >> 64, address & _LOW_MASK) for address in self._addresses))
+            else:
+                self._addresses.tofile(out)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a mapping stored by save()
+        :param filename: The stored mapping
+        :return: AddressInterner
+        """
+        interner = cls()
+        with open(filename, 'rb') as fp:
+            if fp.read(len(INTERNER_MAGIC)) != INTERNER_MAGIC:
+                raise ValueError("'{}' is not a stored address mapping".format(filename))
+            count, width = INTERNER_HEADER.unpack(fp.read(INTERNER_HEADER.size))
+            if width == 8:
+                interner._addresses.fromfile(fp, count)
+            else:
+                interner._addresses = [high << 64 | low for high, low in struct.iter_unpack('<QQ', fp.read(count * 16))]
+        interner._ids = {address: address_id for address_id, address in enumerate(interner._addresses)}
+        return interner
+
+    @classmethod
+    def build(cls, filename):
+        """
+        Intern every address of a trace up front in one pass, so IDs follow the order of first sight in the trace.
+        Cheapest on binary traces, see traces.binary_trace
+        :param filename: The trace file
+        :return: AddressInterner
+        """
+        interner = cls()
+        intern = interner.intern
+        for address, _, _ in read_trace(filename):
+            intern(address)
+        return interner
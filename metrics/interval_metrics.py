@@ -0,0 +1,78 @@
+import struct
+
+
+class IntervalWriter:
+    """
+    Streams one fixed size record of per level counters for every interval of accesses. The file starts with a header
+    line naming the columns, followed by either one CSV line or one packed binary record per interval. The header of a
+    binary file is prefixed with '#binary '
+    """
+
+    def __init__(self, filename, caches: list, binary=False, extra_columns: list = None):
+        """
+        Initializer for the interval writer
+        :param filename: The file the intervals are streamed to
+        :param caches: A list of cache.names, in the order their columns are written
+        :param binary: Whether the records are packed little endian binary instead of CSV lines
+        :param extra_columns: Names of further integer columns written after the per level latencies
+        """
+        self._caches = caches
+        self._binary = binary
+        self.columns = ["interval", "accesses"]
+        for cache in caches:
+            self.columns += ["{}-hits".format(cache), "{}-misses".format(cache), "{}-evictions".format(cache)]
+        self.columns += ["latency", "read-latency", "write-latency"]
+        self.columns += ["{}-latency".format(cache) for cache in caches]
+        self.columns += extra_columns if extra_columns else []
+        self.record = _record_format(self.columns)
+
+        self._out = open(filename, 'wb' if binary else 'w')
+        header = ",".join(self.columns) + "\n"
+        self._out.write(("#binary " + header).encode('ascii') if binary else header)
+        self._out.flush()
+
+    def write(self, values):
+        """
+        Write the record of one interval
+        :param values: The values of one interval, in the order of self.columns
+        :return: None
+        """
+        if self._binary:
+            self._out.write(self.record.pack(*values))
+        else:
+            self._out.write(",".join(str(value) for value in values) + "\n")
+        self._out.flush()
+
+    def close(self):
+        """
+        Close the underlying file
+        :return: None
+        """
+        self._out.close()
+
+
+def _record_format(columns):
+    """
+    Returns the packed binary layout of a record, doubles for the latencies and unsigned 64 bit integers otherwise
+    :param columns: The column names
+    :return: struct.Struct
+    """
+    return struct.Struct('<' + ''.join('d' if column.endswith("latency") else 'Q' for column in columns))
+
+
+def load_intervals(filename):
+    """
+    Load an interval file written by IntervalWriter, CSV or binary
+    :param filename: The interval file
+    :return: list of dicts, one per interval, keyed by column name
+    """
+    with open(filename, 'rb') as fp:
+        header = fp.readline().decode('ascii').strip()
+        body = fp.read()
+    binary = header.startswith("#binary ")
+    columns = header[len("#binary "):].split(",") if binary else header.split(",")
+    if binary:
+        rows = _record_format(columns).iter_unpack(body)
+    else:
+        rows = ([float(value) if '.' in value else int(value) for value in line.split(",")] for line in body.decode('ascii').splitlines())
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,173 @@
+import sys
+from cache.block import Block
+from policies.replacement_policies import LFUReplacementPolicy, OPTReplacementPolicy, _SetHome
+
+_POINTER = 8
+# Bytes per entry of a large dict, slots and index included
+_DICT_ENTRY = sys.getsizeof({key: None for key in range(4096)}) / 4096
+_INT = sys.getsizeof(1 << 40)
+_SMALL_INT = sys.getsizeof(1)
+
+# The smallest number of blocks a reuse histogram is cut down to by a memory budget
+MIN_REUSE_BLOCKS = 1024
+
+
+def _levels(hierarchy):
+    return [hierarchy.IL1, hierarchy.DL1, hierarchy.UL2, hierarchy.UL3, hierarchy.MEM]
+
+
+def _block_bytes(cache):
+    # A resident block, its base address and its policy data
+    policy = cache.get_policy()
+    if isinstance(policy, LFUReplacementPolicy):
+        data = sys.getsizeof([0, None, 0]) + _SMALL_INT
+    elif isinstance(policy, OPTReplacementPolicy):
+        data = sys.getsizeof([0, None]) + _INT
+    else:
+        data = _INT
+    return sys.getsizeof(Block.__new__(Block)) + sys.getsizeof(cache.get_address_space()) + data
+
+
+def _policy_set_bytes(cache):
+    # The state a policy keeps per set, see policies.replacement_policies._SetHome
+    policy = cache.get_policy()
+    ways = cache.get_associativity()
+    home = sys.getsizeof(_SetHome(None)) + _DICT_ENTRY + _INT
+    if isinstance(policy, LFUReplacementPolicy):
+        # At worst every way in a bucket of its own
+        return home + sys.getsizeof({key: None for key in range(ways)}) + ways * (sys.getsizeof({0}) + _SMALL_INT)
+    if isinstance(policy, OPTReplacementPolicy):
+        # Up to four heap entries per way before a rebuild, the stale ones keeping evicted blocks alive
+        entry = sys.getsizeof((0, 0, None)) + 2 * _INT + _POINTER
+        return home + 4 * ways * entry + 3 * ways * _block_bytes(cache)
+    return 0
+
+
+def _address_bytes(stats):
+    # The arrays indexed by ID, the known flag, the first sight order, the sorted addresses and the interner's entry
+    arrays = (stats.transition_count() + 4) * _POINTER + 1
+    return arrays + _POINTER + _DICT_ENTRY + _POINTER + sys.getsizeof(1 << 63) + _INT
+
+
+def _reuse_block_bytes():
+    # A followed block's dict entry, entry list and hash heap entry, see metrics.reuse_histogram
+    entry = sys.getsizeof([0, 0, 0]) + 3 * _INT
+    return _DICT_ENTRY + _INT + entry + sys.getsizeof((0, 0)) + _POINTER
+
+
+class MemoryEstimator:
+    """
+    Predicts the peak memory of cache systems before a run and tracks it during the run, split into the caches
+    (their sets and resident blocks), the replacement policies' per set state, and the metrics (per address state and
+    reuse histograms). Caches and policies are priced full, as they are after warming up; the metrics grow with the
+    number of distinct addresses. Sizes are modelled from CPython object sizes, not measured, so they are estimates
+    """
+
+    def __init__(self, hierarchies: list):
+        """
+        Initializer for the memory estimator
+        :param hierarchies: The cache systems, each with its own stats
+        """
+        self.hierarchies = list(hierarchies)
+        self._caches = 0
+        self._policies = 0
+        for hierarchy in self.hierarchies:
+            for cache in _levels(hierarchy):
+                sets = cache.get_size() // cache.get_block_size() // cache.get_associativity()
+                lines = sets * cache.get_associativity()
+                self._caches += sets * (_DICT_ENTRY + _SMALL_INT + sys.getsizeof([None] * cache.get_associativity()))
+                self._caches += lines * _block_bytes(cache)
+                self._policies += sets * _policy_set_bytes(cache)
+
+    def _metrics(self, distinct=None):
+        total = 0
+        for hierarchy in self.hierarchies:
+            stats = hierarchy.stats
+            if stats.tracks_addresses():
+                addresses = stats.tracked_addresses() if distinct is None else distinct
+                total += addresses * _address_bytes(stats)
+            for histogram in (stats.reuse_histograms() or dict()).values():
+                blocks = histogram.followed() if distinct is None else min(histogram.max_blocks(), distinct)
+                total += blocks * _reuse_block_bytes() + max(2 * histogram.max_blocks(), MIN_REUSE_BLOCKS) * _POINTER
+        return int(total)
+
+    def estimate(self, distinct):
+        """
+        Predict the peak memory of a run
+        :param distinct: The number of distinct addresses the trace touches, at most its number of records
+        :return: dict, 'caches', 'policies', 'metrics' and 'total' to bytes
+        """
+        usage = {"caches": int(self._caches), "policies": int(self._policies), "metrics": self._metrics(distinct)}
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def usage(self):
+        """
+        Estimate the memory in use now, with the metrics at their current size
+        :return: dict, 'caches', 'policies', 'metrics' and 'total' to bytes
+        """
+        usage = {"caches": int(self._caches), "policies": int(self._policies), "metrics": self._metrics()}
+        usage["total"] = sum(usage.values())
+        return usage
+
+
+class MemoryBudget:
+    """
+    Keeps cache systems within a memory budget by switching their metrics to leaner modes instead of running out of
+    memory. The modes, in the order they are switched to: the reuse histograms follow a quarter of the blocks, down
+    to MIN_REUSE_BLOCKS, and then the exact per address transitions are dropped. The caches and policies are sized by
+    their configuration and are never cut
+    """
+
+    def __init__(self, hierarchies: list, budget: int):
+        """
+        Initializer for the memory budget
+        :param hierarchies: The cache systems, each with its own stats
+        :param budget: The memory budget in bytes
+        """
+        if budget <= 0:
+            raise AttributeError("Field 'budget' must be a positive number of bytes")
+        self.budget = budget
+        self.estimator = MemoryEstimator(hierarchies)
+        self.exceeded = False
+
+    def _leaner(self):
+        # Switch to the next leaner mode, returns its description or None when every mode is on
+        histograms = [histogram for hierarchy in self.estimator.hierarchies
+                      for histogram in (hierarchy.stats.reuse_histograms() or dict()).values()
+                      if histogram.max_blocks() > MIN_REUSE_BLOCKS]
+        if histograms:
+            for histogram in histograms:
+                histogram.limit(max(histogram.max_blocks() // 4, MIN_REUSE_BLOCKS))
+            return "reuse histograms follow at most {} blocks".format(max(histogram.max_blocks() for histogram in histograms))
+        dropping = [hierarchy.stats for hierarchy in self.estimator.hierarchies if hierarchy.stats.tracks_addresses()]
+        if dropping:
+            for stats in dropping:
+                stats.drop_addresses()
+            return "per address transitions dropped"
+        return None
+
+    def _fit(self, usage):
+        switched = []
+        while usage()["total"] > self.budget:
+            mode = self._leaner()
+            if mode is None:
+                self.exceeded = True
+                break
+            switched.append(mode)
+        return switched
+
+    def select(self, distinct):
+        """
+        Switch to the leaner modes needed up front, from the predicted peak of the run
+        :param distinct: The number of distinct addresses the trace touches, at most its number of records
+        :return: list of str, the modes switched to
+        """
+        return self._fit(lambda: self.estimator.estimate(distinct))
+
+    def check(self):
+        """
+        Switch to leaner modes while the memory in use is over budget, meant to be called periodically during a run
+        :return: list of str, the modes switched to, empty when within budget
+        """
+        return self._fit(self.estimator.usage)
@@ -0,0 +1,107 @@
+import bisect
+import re
+
+# The region of addresses outside every range of a map
+UNMAPPED = "[unmapped]"
+
+_MAPS_LINE = re.compile(r'^([0-9a-fA-F]+)-([0-9a-fA-F]+)\s+\S+\s+\S+\s+\S+\s+\S+\s*(.*)$')
+
+
+class RegionMap:
+    """
+    Names the regions of an address space, such as heap arenas, stacks or mapped buffers, from a list of non
+    overlapping address ranges kept sorted by start, so the region of an address is found by binary search in
+    O(log ranges) whatever the number of distinct addresses. Ranges sharing a name form one region. Region 0 is
+    UNMAPPED, for addresses outside every range
+    """
+
+    def __init__(self, ranges: list):
+        """
+        Initializer for the region map
+        :param ranges: list of (start, end, name), each covering [start, end)
+        """
+        ranges = sorted(ranges)
+        for (start, end, name), following in zip(ranges, ranges[1:] + [None]):
+            if end <= start:
+                raise AttributeError("Field 'ranges' must hold non empty ranges, '{}' is empty".format(name))
+            if following is not None and following[0] < end:
+                raise AttributeError("Field 'ranges' must not overlap, '{}' overlaps '{}'".format(name, following[2]))
+        self.names = [UNMAPPED]
+        ids = dict()
+        for _, _, name in ranges:
+            if name not in ids:
+                ids[name] = len(self.names)
+                self.names.append(name)
+        self._starts = [start for start, _, _ in ranges]
+        self._ends = [end for _, end, _ in ranges]
+        self._ids = [ids[name] for _, _, name in ranges]
+        # The range of the previous lookup, checked first as accesses cluster
+        self._last = (0, 0, 0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, address):
+        """
+        Find the region of an address
+        :param address: The address
+        :return: int, the region's index in names, 0 when unmapped
+        """
+        start, end, region = self._last
+        if start <= address < end:
+            return region
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index < 0 or address >= self._ends[index]:
+            return 0
+        self._last = (self._starts[index], self._ends[index], self._ids[index])
+        return self._ids[index]
+
+    @classmethod
+    def from_maps(cls, filename):
+        """
+        Load the mappings of a process as listed by /proc/<pid>/maps. Mappings are named by their path or pseudo path
+        such as [heap] or [stack], so every mapping of one file forms one region; anonymous mappings are each their
+        own region, named [anon:<start>]
+        :param filename: The maps file
+        :return: RegionMap
+        """
+        ranges = []
+        with open(filename, 'r') as fp:
+            for line in fp:
+                match = _MAPS_LINE.match(line.strip())
+                if match is None:
+                    continue
+                start, end = int(match.group(1), 16), int(match.group(2), 16)
+                ranges.append((start, end, match.group(3).strip() or "[anon:{}]".format(hex(start))))
+        return cls(ranges)
+
+    @classmethod
+    def from_ranges(cls, filename):
+        """
+        Load a list of ranges, one 'name start end' per line, separated by commas or blanks, with start and end in
+        decimal or 0x prefixed hex. Blank lines and lines starting with '#' are skipped
+        :param filename: The ranges file
+        :return: RegionMap
+        """
+        ranges = []
+        with open(filename, 'r') as fp:
+            for line in fp:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                name, start, end = line.replace(',', ' ').split()
+                ranges.append((int(start, 0), int(end, 0), name))
+        return cls(ranges)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a region map from a /proc/<pid>/maps listing or a list of ranges, told apart by their first line
+        :param filename: The maps or ranges file
+        :return: RegionMap
+        """
+        with open(filename, 'r') as fp:
+            for line in fp:
+                if line.strip() and not line.startswith('#'):
+                    return cls.from_maps(filename) if _MAPS_LINE.match(line.strip()) else cls.from_ranges(filename)
+        return cls([])
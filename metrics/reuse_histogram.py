@@ -0,0 +1,181 @@
+import heapq
+
+_HASH_MULTIPLIER = 0x9e3779b97f4a7c15
+_HASH_SPACE = 1 << 64
+
+
+class ReuseDistanceHistogram:
+    """
+    Tracks the reuse distances of the block stream seen by one cache, bucketed by powers of two. Two distances are
+    kept for every reuse: the time distance, the number of accesses since the block was last seen, and the stack
+    distance, the number of distinct blocks seen in between. Memory stays bounded by spatially sampling the blocks by a
+    hash of their address (as in SHARDS): only blocks whose hash falls under a threshold are followed, and when more
+    than max_blocks are followed the threshold is lowered. Counts are scaled by the sampling rate in effect when they
+    were recorded, so the histograms estimate the counts of the full stream
+    """
+
+    def __init__(self, sample_rate=1.0, max_blocks=65536):
+        """
+        Initializer for the reuse distance histogram
+        :param sample_rate: The initial fraction of blocks followed, in (0, 1]
+        :param max_blocks: The maximum number of blocks followed at once, bounding the memory used
+        """
+        if not 0 < sample_rate <= 1:
+            raise AttributeError("Field 'sample_rate' must be in (0, 1]")
+        self._threshold = int(sample_rate * _HASH_SPACE)
+        self._max_blocks = max_blocks
+        self._time = 0
+
+        # Followed blocks map to [hash, time of last access, position of last access in the stack tree]
+        self._blocks = dict()
+        self._by_hash = []
+
+        # Fenwick tree over access positions, holding a one at the last access position of every followed block
+        self._capacity = max(2 * max_blocks, 1024)
+        self._tree = [0] * (self._capacity + 1)
+        self._position = 0
+
+        self.cold = 0.0
+        self.time_buckets = []
+        self.stack_buckets = []
+
+    def sample_rate(self):
+        """
+        Returns the fraction of blocks currently followed
+        :return: float, the sampling rate
+        """
+        return self._threshold / _HASH_SPACE
+
+    def followed(self):
+        """
+        Returns the number of blocks currently followed
+        :return: int, the number of blocks
+        """
+        return len(self._blocks)
+
+    def max_blocks(self):
+        """
+        Returns the maximum number of blocks followed at once
+        :return: int, the number of blocks
+        """
+        return self._max_blocks
+
+    def limit(self, max_blocks):
+        """
+        Lower the maximum number of blocks followed mid run, dropping the blocks with the largest hashes as when the
+        maximum is reached and shrinking the stack tree along, to release memory. Raising the maximum has no effect
+        :param max_blocks: The new maximum number of blocks followed at once
+        :return: None
+        """
+        if max_blocks < 1:
+            raise AttributeError("Field 'max_blocks' must be at least 1")
+        if max_blocks >= self._max_blocks:
+            return
+        self._max_blocks = max_blocks
+        self._shrink()
+        self._by_hash = [(-entry[0], block) for block, entry in self._blocks.items()]
+        heapq.heapify(self._by_hash)
+        self._capacity = max(2 * max_blocks, 1024)
+        self._compact()
+
+    def _add(self, position, value):
+        while position <= self._capacity:
+            self._tree[position] += value
+            position += position & -position
+
+    def _prefix(self, position):
+        total = 0
+        while position > 0:
+            total += self._tree[position]
+            position -= position & -position
+        return total
+
+    def _compact(self):
+        # Renumber the followed blocks' last positions densely, in order, and rebuild the tree from scratch
+        followed = sorted(self._blocks.values(), key=lambda entry: entry[2])
+        self._tree = [0] * (self._capacity + 1)
+        for position, entry in enumerate(followed, 1):
+            entry[2] = position
+            self._tree[position] = 1
+        for position in range(1, self._capacity + 1):
+            parent = position + (position & -position)
+            if parent <= self._capacity:
+                self._tree[parent] += self._tree[position]
+        self._position = len(followed)
+
+    def _shrink(self):
+        # Stop following the block with the largest hash and lower the threshold to it
+        while len(self._blocks) > self._max_blocks:
+            negative_hash, block = heapq.heappop(self._by_hash)
+            entry = self._blocks.pop(block, None)
+            if entry is None or entry[0] != -negative_hash:
+                continue
+            self._add(entry[2], -1)
+            self._threshold = entry[0]
+
+    @staticmethod
+    def _bucket(buckets, distance, weight):
+        bucket = distance.bit_length()
+        while len(buckets) <= bucket:
+            buckets.append(0.0)
+        buckets[bucket] += weight
+
+    def access(self, block, count=1):
+        """
+        Record count back to back accesses to a block
+        :param block: The block address accessed
+        :param count: The number of back to back accesses
+        :return: None
+        """
+        self._time += count
+        block_hash = ((block * _HASH_MULTIPLIER) & (_HASH_SPACE - 1))
+        if block_hash >= self._threshold:
+            return
+        weight = _HASH_SPACE / self._threshold
+        if self._position == self._capacity:
+            self._compact()
+        entry = self._blocks.get(block)
+        if entry is None:
+            self.cold += weight
+            entry = [block_hash, 0, 0]
+            self._blocks[block] = entry
+            heapq.heappush(self._by_hash, (-block_hash, block))
+        else:
+            self._bucket(self.time_buckets, self._time - count + 1 - entry[1], weight)
+            distinct = self._prefix(self._position) - self._prefix(entry[2])
+            self._bucket(self.stack_buckets, int(distinct * weight), weight)
+            self._add(entry[2], -1)
+        if count > 1:
+            # The repeats are one access apart with no other block in between
+            self._bucket(self.time_buckets, 1, weight * (count - 1))
+            self._bucket(self.stack_buckets, 0, weight * (count - 1))
+        entry[1] = self._time
+
+        self._position += 1
+        entry[2] = self._position
+        self._add(self._position, 1)
+        if len(self._blocks) > self._max_blocks:
+            self._shrink()
+
+    @staticmethod
+    def bucket_label(bucket):
+        """
+        Returns the range of distances a bucket covers
+        :param bucket: The bucket index
+        :return: str, '0' for bucket 0, else '[2^(bucket-1), 2^bucket)'
+        """
+        return "0" if bucket == 0 else "[{}, {})".format(1 << (bucket - 1), 1 << bucket)
+
+    def merge(self, other):
+        """
+        Add the histograms of another stretch of the stream to these. Reuses spanning the two stretches are not seen,
+        their blocks count as cold in the later one
+        :param other: The ReuseDistanceHistogram to fold in
+        :return: None
+        """
+        self.cold += other.cold
+        for buckets, others in ((self.time_buckets, other.time_buckets), (self.stack_buckets, other.stack_buckets)):
+            while len(buckets) < len(others):
+                buckets.append(0.0)
+            for bucket, weight in enumerate(others):
+                buckets[bucket] += weight
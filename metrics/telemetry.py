@@ -0,0 +1,164 @@
+import http.server
+import json
+import os
+import resource
+import threading
+import time
+
+# Prometheus metric names are prefixed with this
+TELEMETRY_PREFIX = "pycachesim"
+
+
+def rss_bytes():
+    """
+    Returns the resident set size of this process, read from /proc where there is one, else the peak reported by
+    getrusage
+    :return: int, bytes
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class TelemetryExporter:
+    """
+    Publishes snapshots of a running simulation for schedulers and dashboards to watch: records done, accesses per
+    second overall and since the last snapshot, ETA, per level hit rates of every cache system and RSS. Snapshots are
+    written atomically to a file, served over HTTP on a local port, or both, as JSON or Prometheus text. The caller
+    hands in its position whenever it passes a checkpoint, e.g. every progress update; a snapshot is only taken once
+    period seconds have passed since the last one
+    """
+
+    def __init__(self, hierarchies: dict, total, filename=None, port=None, prometheus=False, period=10.0):
+        """
+        Initializer for the telemetry exporter
+        :param hierarchies: dict, configuration name to cache system, None naming a lone one
+        :param total: The number of records in the trace, for the ETA
+        :param filename: The file snapshots are written to, None to not write any
+        :param port: The local port snapshots are served on, None to not serve them
+        :param prometheus: Whether snapshots are Prometheus text instead of JSON
+        :param period: The least number of seconds between two snapshots
+        """
+        if filename is None and port is None:
+            raise AttributeError("Field 'filename' or 'port' must be given")
+        self.hierarchies = hierarchies
+        self.total = total
+        self.filename = filename
+        self.prometheus = prometheus
+        self.period = period
+
+        self._started = time.monotonic()
+        self._last_time = self._started
+        self._last_records = 0
+        self._body = b''
+
+        self._server = None
+        if port is not None:
+            exporter = self
+
+            class Handler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = exporter._body
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4' if exporter.prometheus else 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def update(self, records, force=False):
+        """
+        Take and publish a snapshot if period seconds have passed since the last one
+        :param records: The number of trace records simulated so far
+        :param force: Whether to take one regardless of the period, e.g. at the end of the run
+        :return: None
+        """
+        now = time.monotonic()
+        if not force and now - self._last_time < self.period:
+            return
+        snapshot = self.snapshot(records, now)
+        self._last_time = now
+        self._last_records = records
+        text = self._prometheus(snapshot) if self.prometheus else json.dumps(snapshot, indent=1) + "\n"
+        self._body = text.encode()
+        if self.filename is not None:
+            # Readers never see a half written snapshot
+            with open(self.filename + ".tmp", 'w') as out:
+                out.write(text)
+            os.replace(self.filename + ".tmp", self.filename)
+
+    def snapshot(self, records, now=None):
+        """
+        Collect the current state of the run
+        :param records: The number of trace records simulated so far
+        :param now: The time.monotonic() of the snapshot, the current time when None
+        :return: dict with 'records', 'total', 'elapsed', 'accesses-per-second', 'recent-accesses-per-second', 'eta',
+        'rss', 'time' (wall clock) and 'hit-rates', configuration name (or '' for a lone system) to level to hit rate
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = now - self._started
+        window = now - self._last_time
+        rate = records / elapsed if elapsed > 0 else 0.0
+        hit_rates = dict()
+        for name, hierarchy in self.hierarchies.items():
+            summary = hierarchy.stats.summary()
+            rates = dict()
+            for key in summary:
+                if key.endswith("-hits"):
+                    level = key[:-len("-hits")]
+                    accesses = summary[key] + summary[level + "-misses"]
+                    rates[level] = summary[key] / accesses if accesses > 0 else 0.0
+            hit_rates["" if name is None else name] = rates
+        return {
+            "records": records,
+            "total": self.total,
+            "elapsed": elapsed,
+            "accesses-per-second": rate,
+            "recent-accesses-per-second": (records - self._last_records) / window if window > 0 else rate,
+            "eta": (self.total - records) / rate if rate > 0 and self.total >= records else None,
+            "rss": rss_bytes(),
+            "hit-rates": hit_rates,
+            "time": time.time(),
+        }
+
+    @staticmethod
+    def _prometheus(snapshot):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP {}_{} {}\n".format(TELEMETRY_PREFIX, name, help_text))
+            lines.append("# TYPE {}_{} {}\n".format(TELEMETRY_PREFIX, name, kind))
+            for labels, value in samples:
+                lines.append("{}_{}{} {}\n".format(TELEMETRY_PREFIX, name, labels, value))
+
+        metric("records_total", "counter", "Trace records simulated", [("", snapshot["records"])])
+        metric("trace_records", "gauge", "Records in the trace", [("", snapshot["total"])])
+        metric("elapsed_seconds", "gauge", "Seconds since the run started", [("", snapshot["elapsed"])])
+        metric("accesses_per_second", "gauge", "Accesses simulated per second over the run", [("", snapshot["accesses-per-second"])])
+        metric("recent_accesses_per_second", "gauge", "Accesses simulated per second since the last snapshot", [("", snapshot["recent-accesses-per-second"])])
+        if snapshot["eta"] is not None:
+            metric("eta_seconds", "gauge", "Estimated seconds until the run finishes", [("", snapshot["eta"])])
+        metric("rss_bytes", "gauge", "Resident set size of the simulator", [("", snapshot["rss"])])
+        samples = []
+        for name, rates in snapshot["hit-rates"].items():
+            for level, rate in rates.items():
+                samples.append(('{{config="{}",level="{}"}}'.format(name, level), rate))
+        metric("hit_rate", "gauge", "Hits over hits and misses per cache level", samples)
+        return "".join(lines)
+
+    def close(self):
+        """
+        Stop serving snapshots
+        :return: None
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
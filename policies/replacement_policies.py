@@ -1,16 +1,47 @@
+import heapq
 import random
 
 
+class _SetHome:
+    """
+    The state a policy keeps per set when it follows set membership through placed() and removed()
+    """
+    __slots__ = ('cache_set', 'heap', 'buckets', 'smallest', 'touches')
+
+    def __init__(self, cache_set):
+        self.cache_set = cache_set
+        self.heap = []
+        self.buckets = dict()
+        self.smallest = 0
+        self.touches = 0
+
+    def __repr__(self):
+        return 'set'
+
+
 class BaseReplacementPolicy:
     """
     Defines the base set of features a replacement policy controls. These include its clock counter, its name, its
     default or instantiation number, its eviction properties, and its update / touch property
     """
-    def __init__(self):
+    # Whether a touch adds to a block's data, as a use count does, rather than replacing it, so touches held back and
+    # replayed later must be replayed one by one, see replay()
+    cumulative = False
+    # Whether a victim only depends on the data of the blocks in its set and not on the order the touches came in, so
+    # touches held back until the set picks its next victim give the same results
+    order_free = False
+    # Whether victims are drawn from the policy's random number generator, so results depend on its seed
+    randomized = False
+
+    def __init__(self, seed=None):
         """
         Assuming the policy is instantiated at startup and is not changing throughout execution
+        :param seed: The seed of the policy's own random number generator, so runs of randomized policies can be
+        reproduced independently of each other
         """
         self._clock = 0
+        self._seed = seed
+        self._random = random.Random(seed)
 
     @staticmethod
     def name():
@@ -20,6 +51,13 @@ class BaseReplacementPolicy:
         """
         return "Default"
 
+    def options(self):
+        """
+        The options this policy was created with that change its results, e.g. to tell runs apart in a result cache
+        :return: dict, option name to value, the seed for randomized policies
+        """
+        return {"seed": self._seed} if self.randomized else dict()
+
     def default(self):
         """
         The default value for a new block
@@ -50,12 +88,66 @@ class BaseReplacementPolicy:
         """
         self._clock += 1
 
+    def clock(self):
+        """
+        The current step counter
+        :return: int
+        """
+        return self._clock
+
+    def replay(self, block, clock, count):
+        """
+        Apply touches that were held back, as if they had happened at the time of the last of them
+        :param block: The block touched
+        :param clock: The step counter at the last of the touches
+        :param count: The number of touches
+        :return: None
+        """
+        now = self._clock
+        self._clock = clock
+        for _ in range(count if self.cumulative else 1):
+            block.touch()
+        self._clock = now
+
+    def placed(self, cache_set, way, block):
+        """
+        Called by the cache when a block is placed into a set
+        :param cache_set: The set the block was placed into
+        :param way: The index of the block in the set
+        :param block: The placed block
+        :return: None
+        """
+        pass
+
+    def removed(self, block):
+        """
+        Called by the cache when a block leaves its set, evicted, invalidated or rewritten
+        :param block: The removed block
+        :return: None
+        """
+        pass
+
+    def _random_other_way(self, cache_set):
+        # A random way other than the first one holding the largest policy data, picked by index without building the
+        # list of candidates
+        top = 0
+        top_data = cache_set[0].get_policy_data()
+        for way in range(1, len(cache_set)):
+            data = cache_set[way].get_policy_data()
+            if data > top_data:
+                top = way
+                top_data = data
+        way = self._random.randrange(len(cache_set) - 1)
+        return way + 1 if way >= top else way
+
 
 class LRUReplacementPolicy(BaseReplacementPolicy):
     """
     This defines the most commonly used eviction policy, LRU or Least Recently Used. This policy evicts the block in the
     set that was the last one to be touched, read, or updated. It is the oldest hit in the set
     """
+    order_free = True
+
     @staticmethod
     def name():
         """
@@ -86,6 +178,9 @@ class RandomReplacementPolicy(BaseReplacementPolicy):
     """
     This defines the RAND or Random replacement policy. This policy evicts a random block in the set
     """
+    order_free = True
+    randomized = True
+
     @staticmethod
     def name():
         """
@@ -100,14 +195,33 @@ class RandomReplacementPolicy(BaseReplacementPolicy):
         :param cache_set: The set on which to evict a block
         :return: the evicted block, assuming there is something to evicts
         """
-        return random.choice(cache_set)
+        return self._random.choice(cache_set)
 
 
 class LFUReplacementPolicy(BaseReplacementPolicy):
     """
     This defines the LFU or Least Frequently Used replacement policy. This policy evicts the block in the set that has
-    been accessed the least amount of times among all other blocks, regardless of insertion time.
+    been accessed the least amount of times among all other blocks, regardless of insertion time. Every set keeps its
+    ways bucketed by access count along with the smallest count, so a victim is found without scanning the set; ties
+    go to the lowest way, as with a scan. With aging on, the counts in a set are halved every aging_period touches to
+    the set, so blocks that were hot long ago do not stay resident forever
     """
+    cumulative = True
+
+    def __init__(self, aging_period=0, seed=None):
+        """
+        Initializer for the LFU policy
+        :param aging_period: The number of touches to a set between two halvings of its counts, 0 to never age
+        :param seed: The seed of the policy's random number generator, unused by LFU
+        """
+        super().__init__(seed=seed)
+        if aging_period < 0:
+            raise AttributeError("Field 'aging_period' must be 0 or positive")
+        self._aging_period = aging_period
+        # Halvings depend on which touches came before them
+        self.order_free = aging_period == 0
+        self._homes = dict()
+
     @staticmethod
     def name():
         """
@@ -116,12 +230,38 @@ class LFUReplacementPolicy(BaseReplacementPolicy):
         """
         return 'LFU'
 
+    def options(self):
+        """
+        The options this policy was created with that change its results
+        :return: dict, the aging period
+        """
+        return {"aging_period": self._aging_period}
+
     def default(self):
         """
-        The default value for a new block in LFU is zero
-        :return: The current clock cycle
+        The default value for a new block in LFU is zero. The data is the list [count, home, way], where home is the
+        state of the set holding the block
+        :return: The policy data of a new block
         """
-        return 0
+        return [0, None, 0]
+
+    @staticmethod
+    def _bucket_out(buckets, count, way):
+        ways = buckets[count]
+        ways.discard(way)
+        if not ways:
+            del buckets[count]
+
+    def _age(self, home):
+        buckets = dict()
+        for way, resident in enumerate(home.cache_set):
+            if resident is not None and resident.get_policy_data()[1] is home:
+                data = resident.get_policy_data()
+                data[0] >>= 1
+                buckets.setdefault(data[0], set()).add(way)
+        home.buckets = buckets
+        home.smallest = min(buckets) if buckets else 0
+        home.touches = 0
 
     def touch(self, block):
         """
@@ -129,7 +269,62 @@ class LFUReplacementPolicy(BaseReplacementPolicy):
         :param block: The block to update
         :return: The new data that should be stored in the blocks metadata section
         """
-        return block.get_policy_data() + 1
+        data = block.get_policy_data()
+        home = data[1]
+        if home is None:
+            data[0] += 1
+            return data
+        buckets = home.buckets
+        count = data[0]
+        self._bucket_out(buckets, count, data[2])
+        if count == home.smallest and count not in buckets:
+            home.smallest = count + 1
+        data[0] = count + 1
+        ways = buckets.get(count + 1)
+        if ways is None:
+            buckets[count + 1] = {data[2]}
+        else:
+            ways.add(data[2])
+        if self._aging_period:
+            home.touches += 1
+            if home.touches >= self._aging_period:
+                self._age(home)
+        return data
+
+    def placed(self, cache_set, way, block):
+        """
+        Start following the block in the buckets of its set
+        :param cache_set: The set the block was placed into
+        :param way: The index of the block in the set
+        :param block: The placed block
+        :return: None
+        """
+        home = self._homes.get(id(cache_set))
+        if home is None:
+            home = _SetHome(cache_set)
+            self._homes[id(cache_set)] = home
+        data = block.get_policy_data()
+        data[1] = home
+        data[2] = way
+        buckets = home.buckets
+        if not buckets or data[0] < home.smallest:
+            home.smallest = data[0]
+        ways = buckets.get(data[0])
+        if ways is None:
+            buckets[data[0]] = {way}
+        else:
+            ways.add(way)
+
+    def removed(self, block):
+        """
+        Stop following the block
+        :param block: The removed block
+        :return: None
+        """
+        data = block.get_policy_data()
+        if data[1] is not None:
+            self._bucket_out(data[1].buckets, data[0], data[2])
+            data[1] = None
 
     def evict(self, cache_set):
         """
@@ -137,8 +332,12 @@ class LFUReplacementPolicy(BaseReplacementPolicy):
         :param cache_set: The set on which to evict a block
         :return: the evicted block, assuming there is something to evicts
         """
-        smallest = min(cache_set, key=lambda block: block.get_policy_data())
-        return smallest
+        home = self._homes[id(cache_set)]
+        buckets = home.buckets
+        if home.smallest not in buckets:
+            # The smallest count left when a block was invalidated
+            home.smallest = min(buckets)
+        return cache_set[min(buckets[home.smallest])]
 
 
 class NMFUReplacementPolicy(BaseReplacementPolicy):
@@ -146,6 +345,10 @@ class NMFUReplacementPolicy(BaseReplacementPolicy):
     This defines the NMFU or Not Most Frequently Used replacement policy. This policy evicts a random block from the set
     with the condition that it is not the most frequently used among the set
     """
+    cumulative = True
+    order_free = True
+    randomized = True
+
     @staticmethod
     def name():
         """
@@ -175,8 +378,7 @@ class NMFUReplacementPolicy(BaseReplacementPolicy):
         :param cache_set: The set on which to evict a block
         :return: the evicted block, assuming there is something to evicts
         """
-        mfu = max(cache_set, key=lambda block: block.get_policy_data())
-        return random.choice([block for block in cache_set if block != mfu])
+        return cache_set[self._random_other_way(cache_set)]
 
 
 class NMRUReplacementPolicy(BaseReplacementPolicy):
@@ -184,6 +386,9 @@ class NMRUReplacementPolicy(BaseReplacementPolicy):
     This defines the NMRU or Not Most Recently Used replacement policy. This policy evicts a random block from the set
     with the condition that it is not the most recently used among the set
     """
+    order_free = True
+    randomized = True
+
     @staticmethod
     def name():
         """
@@ -206,5 +411,114 @@ class NMRUReplacementPolicy(BaseReplacementPolicy):
         :param cache_set: The set on which to evict a block
         :return: the evicted block, assuming there is something to evicts
         """
-        mru = max(cache_set, key=lambda block: block.get_policy_data())
-        return random.choice([block for block in cache_set if block != mru])
+        return cache_set[self._random_other_way(cache_set)]
+
+
+class OPTReplacementPolicy(BaseReplacementPolicy):
+    """
+    This defines Belady's OPT or optimal replacement policy. This policy evicts the block in the set whose next use lies
+    furthest in the future, which gives the fewest misses any policy can reach and so bounds what the other policies
+    could still gain. The future comes from next use positions precomputed over the trace, see traces.next_use. Every
+    set keeps a heap of its blocks by next use, so a victim is found in O(log ways); stale heap entries are skipped
+    when they surface and the heap is rebuilt once they outnumber the live blocks
+    """
+    def __init__(self, next_use, position=0, seed=None):
+        """
+        Initializer for the OPT policy
+        :param next_use: The next use position of every access, as built by traces.next_use.build_next_use over the
+        same trace and block size the caches use
+        :param position: The position in the trace of the first access simulated, when starting mid trace
+        :param seed: The seed of the policy's random number generator, unused by OPT
+        """
+        super().__init__(seed=seed)
+        self._clock = position
+        self._position = position
+        self._next_use = next_use
+        self._homes = dict()
+        self._pushes = 0
+
+    @staticmethod
+    def name():
+        """
+        The name of this policy
+        :return: str
+        """
+        return 'OPT'
+
+    def options(self):
+        """
+        The options this policy was created with that change its results
+        :return: dict, the position of the first access simulated
+        """
+        return {"position": self._position}
+
+    def default(self):
+        """
+        The default value for a new block is its next use, with no set yet. The data is the list [next use, home],
+        where home is the state of the set holding the block
+        :return: The policy data of a new block
+        """
+        return [self._next_use[self._clock], None]
+
+    def _push(self, home, block, data):
+        heap = home.heap
+        self._pushes += 1
+        heapq.heappush(heap, (-data[0], self._pushes, block))
+        if len(heap) > 4 * len(home.cache_set):
+            # Mostly stale entries, rebuild from the blocks in the set
+            heap.clear()
+            for resident in home.cache_set:
+                if resident is not None and resident.get_policy_data()[1] is home:
+                    self._pushes += 1
+                    heap.append((-resident.get_policy_data()[0], self._pushes, resident))
+            heapq.heapify(heap)
+
+    def touch(self, block):
+        """
+        Update the block's replacement policy metadata
+        :param block: The block to update
+        :return: The new data that should be stored in the blocks metadata section
+        """
+        data = block.get_policy_data()
+        data[0] = self._next_use[self._clock]
+        if data[1] is not None:
+            self._push(data[1], block, data)
+        return data
+
+    def placed(self, cache_set, way, block):
+        """
+        Start following the block in the heap of its set
+        :param cache_set: The set the block was placed into
+        :param way: The index of the block in the set
+        :param block: The placed block
+        :return: None
+        """
+        home = self._homes.get(id(cache_set))
+        if home is None:
+            home = _SetHome(cache_set)
+            self._homes[id(cache_set)] = home
+        data = block.get_policy_data()
+        data[1] = home
+        self._push(home, block, data)
+
+    def removed(self, block):
+        """
+        Stop following the block, its heap entries turn stale
+        :param block: The removed block
+        :return: None
+        """
+        block.get_policy_data()[1] = None
+
+    def evict(self, cache_set):
+        """
+        Evict a block from the given set by the property defined in this policy
+        :param cache_set: The set on which to evict a block
+        :return: the evicted block, assuming there is something to evicts
+        """
+        home = self._homes[id(cache_set)]
+        heap = home.heap
+        while True:
+            negative_next_use, _, block = heapq.heappop(heap)
+            data = block.get_policy_data()
+            if data[1] is home and data[0] == -negative_next_use:
+                return block
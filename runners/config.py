@@ -0,0 +1,87 @@
+import json
+from system.system import AddressSpace
+from policies.replacement_policies import BaseReplacementPolicy, OPTReplacementPolicy
+from hierarchies.three_level_suu_inclusive_cache_system import ThreeLevelSUUInclusiveCacheSystem
+from hierarchies.three_level_suu_inclusive_bypassing_readdown_cache_system import ThreeLevelSUUInclusiveBypassingReadDownCacheSystem
+from hierarchies.three_level_suu_inclusive_bypassing_readwritedown_cache_system import ThreeLevelSUUInclusiveBypassingReadWriteDownCacheSystem
+
+# The hierarchy classes a config may name
+HIERARCHIES = {
+    "inclusive": ThreeLevelSUUInclusiveCacheSystem,
+    "bypassing-readdown": ThreeLevelSUUInclusiveBypassingReadDownCacheSystem,
+    "bypassing-readwritedown": ThreeLevelSUUInclusiveBypassingReadWriteDownCacheSystem,
+}
+
+
+def _policies(base=BaseReplacementPolicy):
+    policies = dict()
+    for policy in base.__subclasses__():
+        policies[policy.name()] = policy
+        policies.update(_policies(policy))
+    return policies
+
+
+def load_configs(filename):
+    """
+    Read hierarchy configurations from a JSON file holding a list of objects, each with the keys
+        name: A unique name for the configuration, used to label its results
+        hierarchy: One of the HIERARCHIES keys, 'inclusive' by default
+        space: An AddressSpace member name, 'in64Bit' by default
+        policy: A replacement policy name as returned by its name(), e.g. 'LRU'
+        policy_options: Optional keyword arguments of the policy, e.g. {"seed": 1} or {"aging_period": 1024}
+        sizes: The I/DL1, UL2 and UL3 sizes in bytes
+        associativities: The I/DL1, UL2 and UL3 associativities
+        blocksize: The block size in bytes
+        latencies: Optional [read, write] latencies of I/DL1, UL2, UL3 and MEM
+        recency: Optional 'exact' or 'approximate' to hold back the touches L1 hits make to the levels below, see the
+        hierarchies' defer_recency()
+    :param filename: The JSON config file
+    :return: list of dict, the configurations
+    """
+    with open(filename) as fp:
+        configs = json.load(fp)
+    if not isinstance(configs, list) or not configs:
+        raise AttributeError("Config file '{}' must hold a non empty list of configurations".format(filename))
+    names = set()
+    for config in configs:
+        for key in ("name", "policy", "sizes", "associativities", "blocksize"):
+            if key not in config:
+                raise AttributeError("Configuration {} is missing field '{}'".format(config.get("name", len(names)), key))
+        if config["name"] in names:
+            raise AttributeError("Configuration name '{}' is used more than once".format(config["name"]))
+        names.add(config["name"])
+    return configs
+
+
+def build_hierarchy(config, next_use=None):
+    """
+    Create the cache system a configuration describes, with a replacement policy instance of its own
+    :param config: One configuration as returned by load_configs
+    :param next_use: The next use positions of the trace at the configuration's block size, required by the 'OPT'
+    policy, see traces.next_use
+    :return: The cache system
+    """
+    hierarchy = HIERARCHIES.get(config.get("hierarchy", "inclusive"))
+    if hierarchy is None:
+        raise AttributeError("Field 'hierarchy' must be one of {}".format(", ".join(HIERARCHIES)))
+    policies = _policies()
+    if config["policy"] not in policies:
+        raise AttributeError("Field 'policy' must be one of {}".format(", ".join(policies)))
+    if policies[config["policy"]] is OPTReplacementPolicy:
+        if next_use is None:
+            raise AttributeError("The 'OPT' policy needs the next use positions of the trace")
+        policy = OPTReplacementPolicy(next_use, **config.get("policy_options", {}))
+    else:
+        policy = policies[config["policy"]](**config.get("policy_options", {}))
+    latencies = config.get("latencies")
+    hierarchy = hierarchy(
+        AddressSpace[config.get("space", "in64Bit")],
+        policy,
+        list(config["sizes"]),
+        list(config["associativities"]),
+        config["blocksize"],
+        level_latencies=[tuple(level) for level in latencies] if latencies else None
+    )
+    if config.get("recency") is not None:
+        hierarchy.defer_recency(config["recency"])
+    return hierarchy
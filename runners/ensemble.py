@@ -0,0 +1,131 @@
+import math
+import multiprocessing
+import os
+import statistics
+import tempfile
+from runners.replay import replay
+from traces.binary_trace import is_binary_trace, read_mapped, write_binary_trace
+from traces.trace_reader import read_trace
+
+
+def _t_quantile(probability, freedom):
+    """
+    The quantile of Student's t distribution, exact for one and two degrees of freedom and from Hill's expansion around
+    the normal quantile beyond, within 1% of the tables from three degrees of freedom on
+    :param probability: The cumulative probability, above 0.5
+    :param freedom: The degrees of freedom, at least 1
+    :return: float, the quantile
+    """
+    if freedom == 1:
+        return math.tan(math.pi * (probability - 0.5))
+    if freedom == 2:
+        return (2 * probability - 1) / math.sqrt(2 * probability * (1 - probability))
+    z = statistics.NormalDist().inv_cdf(probability)
+    return (z + (z ** 3 + z) / (4 * freedom)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * freedom ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * freedom ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * freedom ** 4))
+
+
+def confidence_interval(values, confidence=0.95):
+    """
+    The mean of samples and the half width of its two sided Student t confidence interval
+    :param values: list of numbers, at least two
+    :param confidence: The confidence level of the interval
+    :return: tuple (mean, half width)
+    """
+    if not 0 < confidence < 1:
+        raise AttributeError("Field 'confidence' must be between 0 and 1")
+    if len(values) < 2:
+        raise AttributeError("Field 'values' must hold at least two samples")
+    mean = statistics.fmean(values)
+    return mean, _t_quantile((1 + confidence) / 2, len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values))
+
+
+def _run_replica(factory, filename, seed):
+    """
+    Worker process body. Simulates the whole trace on a fresh hierarchy whose randomized policy draws from the seed
+    :param factory: Picklable callable taking a seed keyword and returning a fresh cache system
+    :param filename: The binary trace file
+    :param seed: The seed of the replica
+    :return: dict, the summary of the replica's stats
+    """
+    hierarchy = factory(seed=seed)
+    replay(hierarchy, read_mapped(filename))
+    return hierarchy.stats.summary()
+
+
+def _run_replica_star(work):
+    # Pool.imap hands over one argument
+    return _run_replica(*work)
+
+
+def _converged(intervals, tolerance):
+    for mean, half_width in intervals.values():
+        if half_width > (tolerance * abs(mean) if mean else tolerance):
+            return False
+    return True
+
+
+def simulate_ensemble(factory, filename, replicas, seed=0, processes=None, confidence=0.95, tolerance=None,
+                      minimum=3, block_size=None):
+    """
+    Run seeded replicas of a hierarchy with a randomized replacement policy over one trace in parallel, and report the
+    mean and confidence interval of every summary field. Replica i uses seed + i, so an ensemble is reproducible, and
+    replicas are taken in seed order, so stopping early gives the same result whatever the number of processes. Every
+    replica reads the trace through a memory map of one binary trace, the trace itself if binary or else a temporary
+    binary copy written once up front
+    :param factory: Picklable callable taking a seed keyword and returning a fresh cache system with its stats options
+    set, e.g. a functools.partial of a module level function
+    :param filename: The trace file
+    :param replicas: The largest number of replicas
+    :param seed: The seed of the first replica
+    :param processes: The number of worker processes, the number of CPUs when None
+    :param confidence: The confidence level of the intervals
+    :param tolerance: Stop once every interval's half width is within this fraction of its mean, or within it in
+    absolute terms for zero means, None to run every replica
+    :param minimum: The least number of replicas before stopping early, at least 2
+    :param block_size: The block size accesses crossing a block boundary are split at when copying a trace that is not
+    binary, the factory's L1 block size when None
+    :return: dict with 'replicas', the number run, 'seeds', 'mean' and 'half-width' per summary field, 'confidence',
+    'converged', whether the tolerance was met, and 'samples', the summary of every replica in seed order
+    """
+    if replicas < 2:
+        raise AttributeError("Field 'replicas' must be at least 2")
+    minimum = max(min(minimum, replicas), 2)
+    probe = factory(seed=seed)
+    if not probe.DL1.get_policy().randomized:
+        raise AttributeError("Field 'factory' must build hierarchies with a randomized policy, replicas of {} would all give the same results".format(probe.DL1.get_policy().name()))
+    copy = None
+    if not is_binary_trace(filename):
+        if block_size is None:
+            block_size = probe.DL1.get_block_size()
+        descriptor, copy = tempfile.mkstemp(suffix='.bin')
+        os.close(descriptor)
+        write_binary_trace(copy, read_trace(filename, block_size=block_size))
+    try:
+        samples = []
+        intervals = dict()
+        work = [(factory, copy or filename, seed + replica) for replica in range(replicas)]
+        with multiprocessing.Pool(processes=min(processes or multiprocessing.cpu_count(), replicas)) as pool:
+            # Leaving the pool terminates the replicas still running once the intervals are tight enough
+            for summary in pool.imap(_run_replica_star, work):
+                samples.append(summary)
+                if len(samples) < minimum:
+                    continue
+                intervals = {name: confidence_interval([sample[name] for sample in samples], confidence)
+                             for name in samples[0]}
+                if tolerance is not None and _converged(intervals, tolerance):
+                    break
+    finally:
+        if copy is not None:
+            os.remove(copy)
+    return {
+        "replicas": len(samples),
+        "seeds": [seed + replica for replica in range(len(samples))],
+        "mean": {name: interval[0] for name, interval in intervals.items()},
+        "half-width": {name: interval[1] for name, interval in intervals.items()},
+        "confidence": confidence,
+        "converged": tolerance is not None and _converged(intervals, tolerance),
+        "samples": samples,
+    }
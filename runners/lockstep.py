@@ -0,0 +1,84 @@
+class LockstepEngine:
+    """
+    Drives several cache systems with one pass over a trace. Every record is read, parsed and decoded once and then
+    handed to each hierarchy in turn, each keeping its own CacheMetrics, so comparing K configurations costs one trace
+    pass instead of K
+    """
+
+    def __init__(self, hierarchies: dict):
+        """
+        Initializer for the lockstep engine
+        :param hierarchies: dict, configuration name to cache system, in the order results are reported
+        """
+        if not hierarchies:
+            raise AttributeError("Field 'hierarchies' must name at least one cache system")
+        self.hierarchies = hierarchies
+        self._fetches = [hierarchy.perform_fetch for hierarchy in hierarchies.values()]
+        self._sets = [hierarchy.perform_set for hierarchy in hierarchies.values()]
+
+    def perform_fetch(self, address, for_data=True, count=1):
+        """
+        Perform a fetch on every hierarchy
+        :param address: The address to fetch
+        :param for_data: Whether the fetch is for data or an instruction
+        :param count: The number of back to back identical fetches
+        :return: None
+        """
+        for perform in self._fetches:
+            perform(address, for_data=for_data, count=count)
+
+    def perform_set(self, address, for_data=True, count=1):
+        """
+        Perform a set on every hierarchy
+        :param address: The address to set
+        :param for_data: Whether the set is for data or an instruction
+        :param count: The number of back to back identical sets
+        :return: None
+        """
+        for perform in self._sets:
+            perform(address, for_data=for_data, count=count)
+
+    def perform_batch(self, records):
+        """
+        Perform a batch of accesses on every hierarchy, each decoding the batch's addresses for its own geometry
+        :param records: list of (address, is_data, is_fetch)
+        :return: None
+        """
+        for hierarchy in self.hierarchies.values():
+            hierarchy.perform_batch(records)
+
+    def run(self, records):
+        """
+        Run accesses through every hierarchy
+        :param records: iterable of (address, is_data, is_fetch)
+        :return: int, the number of records performed
+        """
+        performed = 0
+        fetches = self._fetches
+        sets = self._sets
+        for address, is_data, is_fetch in records:
+            for perform in (fetches if is_fetch else sets):
+                perform(address, for_data=is_data)
+            performed += 1
+        return performed
+
+    def summaries(self):
+        """
+        Collect the summary of every hierarchy
+        :return: dict, configuration name to the summary as returned by CacheMetrics.summary
+        """
+        return {name: hierarchy.stats.summary() for name, hierarchy in self.hierarchies.items()}
+
+    def save_summaries(self, filename):
+        """
+        Save the summaries side by side as CSV, one row per summary field and one column per configuration
+        :param filename: The file to write
+        :return: None
+        """
+        summaries = self.summaries()
+        names = list(summaries)
+        lines = [",".join(["field"] + names) + "\n"]
+        for field in summaries[names[0]]:
+            lines.append(",".join([field] + [str(summaries[name][field]) for name in names]) + "\n")
+        with open(filename, 'w') as out:
+            out.writelines(lines)
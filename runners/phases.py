@@ -0,0 +1,245 @@
+import math
+import multiprocessing
+import random
+import time
+from runners.replay import run_window
+from runners.time_sliced import summary_error
+from traces.binary_trace import is_binary_trace
+from traces.trace_index import TraceIndex
+from traces.trace_reader import is_compressed_trace, read_trace
+
+# The number of buckets block addresses are hashed into for an interval's signature
+SIGNATURE_SIZE = 64
+
+# Fibonacci hashing spreads neighbouring blocks over the signature buckets
+_HASH = 0x9E3779B97F4A7C15
+
+
+def interval_signatures(filename, interval, block_size, size=SIGNATURE_SIZE, regions=None):
+    """
+    Cut a trace into intervals of a fixed number of records and describe each by the share of its accesses that went
+    to every bucket of blocks, blocks being hashed into size buckets, or to every region of a region map. Two intervals
+    touching the same data in the same proportions get the same signature, in the spirit of SimPoint's basic block
+    vectors, whatever the order of their accesses
+    :param filename: The trace file
+    :param interval: The number of records per interval, the last interval may be shorter
+    :param block_size: The size in bytes of a block, addresses within a block are one
+    :param size: The number of hash buckets, ignored with regions
+    :param regions: The metrics.regions.RegionMap to describe intervals by, None to hash blocks
+    :return: tuple (signatures, bounds), a list of float lists, one per interval, each summing to 1, and the list of
+    the intervals' (start, end) record ranges
+    """
+    if interval < 1:
+        raise AttributeError("Field 'interval' must be a positive number of records")
+    offset_bits = int(math.log(block_size, 2))
+    if regions is not None:
+        size = len(regions)
+    signatures = []
+    bounds = []
+    counts = [0] * size
+    start = 0
+    at = 0
+    for address, _, _ in read_trace(filename, block_size=block_size):
+        if regions is not None:
+            counts[regions.lookup(address)] += 1
+        else:
+            counts[((address >> offset_bits) * _HASH >> 32) % size] += 1
+        at += 1
+        if at - start == interval:
+            signatures.append([count / interval for count in counts])
+            bounds.append((start, at))
+            counts = [0] * size
+            start = at
+    if at > start:
+        signatures.append([count / (at - start) for count in counts])
+        bounds.append((start, at))
+    return signatures, bounds
+
+
+def _distance(vector, centroid):
+    return sum((value - center) * (value - center) for value, center in zip(vector, centroid))
+
+
+def _nearest(vector, centroids):
+    best = 0
+    best_distance = _distance(vector, centroids[0])
+    for cluster in range(1, len(centroids)):
+        distance = _distance(vector, centroids[cluster])
+        if distance < best_distance:
+            best = cluster
+            best_distance = distance
+    return best, best_distance
+
+
+def kmeans(vectors, clusters, iterations=100, seed=0):
+    """
+    Group vectors into clusters with k-means: centroids seeded by k-means++, then Lloyd's iterations until no vector
+    changes cluster. A cluster left empty is reseeded with the vector furthest from its centroid
+    :param vectors: list of equal length float lists
+    :param clusters: The number of clusters, at most the number of distinct vectors are used
+    :param iterations: The maximum number of Lloyd's iterations
+    :param seed: The seed of the random number generator picking the initial centroids
+    :return: tuple (labels, centroids), the cluster of every vector and the centroid of every cluster
+    """
+    if clusters < 1:
+        raise AttributeError("Field 'clusters' must be at least 1")
+    if not vectors:
+        return [], []
+    generator = random.Random(seed)
+    clusters = min(clusters, len({tuple(vector) for vector in vectors}))
+    centroids = [list(generator.choice(vectors))]
+    nearest = [_distance(vector, centroids[0]) for vector in vectors]
+    while len(centroids) < clusters:
+        # k-means++: the next centroid is drawn with probability proportional to the squared distance to the nearest
+        total = sum(nearest)
+        pick = generator.random() * total
+        for index, distance in enumerate(nearest):
+            pick -= distance
+            if pick <= 0 and distance > 0:
+                break
+        centroids.append(list(vectors[index]))
+        nearest = [min(old, _distance(vector, centroids[-1])) for old, vector in zip(nearest, vectors)]
+
+    labels = [None] * len(vectors)
+    for _ in range(iterations):
+        changed = False
+        distances = []
+        for index, vector in enumerate(vectors):
+            cluster, distance = _nearest(vector, centroids)
+            distances.append(distance)
+            if labels[index] != cluster:
+                labels[index] = cluster
+                changed = True
+        if not changed:
+            break
+        sums = [[0.0] * len(vectors[0]) for _ in centroids]
+        members = [0] * len(centroids)
+        for vector, cluster in zip(vectors, labels):
+            members[cluster] += 1
+            for dimension, value in enumerate(vector):
+                sums[cluster][dimension] += value
+        for cluster in range(len(centroids)):
+            if members[cluster]:
+                centroids[cluster] = [value / members[cluster] for value in sums[cluster]]
+            else:
+                furthest = max(range(len(vectors)), key=distances.__getitem__)
+                centroids[cluster] = list(vectors[furthest])
+                distances[furthest] = 0.0
+    return labels, centroids
+
+
+def pick_phases(filename, interval, clusters, block_size, regions=None, seed=0):
+    """
+    Pick the representative intervals of a trace: the intervals are clustered by their signatures, see
+    interval_signatures, and each cluster is represented by its interval closest to the centroid, weighted by the
+    records of all the intervals in the cluster
+    :param filename: The trace file
+    :param interval: The number of records per interval
+    :param clusters: The number of clusters, the most representative intervals simulated
+    :param block_size: The size in bytes of a block
+    :param regions: The metrics.regions.RegionMap to describe intervals by, None to hash blocks
+    :param seed: The seed of the clustering
+    :return: list of (start, end, records) in trace order, the record range of each representative interval and the
+    number of records it stands for
+    """
+    signatures, bounds = interval_signatures(filename, interval, block_size, regions=regions)
+    labels, centroids = kmeans(signatures, clusters, seed=seed)
+    phases = []
+    for cluster, centroid in enumerate(centroids):
+        members = [index for index, label in enumerate(labels) if label == cluster]
+        if not members:
+            continue
+        representative = min(members, key=lambda index: _distance(signatures[index], centroid))
+        records = sum(bounds[index][1] - bounds[index][0] for index in members)
+        phases.append((bounds[representative][0], bounds[representative][1], records))
+    return sorted(phases)
+
+
+def _run_phase(factory, filename, start, end, warmup, index):
+    """
+    Worker process body. Simulates one representative interval on a fresh hierarchy after warming it on the records
+    before the interval
+    :param factory: Picklable callable returning a fresh cache system
+    :param filename: The trace file
+    :param start: The first record of the interval
+    :param end: The record past the last of the interval
+    :param warmup: The number of records before start used to warm the caches
+    :param index: The TraceIndex of an uncompressed text trace, or None
+    :return: CacheMetrics, the stats of the interval
+    """
+    hierarchy = factory()
+    run_window(hierarchy, filename, start, end, warmup=warmup, index=index)
+    return hierarchy.stats
+
+
+def simulate_phases(factory, filename, phases, warmup=0, processes=None, index=None):
+    """
+    Simulate only the representative intervals of a trace, in parallel, each on its own fresh hierarchy warmed on the
+    records before it, and aggregate their metrics weighted by the records each stands for. The result estimates a
+    full run; see validate_phases to measure how closely
+    :param factory: Picklable callable returning a fresh cache system with its stats options set, see
+    runners.time_sliced.simulate_time_sliced
+    :param filename: The trace file
+    :param phases: The representative intervals as returned by pick_phases
+    :param warmup: The number of records each interval warms on
+    :param processes: The number of worker processes, the number of CPUs when None
+    :param index: The TraceIndex of an uncompressed text trace, loaded or built on demand when None
+    :return: CacheMetrics, the weighted aggregate stats
+    """
+    if index is None and not is_binary_trace(filename) and not is_compressed_trace(filename):
+        index = TraceIndex.for_trace(filename)
+    if not phases:
+        return factory().stats
+    work = [(factory, filename, start, end, warmup, index) for start, end, _ in phases]
+    with multiprocessing.Pool(processes=min(processes or multiprocessing.cpu_count(), len(work))) as pool:
+        results = pool.starmap(_run_phase, work)
+    for stats, (start, end, records) in zip(results, phases):
+        stats.scale(records / (end - start))
+    merged = results[0]
+    for stats in results[1:]:
+        merged.merge(stats)
+    return merged
+
+
+def validate_phases(factory, filename, interval, clusters, block_size, warmup=0, processes=None, regions=None, seed=0):
+    """
+    Run a trace both in full and on its representative intervals only, to measure the accuracy and the speedup of
+    phase sampling, meant for a validation trace representative of the traces to be sampled
+    :param factory: Picklable callable returning a fresh cache system, see simulate_phases
+    :param filename: The validation trace file
+    :param interval: The number of records per interval
+    :param clusters: The number of clusters
+    :param block_size: The size in bytes of a block
+    :param warmup: The number of records each interval warms on
+    :param processes: The number of worker processes, the number of CPUs when None
+    :param regions: The metrics.regions.RegionMap to describe intervals by, None to hash blocks
+    :param seed: The seed of the clustering
+    :return: dict with 'full' and 'sampled' summaries, 'errors' per summary field, 'max-error', 'phases', the
+    representative intervals, and the wall clock 'full-time', 'sampled-time' (clustering included) and 'speedup'
+    """
+    index = None
+    if not is_binary_trace(filename) and not is_compressed_trace(filename):
+        index = TraceIndex.for_trace(filename)
+
+    began = time.perf_counter()
+    hierarchy = factory()
+    run_window(hierarchy, filename, 0, index=index)
+    full_time = time.perf_counter() - began
+    full = hierarchy.stats.summary()
+
+    began = time.perf_counter()
+    phases = pick_phases(filename, interval, clusters, block_size, regions=regions, seed=seed)
+    sampled = simulate_phases(factory, filename, phases, warmup=warmup, processes=processes, index=index).summary()
+    sampled_time = time.perf_counter() - began
+
+    errors = summary_error(full, sampled)
+    return {
+        "full": full,
+        "sampled": sampled,
+        "errors": errors,
+        "max-error": max(errors.values()) if errors else 0.0,
+        "phases": phases,
+        "full-time": full_time,
+        "sampled-time": sampled_time,
+        "speedup": full_time / sampled_time if sampled_time > 0 else float('inf'),
+    }
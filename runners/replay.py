@@ -0,0 +1,59 @@
+from traces.trace_index import read_window
+
+
+def replay(hierarchy, records):
+    """
+    Run accesses through a hierarchy
+    :param hierarchy: The cache system
+    :param records: iterable of (address, is_data, is_fetch)
+    :return: int, the number of accesses performed
+    """
+    performed = 0
+    perform_fetch = hierarchy.perform_fetch
+    perform_set = hierarchy.perform_set
+    for address, is_data, is_fetch in records:
+        if is_fetch:
+            perform_fetch(address, for_data=is_data)
+        else:
+            perform_set(address, for_data=is_data)
+        performed += 1
+    return performed
+
+
+def warm(hierarchy, records):
+    """
+    Run accesses through a hierarchy to fill its caches without counting them in its statistics. The accesses are
+    booked in a throwaway blank CacheMetrics that is dropped afterwards, and the caches' per set counters are
+    suspended meanwhile
+    :param hierarchy: The cache system
+    :param records: iterable of (address, is_data, is_fetch)
+    :return: int, the number of accesses performed
+    """
+    stats = hierarchy.stats
+    hierarchy.stats = stats.blank()
+    hierarchy.stats.track_addresses(False)
+    levels = (hierarchy.IL1, hierarchy.DL1, hierarchy.UL2, hierarchy.UL3)
+    counters = [level.suspend_sets() for level in levels]
+    try:
+        return replay(hierarchy, records)
+    finally:
+        hierarchy.stats = stats
+        for level, saved in zip(levels, counters):
+            level.resume_sets(saved)
+
+
+def run_window(hierarchy, filename, start, end=None, warmup=0, index=None):
+    """
+    Simulate the records [start, end) of a trace, after warming the caches on the warmup records before start
+    :param hierarchy: The cache system
+    :param filename: The trace file
+    :param start: The index of the first measured record
+    :param end: The index past the last measured record, None for the end of the trace
+    :param warmup: The number of records before start used to warm the caches
+    :param index: The traces.trace_index.TraceIndex of a text trace, loaded or built on demand when None
+    :return: tuple (warmed, performed), the number of warmup and measured accesses
+    """
+    warm_start = max(start - warmup, 0)
+    warmed = warm(hierarchy, read_window(filename, warm_start, start, index=index)) if warm_start < start else 0
+    performed = replay(hierarchy, read_window(filename, start, end, index=index))
+    return warmed, performed
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+# Bumped whenever the simulation or the summary changes in a way that makes stored results stale
+RESULT_CACHE_VERSION = 1
+
+
+def trace_digest(filename, chunk_size=1 << 20):
+    """
+    Hash the contents of a trace file
+    :param filename: The trace file
+    :param chunk_size: The number of bytes hashed at once
+    :return: str, the hex sha256 digest
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fp:
+        chunk = fp.read(chunk_size)
+        while chunk:
+            digest.update(chunk)
+            chunk = fp.read(chunk_size)
+    return digest.hexdigest()
+
+
+def hierarchy_config(hierarchy):
+    """
+    Describe everything about a three level hierarchy that determines its results
+    :param hierarchy: The cache system, one of the hierarchies classes
+    :return: dict, the hierarchy class, address space, replacement policy and its options, block size, the size,
+    associativity and latencies of every level, and 'recency' when L1 hits reach the levels below approximately
+    """
+    levels = [hierarchy.IL1, hierarchy.DL1, hierarchy.UL2, hierarchy.UL3, hierarchy.MEM]
+    config = {
+        "hierarchy": "{}.{}".format(type(hierarchy).__module__, type(hierarchy).__qualname__),
+        "space": hierarchy.DL1.get_address_space(),
+        "policy": hierarchy.DL1.get_policy().name(),
+        "policy_options": hierarchy.DL1.get_policy().options(),
+        "blocksize": hierarchy.DL1.get_block_size(),
+        "levels": [[level.name, level.get_size(), level.get_associativity(), level.read_latency, level.write_latency] for level in levels],
+    }
+    # Exact deferred touches give the same results as none
+    if hierarchy.recency_mode() == 'approximate':
+        config["recency"] = 'approximate'
+    return config
+
+
+class ResultCache:
+    """
+    An on disk store of run summaries keyed by trace contents and hierarchy configuration, so a (trace, config) pair
+    is only ever simulated once. Backed by SQLite, which serializes writers across processes on the same host, and
+    kept under max_bytes by evicting the least recently used results
+    """
+
+    def __init__(self, path, max_bytes=64 << 20):
+        """
+        Initializer for the result cache
+        :param path: The database file, created if missing
+        :param max_bytes: The maximum total size of the stored summaries
+        """
+        self._path = path
+        self._max_bytes = max_bytes
+        with closing(self._connect()) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, summary TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, stamp TEXT NOT NULL, digest TEXT NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self._path, timeout=60, isolation_level=None)
+
+    def digest(self, filename):
+        """
+        Hash a trace, reusing the stored digest while the file's size and modification time are unchanged
+        :param filename: The trace file
+        :return: str, the hex sha256 digest
+        """
+        path = os.path.realpath(filename)
+        status = os.stat(path)
+        stamp = "{}:{}".format(status.st_size, status.st_mtime_ns)
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT digest FROM digests WHERE path = ? AND stamp = ?", (path, stamp)).fetchone()
+        if row is not None:
+            return row[0]
+        digest = trace_digest(path)
+        with closing(self._connect()) as db:
+            db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?)", (path, stamp, digest))
+        return digest
+
+    def key(self, filename, hierarchy, extra=None):
+        """
+        Build the key of a (trace, hierarchy) pair
+        :param filename: The trace file
+        :param hierarchy: The cache system the trace runs on
+        :param extra: Anything else that changes the results, must serialize to JSON
+        :return: str, the key
+        """
+        config = {"version": RESULT_CACHE_VERSION, "trace": self.digest(filename), "config": hierarchy_config(hierarchy), "extra": extra}
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a stored summary, marking it as recently used
+        :param key: The key from ResultCache.key
+        :return: dict, the summary as returned by CacheMetrics.summary, or None if not stored
+        """
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT summary FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, summary):
+        """
+        Store a summary, evicting the least recently used results while the store is over its size bound
+        :param key: The key from ResultCache.key
+        :param summary: The summary as returned by CacheMetrics.summary
+        :return: None
+        """
+        encoded = json.dumps(summary, sort_keys=True)
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, encoded, len(encoded), time.time()))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > self._max_bytes:
+                oldest, size = db.execute("SELECT key, size FROM results ORDER BY last_used LIMIT 1").fetchone()
+                db.execute("DELETE FROM results WHERE key = ?", (oldest,))
+                total -= size
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
@@ -0,0 +1,138 @@
+import multiprocessing
+import time
+from runners.replay import run_window
+from traces.binary_trace import is_binary_trace, count_records
+from traces.trace_index import TraceIndex
+from traces.trace_reader import is_compressed_trace, read_trace
+
+
+def count_trace_records(filename, index=None):
+    """
+    Count the well formed records of a trace
+    :param filename: The trace file
+    :param index: The TraceIndex of an uncompressed text trace, loaded or built on demand when None
+    :return: int, the number of records
+    """
+    if is_binary_trace(filename):
+        return count_records(filename)
+    if is_compressed_trace(filename):
+        return sum(1 for _ in read_trace(filename))
+    if index is None:
+        index = TraceIndex.for_trace(filename)
+    return index.records
+
+
+def slice_bounds(records, slices):
+    """
+    Split a trace into contiguous time slices of near equal length
+    :param records: The number of records in the trace
+    :param slices: The number of slices
+    :return: list of (start, end) record ranges covering [0, records)
+    """
+    if slices < 1:
+        raise AttributeError("Field 'slices' must be at least 1")
+    bounds = []
+    for i in range(slices):
+        start = records * i // slices
+        end = records * (i + 1) // slices
+        if end > start:
+            bounds.append((start, end))
+    return bounds
+
+
+def _run_slice(factory, filename, start, end, warmup, index):
+    """
+    Worker process body. Simulates one slice on a fresh hierarchy after warming it on the records before the slice
+    :param factory: Picklable callable returning a fresh cache system
+    :param filename: The trace file
+    :param start: The first record of the slice
+    :param end: The record past the last of the slice
+    :param warmup: The number of records before start used to warm the caches
+    :param index: The TraceIndex of an uncompressed text trace, or None
+    :return: CacheMetrics, the stats of the slice
+    """
+    hierarchy = factory()
+    run_window(hierarchy, filename, start, end, warmup=warmup, index=index)
+    return hierarchy.stats
+
+
+def simulate_time_sliced(factory, filename, slices, warmup=0, processes=None, index=None):
+    """
+    Simulate a trace as contiguous time slices in parallel, each on its own fresh hierarchy in its own process, and
+    merge the slices' metrics in trace order. Each slice first warms its caches on the warmup records before it with
+    its statistics off, which bounds the cold start error at every slice boundary. The result approximates a serial
+    run; see validate_time_sliced to measure how closely
+    :param factory: Picklable callable returning a fresh cache system with its stats options set, e.g. a module level
+    function or a functools.partial of one
+    :param filename: The trace file
+    :param slices: The number of time slices
+    :param warmup: The number of records each slice warms on
+    :param processes: The number of worker processes, the number of CPUs when None
+    :param index: The TraceIndex of an uncompressed text trace, loaded or built on demand when None
+    :return: CacheMetrics, the merged stats
+    """
+    if index is None and not is_binary_trace(filename) and not is_compressed_trace(filename):
+        index = TraceIndex.for_trace(filename)
+    bounds = slice_bounds(count_trace_records(filename, index=index), slices)
+    if not bounds:
+        return factory().stats
+    work = [(factory, filename, start, end, warmup, index) for start, end in bounds]
+    with multiprocessing.Pool(processes=min(processes or multiprocessing.cpu_count(), len(work))) as pool:
+        results = pool.starmap(_run_slice, work)
+    merged = results[0]
+    for stats in results[1:]:
+        merged.merge(stats)
+    return merged
+
+
+def summary_error(reference, estimate):
+    """
+    Compare two run summaries field by field
+    :param reference: The summary of the exact run, as returned by CacheMetrics.summary
+    :param estimate: The summary of the approximate run
+    :return: dict, field to relative error |estimate - reference| / reference, or the absolute error where the
+    reference is zero
+    """
+    errors = dict()
+    for name, value in reference.items():
+        difference = abs(estimate[name] - value)
+        errors[name] = difference / abs(value) if value else difference
+    return errors
+
+
+def validate_time_sliced(factory, filename, slices, warmup=0, processes=None):
+    """
+    Run a trace both serially and time sliced to measure the accuracy and the speedup of slicing, meant for a
+    validation trace representative of the traces to be sliced
+    :param factory: Picklable callable returning a fresh cache system, see simulate_time_sliced
+    :param filename: The validation trace file
+    :param slices: The number of time slices
+    :param warmup: The number of records each slice warms on
+    :param processes: The number of worker processes, the number of CPUs when None
+    :return: dict with 'serial' and 'sliced' summaries, 'errors' per summary field, 'max-error', and the wall clock
+    'serial-time', 'sliced-time' and 'speedup'
+    """
+    index = None
+    if not is_binary_trace(filename) and not is_compressed_trace(filename):
+        index = TraceIndex.for_trace(filename)
+
+    began = time.perf_counter()
+    hierarchy = factory()
+    run_window(hierarchy, filename, 0, index=index)
+    serial_time = time.perf_counter() - began
+    serial = hierarchy.stats.summary()
+
+    began = time.perf_counter()
+    sliced = simulate_time_sliced(factory, filename, slices, warmup=warmup, processes=processes, index=index).summary()
+    sliced_time = time.perf_counter() - began
+
+    errors = summary_error(serial, sliced)
+    return {
+        "serial": serial,
+        "sliced": sliced,
+        "errors": errors,
+        "max-error": max(errors.values()) if errors else 0.0,
+        "serial-time": serial_time,
+        "sliced-time": sliced_time,
+        "speedup": serial_time / sliced_time if sliced_time > 0 else float('inf'),
+    }
@@ -0,0 +1,121 @@
+import mmap
+import os
+import struct
+import sys
+
+# Binary traces start with this magic, followed by fixed size records
+BINARY_MAGIC = b'PCSTRC01'
+# One access: the address split into (high, low) 64 bit halves so 128 bit address spaces still fit, followed by the
+# is_data and is_fetch flags
+RECORD = struct.Struct('<QQBB')
+
+_LOW_MASK = 0xffffffffffffffff
+
+
+def is_binary_trace(filename):
+    """
+    Check for the binary trace magic
+    :param filename: The trace file
+    :return: bool, whether the file is a binary trace
+    """
+    with open(filename, 'rb') as fp:
+        return fp.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def count_records(filename):
+    """
+    Count the records in a binary trace from its size
+    :param filename: The binary trace file
+    :return: int, the number of records
+    """
+    return (os.path.getsize(filename) - len(BINARY_MAGIC)) // RECORD.size
+
+
+def write_binary_trace(filename, records, chunk_size=65536):
+    """
+    Write accesses as a binary trace
+    :param filename: The file to write
+    :param records: iterable of (address, is_data, is_fetch)
+    :param chunk_size: The number of records packed before each write
+    :return: int, the number of records written
+    """
+    written = 0
+    with open(filename, 'wb') as out:
+        out.write(BINARY_MAGIC)
+        chunk = bytearray()
+        for address, is_data, is_fetch in records:
+            chunk += RECORD.pack(address >> 64, address & _LOW_MASK, is_data, is_fetch)
+            written += 1
+            if written % chunk_size == 0:
+                out.write(chunk)
+                chunk = bytearray()
+        out.write(chunk)
+    return written
+
+
+class BinaryTraceReader:
+    """
+    Reads a binary trace, whose fixed size records allow seeking straight to any record
+    """
+
+    def __init__(self, filename, start=0, chunk_size=65536):
+        """
+        Initializer for the binary trace reader
+        :param filename: The binary trace file
+        :param start: The index of the first record to read
+        :param chunk_size: The number of records read from disk at once
+        """
+        self._filename = filename
+        self._start = start
+        self._chunk_size = chunk_size
+        self.lines = 0
+
+    def __iter__(self):
+        """
+        Iterate over the accesses in the trace from the start record on. The number of records consumed so far,
+        counted from the start of the file, is kept in self.lines
+        :return: generator of (address, is_data, is_fetch)
+        """
+        self.lines = self._start
+        with open(self._filename, 'rb') as fp:
+            if fp.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError("'{}' is not a binary trace".format(self._filename))
+            fp.seek(len(BINARY_MAGIC) + self._start * RECORD.size)
+            chunk = fp.read(self._chunk_size * RECORD.size)
+            while chunk:
+                for high, low, is_data, is_fetch in RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % RECORD.size]):
+                    self.lines += 1
+                    yield (high << 64 | low) if high else low, is_data == 1, is_fetch == 1
+                chunk = fp.read(self._chunk_size * RECORD.size)
+
+
+def read_mapped(filename):
+    """
+    Iterate over the accesses in a binary trace through a read only memory map of the file, so processes reading the
+    same trace share its pages in the page cache instead of each copying it through read buffers
+    :param filename: The binary trace file
+    :return: generator of (address, is_data, is_fetch)
+    """
+    with open(filename, 'rb') as fp:
+        if fp.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError("'{}' is not a binary trace".format(filename))
+        if count_records(filename) == 0:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            records = memoryview(mapped)[len(BINARY_MAGIC):len(BINARY_MAGIC) + count_records(filename) * RECORD.size]
+            unpacked = RECORD.iter_unpack(records)
+            try:
+                for high, low, is_data, is_fetch in unpacked:
+                    yield (high << 64 | low) if high else low, is_data == 1, is_fetch == 1
+            finally:
+                # The map cannot close while views of it are alive
+                del unpacked
+                records.release()
+
+
+if __name__ == '__main__':
+    # Convert a text trace: python -m traces.binary_trace <text trace> <binary trace>
+    from traces.trace_reader import TextTraceReader
+    if len(sys.argv) != 3:
+        raise ValueError("Usage: python -m traces.binary_trace <text trace> <binary trace>")
+    print("Wrote {} records".format(write_binary_trace(sys.argv[2], TextTraceReader(sys.argv[1]))))
@@ -0,0 +1,246 @@
+import re
+from traces.trace_reader import open_trace
+
+# The number of characters of a text trace decoded at once
+CHUNK_SIZE = 1 << 20
+
+# Lines of the 'D|I R|W 0xADDR' format read by traces.trace_reader.parse_line
+_NATIVE_LINE = re.compile(r'^[DI] [RW] 0x[0-9a-fA-F]+\s*$')
+
+
+class TraceFormat:
+    """
+    Defines a text trace format. A format finds the accesses of a whole chunk of lines in one regex or split pass and
+    then converts their fields one access at a time into accesses with a size, which FormatTraceReader splits at block
+    boundaries. Decoding chunks into array columns instead is no faster, with or without numpy: the int() conversions
+    and the record tuples the hierarchies consume cost the same either way. Formats are found by name in FORMATS and
+    told apart by sniff()
+    """
+    name = None
+
+    @staticmethod
+    def sniff(line):
+        """
+        Whether a line looks like a line of this format
+        :param line: A non empty line from the start of the trace
+        :return: bool
+        """
+        raise NotImplementedError
+
+    def parse_chunk(self, text):
+        """
+        Decode a chunk of whole lines, skipping the lines that are not accesses
+        :param text: The lines, each ending in a newline
+        :return: list of (address, size, is_data, is_fetch)
+        """
+        raise NotImplementedError
+
+
+class LackeyFormat(TraceFormat):
+    """
+    Valgrind lackey --trace-mem=yes output: 'I  ADDR,SIZE' instruction fetches and ' L|S|M ADDR,SIZE' data loads,
+    stores and modifies, with hex addresses. A modify is a load followed by a store
+    """
+    name = 'lackey'
+    _ACCESS = re.compile(r'^(I|[ \t][LSM])[ \t]+([0-9a-fA-F]+),(\d+)[ \t]*$', re.MULTILINE)
+
+    @staticmethod
+    def sniff(line):
+        return LackeyFormat._ACCESS.match(line) is not None
+
+    def parse_chunk(self, text):
+        accesses = []
+        for kind, address, size in self._ACCESS.findall(text):
+            address = int(address, 16)
+            size = int(size)
+            kind = kind[-1]
+            if kind == 'I':
+                accesses.append((address, size, False, True))
+            elif kind == 'L':
+                accesses.append((address, size, True, True))
+            elif kind == 'S':
+                accesses.append((address, size, True, False))
+            else:
+                accesses.append((address, size, True, True))
+                accesses.append((address, size, True, False))
+        return accesses
+
+
+class DineroFormat(TraceFormat):
+    """
+    Dinero III/IV .din traces: 'LABEL ADDR [SIZE]' with hex addresses, label 0 a data read, 1 a data write and 2 an
+    instruction fetch. Labels 3 (escape) and 4 (flush) are skipped
+    """
+    name = 'dinero'
+    _ACCESS = re.compile(r'^[ \t]*([0-4])[ \t]+(?:0x)?([0-9a-fA-F]+)(?:[ \t]+(\d+))?[ \t]*$', re.MULTILINE)
+
+    @staticmethod
+    def sniff(line):
+        return DineroFormat._ACCESS.match(line) is not None
+
+    def parse_chunk(self, text):
+        accesses = []
+        for label, address, size in self._ACCESS.findall(text):
+            if label == '0':
+                accesses.append((int(address, 16), int(size) if size else 1, True, True))
+            elif label == '1':
+                accesses.append((int(address, 16), int(size) if size else 1, True, False))
+            elif label == '2':
+                accesses.append((int(address, 16), int(size) if size else 1, False, True))
+        return accesses
+
+
+class CsvFormat(TraceFormat):
+    """
+    Comma separated traces with a header row naming the columns: 'address' (0x prefixed hex or decimal) and optionally
+    'op' (R/W, L/S or read/write, reads by default), 'type' (I/D, data by default) and 'size' (1 by default)
+    """
+    name = 'csv'
+    _WRITES = {'W', 'S', 'WRITE', 'STORE'}
+
+    def __init__(self):
+        self._columns = None
+
+    @staticmethod
+    def sniff(line):
+        return 'address' in [column.strip().lower() for column in line.split(',')]
+
+    def parse_chunk(self, text):
+        lines = text.splitlines()
+        if self._columns is None and lines:
+            header = [column.strip().lower() for column in lines.pop(0).split(',')]
+            if 'address' not in header:
+                raise ValueError("CSV trace has no 'address' column")
+            self._columns = tuple(header.index(name) if name in header else None for name in ('address', 'op', 'type', 'size'))
+        address_column, op_column, type_column, size_column = self._columns
+        writes = self._WRITES
+        accesses = []
+        for line in lines:
+            fields = line.split(',')
+            if len(fields) <= address_column or not fields[address_column].strip():
+                continue
+            accesses.append((
+                int(fields[address_column], 0),
+                int(fields[size_column]) if size_column is not None else 1,
+                fields[type_column].strip().upper() != 'I' if type_column is not None else True,
+                fields[op_column].strip().upper() not in writes if op_column is not None else True,
+            ))
+        return accesses
+
+
+FORMATS = {trace_format.name: trace_format for trace_format in (LackeyFormat, DineroFormat, CsvFormat)}
+
+
+def detect_format(filename, lines=100):
+    """
+    Tell the format of a text trace from its first lines
+    :param filename: The trace file, optionally compressed
+    :param lines: The number of lines looked at
+    :return: str, 'native' for the 'D|I R|W 0xADDR' format or the name of one of FORMATS
+    """
+    with open_trace(filename, read_ahead=False) as fp:
+        for _, line in zip(range(lines), fp):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            if _NATIVE_LINE.match(line):
+                return 'native'
+            for name, trace_format in FORMATS.items():
+                if trace_format.sniff(line):
+                    return name
+    return 'native'
+
+
+def split_access(address, size, block_size):
+    """
+    Split an access into one access per block it touches
+    :param address: The first byte accessed
+    :param size: The number of bytes accessed
+    :param block_size: The size in bytes of a block
+    :return: list of addresses, the access's own and the base address of every further block touched
+    """
+    last = (address + max(size, 1) - 1) & ~(block_size - 1)
+    addresses = [address]
+    block = (address & ~(block_size - 1)) + block_size
+    while block <= last:
+        addresses.append(block)
+        block += block_size
+    return addresses
+
+
+class FormatTraceReader:
+    """
+    Reads a text trace in one of FORMATS a chunk at a time, yielding accesses as (address, is_data, is_fetch) like the
+    other readers. Accesses crossing a block boundary are split into one access per block touched
+    """
+
+    def __init__(self, filename, trace_format, block_size=None):
+        """
+        Initializer for the format trace reader
+        :param filename: The trace file, optionally compressed
+        :param trace_format: The name of the format, one of FORMATS
+        :param block_size: The size in bytes of a block, None to never split accesses
+        """
+        if trace_format not in FORMATS:
+            raise AttributeError("Field 'trace_format' must be one of {}".format(", ".join(FORMATS)))
+        self._filename = filename
+        self._format = trace_format
+        self._block_size = block_size
+        self.lines = 0
+
+    def chunks(self):
+        """
+        Decode the trace a chunk at a time. The number of raw lines consumed so far is kept in self.lines
+        :return: generator of lists of (address, is_data, is_fetch)
+        """
+        trace_format = FORMATS[self._format]()
+        block_size = self._block_size
+        pending = ''
+        with open_trace(self._filename) as fp:
+            while True:
+                text = fp.read(CHUNK_SIZE)
+                if not text:
+                    break
+                text = pending + text
+                end = text.rfind('\n') + 1
+                pending = text[end:]
+                text = text[:end]
+                if not text:
+                    continue
+                self.lines += text.count('\n')
+                yield self._records(trace_format.parse_chunk(text), block_size)
+        if pending:
+            self.lines += 1
+            yield self._records(trace_format.parse_chunk(pending + '\n'), block_size)
+
+    @staticmethod
+    def _records(accesses, block_size):
+        if block_size is None:
+            return [(address, is_data, is_fetch) for address, _, is_data, is_fetch in accesses]
+        records = []
+        mask = block_size - 1
+        for address, size, is_data, is_fetch in accesses:
+            if (address & mask) + size <= block_size:
+                records.append((address, is_data, is_fetch))
+            else:
+                for split in split_access(address, size, block_size):
+                    records.append((split, is_data, is_fetch))
+        return records
+
+    def batches(self, batch_size=4096):
+        """
+        Decode the trace into batches of at most batch_size accesses, for perform_batch
+        :param batch_size: The maximum number of accesses per batch
+        :return: generator of lists of (address, is_data, is_fetch)
+        """
+        for records in self.chunks():
+            for start in range(0, len(records), batch_size):
+                yield records[start:start + batch_size]
+
+    def __iter__(self):
+        """
+        Iterate over the accesses in the trace
+        :return: generator of (address, is_data, is_fetch)
+        """
+        for records in self.chunks():
+            yield from records
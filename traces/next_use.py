@@ -0,0 +1,67 @@
+import math
+import mmap
+import os
+from array import array
+from traces.trace_reader import read_trace
+
+# The next use of an access whose block is never accessed again
+NEVER = 0xffffffffffffffff
+
+_ITEM = array('Q').itemsize
+
+
+def build_next_use(filename, block_size, path=None, split_size=None):
+    """
+    Compute, for every access of a trace, the position of the next access to the same block, in one streaming pass
+    that patches the previous access of each block as the next one is seen. Memory grows with the number of distinct
+    blocks plus one 64 bit entry per access; pass a path to keep the entries in a memory mapped file instead of RAM
+    :param filename: The trace file
+    :param block_size: The size in bytes of a block, accesses to the same block share next uses
+    :param path: A file to store the positions in, memory mapped. None keeps them in memory
+    :param split_size: The block size accesses crossing a block boundary are split at, see traces.formats, which must
+    match the simulation's for the positions to line up. block_size when None
+    :return: sequence of int indexed by access position, NEVER where the block is not accessed again. An array, or a
+    memoryview over the mapped file when path is given
+    """
+    offset_bits = int(math.log(block_size, 2))
+    if path is None:
+        next_use = array('Q')
+        last_seen = dict()
+        for position, (address, _, _) in enumerate(read_trace(filename, block_size=split_size or block_size)):
+            block = address >> offset_bits
+            previous = last_seen.get(block)
+            if previous is not None:
+                next_use[previous] = position
+            last_seen[block] = position
+            next_use.append(NEVER)
+        return next_use
+
+    records = sum(1 for _ in read_trace(filename, block_size=split_size or block_size))
+    with open(path, 'wb') as out:
+        # Every entry starts out as NEVER, all bits set
+        remaining = max(records, 1) * _ITEM
+        while remaining > 0:
+            out.write(b'\xff' * min(remaining, 1 << 20))
+            remaining -= 1 << 20
+    next_use = load_next_use(path, writable=True)
+    last_seen = dict()
+    for position, (address, _, _) in enumerate(read_trace(filename, block_size=split_size or block_size)):
+        block = address >> offset_bits
+        previous = last_seen.get(block)
+        if previous is not None:
+            next_use[previous] = position
+        last_seen[block] = position
+    next_use.obj.flush()
+    return next_use[:records]
+
+
+def load_next_use(path, writable=False):
+    """
+    Memory map next use positions stored by build_next_use
+    :param path: The file the positions were stored in
+    :param writable: Whether the mapping may be written to
+    :return: memoryview of int indexed by access position
+    """
+    with open(path, 'r+b' if writable else 'rb') as fp:
+        mapped = mmap.mmap(fp.fileno(), os.path.getsize(path), access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    return memoryview(mapped).cast('Q')
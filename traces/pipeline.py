@@ -0,0 +1,139 @@
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+from traces.trace_reader import parse_line, open_trace
+from traces.binary_trace import RECORD
+
+# Every slot in the ring starts with (record count, trace lines consumed, error message length). A count of zero marks
+# the end of the trace and a count of -1 marks a parse error whose message follows the header
+SLOT_HEADER = struct.Struct('<qqq')
+
+_LOW_MASK = 0xffffffffffffffff
+
+
+def _produce(filename, shm_name, slots, batch_size, free, filled):
+    """
+    Producer process body. Parses the trace and packs the records, one batch per slot, into the shared ring buffer
+    :param filename: The trace file to parse
+    :param shm_name: The name of the shared memory segment holding the ring
+    :param slots: The number of slots in the ring
+    :param batch_size: The maximum number of records per slot
+    :param free: Semaphore counting the slots the producer may fill
+    :param filled: Semaphore counting the slots the consumer may drain
+    :return: None
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = shm.buf
+    slot_size = SLOT_HEADER.size + batch_size * RECORD.size
+    slot = 0
+    count = 0
+    lines = 0
+    line = ''
+    try:
+        with open_trace(filename) as fp:
+            free.acquire()
+            offset = slot * slot_size + SLOT_HEADER.size
+            for line in fp:
+                lines += 1
+                r = parse_line(line)
+                if r is None:
+                    continue
+                RECORD.pack_into(buffer, offset, r[0] >> 64, r[0] & _LOW_MASK, r[1], r[2])
+                offset += RECORD.size
+                count += 1
+                if count == batch_size:
+                    SLOT_HEADER.pack_into(buffer, slot * slot_size, count, lines, 0)
+                    filled.release()
+                    slot = (slot + 1) % slots
+                    count = 0
+                    free.acquire()
+                    offset = slot * slot_size + SLOT_HEADER.size
+        if count > 0:
+            SLOT_HEADER.pack_into(buffer, slot * slot_size, count, lines, 0)
+            filled.release()
+            slot = (slot + 1) % slots
+            free.acquire()
+        SLOT_HEADER.pack_into(buffer, slot * slot_size, 0, lines, 0)
+        filled.release()
+    except Exception as ex:
+        if count > 0:
+            # Hand over what was parsed before the failure so it is simulated like in the serial loop
+            SLOT_HEADER.pack_into(buffer, slot * slot_size, count, lines - 1, 0)
+            filled.release()
+            slot = (slot + 1) % slots
+            free.acquire()
+        message = "{}: {}: {}".format(lines, line.strip(), str(ex)).encode('utf-8')[:batch_size * RECORD.size]
+        SLOT_HEADER.pack_into(buffer, slot * slot_size, -1, lines, len(message))
+        buffer[slot * slot_size + SLOT_HEADER.size:slot * slot_size + SLOT_HEADER.size + len(message)] = message
+        filled.release()
+    finally:
+        shm.close()
+
+
+class SharedMemoryTracePipeline:
+    """
+    Overlaps trace parsing with simulation. A producer process decodes the text trace into packed records inside a
+    shared memory ring buffer while the simulating process consumes them in batches
+    """
+
+    def __init__(self, filename, batch_size=4096, slots=8):
+        """
+        Initializer for the pipeline. The producer is started when the pipeline is entered as a context manager
+        :param filename: The trace file to parse
+        :param batch_size: The number of records handed over per slot
+        :param slots: The number of slots in the ring, which bounds how far the producer may run ahead
+        """
+        if batch_size < 1 or slots < 2:
+            raise AttributeError("The pipeline needs a batch_size of at least 1 and at least 2 slots")
+        self._filename = filename
+        self._batch_size = batch_size
+        self._slots = slots
+        self._slot_size = SLOT_HEADER.size + batch_size * RECORD.size
+        self._shm = None
+        self._producer = None
+        self.lines = 0
+
+    def __enter__(self):
+        self._shm = shared_memory.SharedMemory(create=True, size=self._slots * self._slot_size)
+        self._free = multiprocessing.Semaphore(self._slots)
+        self._filled = multiprocessing.Semaphore(0)
+        self._producer = multiprocessing.Process(
+            target=_produce,
+            args=(self._filename, self._shm.name, self._slots, self._batch_size, self._free, self._filled),
+            daemon=True
+        )
+        self._producer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._producer.is_alive():
+            self._producer.terminate()
+        self._producer.join()
+        self._shm.close()
+        self._shm.unlink()
+        return False
+
+    def batches(self):
+        """
+        Consume the ring buffer. The number of raw trace lines consumed by the producer so far is kept in self.lines
+        :return: generator of lists of (address, is_data, is_fetch)
+        """
+        buffer = self._shm.buf
+        slot = 0
+        while True:
+            self._filled.acquire()
+            start = slot * self._slot_size
+            count, lines, message_length = SLOT_HEADER.unpack_from(buffer, start)
+            start += SLOT_HEADER.size
+            self.lines = lines
+            if count == 0:
+                return
+            if count < 0:
+                raise ValueError(bytes(buffer[start:start + message_length]).decode('utf-8'))
+            batch = [
+                ((high << 64 | low) if high else low, is_data == 1, is_fetch == 1)
+                for high, low, is_data, is_fetch in RECORD.iter_unpack(buffer[start:start + count * RECORD.size])
+            ]
+            self._free.release()
+            slot = (slot + 1) % self._slots
+            yield batch
@@ -0,0 +1,152 @@
+import os
+import struct
+from array import array
+from traces.binary_trace import is_binary_trace, count_records, BinaryTraceReader
+from traces.trace_reader import parse_line, open_trace, is_compressed_trace
+
+INDEX_MAGIC = b'PCSIDX01'
+# (records between offsets, total records, trace size, trace modification time) of the trace the index was built for
+INDEX_HEADER = struct.Struct('<QQQQ')
+
+
+class TraceIndex:
+    """
+    A sidecar index of a text trace holding the byte offset of every K-th record, so reading can start at any record
+    after skipping fewer than K lines. Stored next to the trace as '<trace>.idx' and rebuilt when the trace changes
+    """
+
+    def __init__(self, every, records, offsets):
+        """
+        Initializer for the trace index, see TraceIndex.build and TraceIndex.load
+        :param every: The number of records between two indexed offsets
+        :param records: The total number of records in the trace
+        :param offsets: array of byte offsets, the i-th is the start of record i * every
+        """
+        self.every = every
+        self.records = records
+        self.offsets = offsets
+
+    @staticmethod
+    def sidecar(filename):
+        """
+        Returns where the index of a trace is stored
+        :param filename: The trace file
+        :return: str, the index file
+        """
+        return filename + '.idx'
+
+    @staticmethod
+    def _stamp(filename):
+        status = os.stat(filename)
+        return status.st_size, status.st_mtime_ns
+
+    @classmethod
+    def build(cls, filename, every=1 << 20):
+        """
+        Build the index of a text trace in one streaming pass and store it next to the trace
+        :param filename: The uncompressed text trace
+        :param every: The number of records between two indexed offsets
+        :return: TraceIndex
+        """
+        offsets = array('Q')
+        records = 0
+        offset = 0
+        with open(filename, 'rb') as fp:
+            for line in fp:
+                if parse_line(line.decode('utf-8', 'replace')) is not None:
+                    if records % every == 0:
+                        offsets.append(offset)
+                    records += 1
+                offset += len(line)
+        index = cls(every, records, offsets)
+        size, modified = cls._stamp(filename)
+        with open(cls.sidecar(filename), 'wb') as out:
+            out.write(INDEX_MAGIC)
+            out.write(INDEX_HEADER.pack(every, records, size, modified))
+            offsets.tofile(out)
+        return index
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the stored index of a trace
+        :param filename: The trace file, not the index
+        :return: TraceIndex, or None if there is no index or the trace changed since it was built
+        """
+        sidecar = cls.sidecar(filename)
+        if not os.path.exists(sidecar):
+            return None
+        with open(sidecar, 'rb') as fp:
+            if fp.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                return None
+            every, records, size, modified = INDEX_HEADER.unpack(fp.read(INDEX_HEADER.size))
+            if (size, modified) != cls._stamp(filename):
+                return None
+            offsets = array('Q')
+            offsets.frombytes(fp.read())
+        return cls(every, records, offsets)
+
+    @classmethod
+    def for_trace(cls, filename, every=1 << 20):
+        """
+        Load the index of a trace, building it first if it is missing or stale
+        :param filename: The uncompressed text trace
+        :param every: The number of records between two indexed offsets when building
+        :return: TraceIndex
+        """
+        index = cls.load(filename)
+        if index is None:
+            index = cls.build(filename, every=every)
+        return index
+
+
+def read_window(filename, start, end=None, index=None):
+    """
+    Read the records [start, end) of a trace. Binary traces seek straight to start; uncompressed text traces seek to
+    the nearest indexed record before start and skip from there; compressed text traces are skipped through from the
+    beginning, since their decompressed offsets cannot be seeked to
+    :param filename: The trace file
+    :param start: The index of the first record
+    :param end: The index past the last record, None for the end of the trace
+    :param index: The TraceIndex of a text trace, loaded or built on demand when None
+    :return: generator of (address, is_data, is_fetch)
+    """
+    if end is not None and end <= start:
+        return
+    at = start
+    if is_binary_trace(filename):
+        if start >= count_records(filename):
+            return
+        for record in BinaryTraceReader(filename, start=start):
+            yield record
+            at += 1
+            if at == end:
+                return
+        return
+
+    if is_compressed_trace(filename):
+        skip = start
+        fp = open_trace(filename)
+        lines = fp
+    else:
+        if index is None:
+            index = TraceIndex.for_trace(filename)
+        if start >= index.records:
+            return
+        skip = start % index.every
+        fp = open(filename, 'rb')
+        fp.seek(index.offsets[start // index.every])
+        lines = (line.decode('utf-8', 'replace') for line in fp)
+
+    with fp:
+        for line in lines:
+            record = parse_line(line)
+            if record is None:
+                continue
+            if skip > 0:
+                skip -= 1
+                continue
+            yield record
+            at += 1
+            if at == end:
+                return
@@ -0,0 +1,209 @@
+import io
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+from traces.binary_trace import is_binary_trace, count_records, BinaryTraceReader
+
+# Leading bytes of the compressed containers a trace may be stored in, and how to open each as a binary stream
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', gzip.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+    (b'BZh', bz2.open),
+]
+
+
+class ReadAheadStream(io.RawIOBase):
+    """
+    Wraps a binary stream and reads it from a background thread into a bounded queue of chunks. The decompressors
+    release the GIL while inflating, so the next chunks are decompressed while the simulator works on the current one
+    """
+
+    def __init__(self, stream, chunk_size=1 << 20, depth=8):
+        """
+        Initializer for the read ahead stream
+        :param stream: The binary stream to read from, it is closed once exhausted
+        :param chunk_size: The number of bytes read per chunk
+        :param depth: The number of chunks that may be buffered ahead of the reader
+        """
+        super().__init__()
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(maxsize=depth)
+        self._pending = memoryview(b'')
+        self._done = False
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._read_ahead, daemon=True)
+        self._worker.start()
+
+    def _read_ahead(self):
+        try:
+            with self._stream:
+                while not self._stopped.is_set():
+                    chunk = self._stream.read(self._chunk_size)
+                    self._put(chunk)
+                    if not chunk:
+                        return
+        except Exception as ex:
+            self._put(ex)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            if self._done:
+                return 0
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                self._done = True
+                raise chunk
+            if not chunk:
+                self._done = True
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        self._stopped.set()
+        super().close()
+
+
+def is_compressed_trace(filename):
+    """
+    Check a trace for the magic bytes of a supported compression format
+    :param filename: The trace file
+    :return: bool, whether the trace is gzip, xz or bzip2 compressed
+    """
+    with open(filename, 'rb') as fp:
+        magic = fp.read(6)
+    return any(magic.startswith(prefix) for prefix, _ in COMPRESSION_MAGIC)
+
+
+def open_trace(filename, read_ahead=True):
+    """
+    Open a trace for reading as text. Traces compressed with gzip, xz or bzip2 are detected by their magic bytes and
+    decompressed while streaming, so they never have to be inflated on disk first
+    :param filename: The trace file
+    :param read_ahead: Whether compressed traces are decompressed ahead of the reader in a background thread
+    :return: a text file object
+    """
+    with open(filename, 'rb') as fp:
+        magic = fp.read(6)
+    for prefix, opener in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            stream = opener(filename, 'rb')
+            if read_ahead:
+                stream = io.BufferedReader(ReadAheadStream(stream))
+            return io.TextIOWrapper(stream)
+    return open(filename, 'r')
+
+
+def parse_line(line):
+    """
+    Parse a single trace line of the form 'D|I R|W 0xADDR'
+    :param line: The raw line read from the trace file
+    :return: tuple (address, is_data, is_fetch), or None if the line is malformed
+    """
+    r = line.strip().replace('\x00', '').split(' ')
+    if len(r) != 3 or (r[0] != "D" and r[0] != "I") or (r[1] != "R" and r[1] != "W") or len(r[2]) < 5 or 'x' in r[2][2:] or r[2][0] == 'x' or 'I' in r[2] or 'D' in r[2] or 'R' in r[2] or 'W' in r[2]:  # Prevent strange malformed output from c++
+        return None
+    address_type, operation, hex_address = r
+    return int(hex_address, 16), address_type == "D", operation == "R"
+
+
+def count_lines(filename):
+    """
+    Count the number of lines in a trace file, used for progress reporting. For binary traces this is the number of
+    records
+    :param filename: The trace file
+    :return: int, the number of lines
+    """
+    if is_binary_trace(filename):
+        return count_records(filename)
+    lines = 0
+    with open_trace(filename, read_ahead=False) as fp:
+        for _ in fp:
+            lines += 1
+    return lines
+
+
+class TextTraceReader:
+    """
+    Reads a text trace one line at a time, yielding decoded accesses
+    """
+
+    def __init__(self, filename):
+        """
+        Initializer for the text trace reader
+        :param filename: The trace file to read
+        """
+        self._filename = filename
+        self.lines = 0
+
+    def __iter__(self):
+        """
+        Iterate over the well formed accesses in the trace. The number of raw lines consumed so far is kept in
+        self.lines so callers can report progress and errors
+        :return: generator of (address, is_data, is_fetch)
+        """
+        with open_trace(self._filename) as fp:
+            for line in fp:
+                self.lines += 1
+                try:
+                    record = parse_line(line)
+                except ValueError as ex:
+                    raise ValueError("{}: {}: {}".format(self.lines, line.strip(), str(ex)))
+                if record is not None:
+                    yield record
+
+
+def read_trace(filename, block_size=None):
+    """
+    Open a trace for iteration in whichever format it is stored. Text traces in another tool's format, see
+    traces.formats, are told apart by their first lines
+    :param filename: The trace file, text (optionally compressed) or binary
+    :param block_size: The size in bytes of a block, accesses of the other tools' formats that cross a block boundary
+    are split into one access per block. None to never split
+    :return: TextTraceReader, traces.binary_trace.BinaryTraceReader or traces.formats.FormatTraceReader
+    """
+    if is_binary_trace(filename):
+        return BinaryTraceReader(filename)
+    # The formats build on this module
+    from traces.formats import FormatTraceReader, detect_format
+    trace_format = detect_format(filename)
+    if trace_format != 'native':
+        return FormatTraceReader(filename, trace_format, block_size=block_size)
+    return TextTraceReader(filename)
+
+
+def coalesce(records):
+    """
+    Merge runs of back to back identical accesses into one record with a repeat count
+    :param records: iterable of (address, is_data, is_fetch)
+    :return: generator of (address, is_data, is_fetch, count)
+    """
+    previous = None
+    count = 0
+    for record in records:
+        if record == previous:
+            count += 1
+        else:
+            if previous is not None:
+                yield previous[0], previous[1], previous[2], count
+            previous = record
+            count = 1
+    if previous is not None:
+        yield previous[0], previous[1], previous[2], count